@@ -2,12 +2,22 @@ import numpy as np
 import cv2
 import random
 import math
-import mysql.connector
-from mysql.connector import Error
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import time
+from profiler import from_environment
+from rng import WORLD_STREAM, RandomStreams
+from storage import StorageError, Table, open_storage
 
-@dataclass
+NPC_TABLE = Table('npc', (
+    ('Identificador', 'INT'),
+    ('x', 'FLOAT(255,10) NOT NULL'),
+    ('y', 'FLOAT(255,10) NOT NULL'),
+    ('nombre', 'VARCHAR(255) NOT NULL'),
+    ('direccion', 'FLOAT(10,10) NOT NULL'),
+    ('velocidad', 'FLOAT(10,10) NOT NULL'),
+), mysql_options='ENGINE=MEMORY DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci')
+
+@dataclass(slots=True)
 class NPC:
     id: int
     x: float
@@ -16,6 +26,7 @@ class NPC:
     direction: float  # in radians (0 to 2π)
     speed: float
     color: tuple = (0, 0, 0)  # BGR color
+    rng: object = field(default=random, repr=False, compare=False)  # random.Random-like, see rng.Stream
     
     def move(self, world_width, world_height):
         # Calculate new position based on direction and speed
@@ -31,121 +42,135 @@ class NPC:
             self.y = np.clip(self.y, 0, world_height)
         
         # Random direction changes (10% chance)
-        if random.random() < 0.1:
-            self.direction += random.uniform(-0.5, 0.5)
+        if self.rng.random() < 0.1:
+            self.direction += self.rng.uniform(-0.5, 0.5)
             self.direction %= 2 * math.pi
 
 class NPCSimulator:
-    def __init__(self, width=800, height=600):
+    def __init__(self, width=800, height=600, flush_interval=1.0, batch_size=1000, storage=None, seed=None, profiler=None):
         self.width = width
         self.height = height
         self.npcs = []
         self.world_img = np.ones((height, width, 3), dtype=np.uint8) * 255
+        self._background = None  # cached static layer, see background()
         self.next_id = 1
-        self.db_connection = None
-        self.setup_database()
+        # Every NPC draws from its own stream, so the same seed gives the same world
+        self.streams = RandomStreams(seed)
+        self.rng = self.streams.stream(WORLD_STREAM)
+        self.profiler = profiler or from_environment()  # phase timings, see profiler.py
+        self.storage = None
+        self.flush_interval = flush_interval  # seconds between database flushes
+        self.batch_size = batch_size  # rows per executemany call
+        self.last_flush_time = 0
+        self.saved_rows = {}  # id -> row as last written to the database
+        self.deleted_ids = set()
+        self.setup_database(storage)
     
-    def setup_database(self):
-        """Initialize database connection and table"""
+    def setup_database(self, storage=None):
+        """Open the storage backend ('mysql', 'sqlite[:path]' or 'memory') and clear it"""
         try:
-            self.db_connection = mysql.connector.connect(
-                host='localhost',
-                database='sandybrown',
-                user='sandybrown',
-                password='sandybrown'
-            )
+            self.storage = open_storage(NPC_TABLE, storage, batch_size=self.batch_size)
             
-            if self.db_connection.is_connected():
-                cursor = self.db_connection.cursor()
-                
-                # Create table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS npc (
-                        Identificador INT PRIMARY KEY,
-                        x FLOAT(255,10) NOT NULL,
-                        y FLOAT(255,10) NOT NULL,
-                        nombre VARCHAR(255) NOT NULL,
-                        direccion FLOAT(10,10) NOT NULL,
-                        velocidad FLOAT(10,10) NOT NULL
-                    ) ENGINE=MEMORY DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-                """)
-                
-                # Clear existing NPCs
-                cursor.execute("DELETE FROM npc")
-                self.db_connection.commit()
-                
-        except Error as e:
-            print(f"Error connecting to MySQL: {e}")
-            self.db_connection = None
+            # Clear existing NPCs
+            self.storage.clear()
+        except StorageError as e:
+            print(f"Error opening storage: {e}")
+            self.storage = None
+    
+    @staticmethod
+    def npc_row(npc):
+        """Database row for an NPC"""
+        return (
+            npc.id,
+            float(npc.x),
+            float(npc.y),
+            npc.name,
+            float(npc.direction),
+            float(npc.speed)
+        )
+    
+    def dirty_rows(self):
+        """Rows for NPCs that changed since they were last written"""
+        rows = []
+        for npc in self.npcs:
+            row = self.npc_row(npc)
+            if self.saved_rows.get(npc.id) != row:
+                rows.append(row)
+        return rows
     
-    def save_to_database(self):
-        """Save all NPCs to the database"""
-        if not self.db_connection or not self.db_connection.is_connected():
+    def save_to_database(self, force=False):
+        """Flush changed and deleted NPCs to the database in bulk.
+        
+        Runs at most once every `flush_interval` seconds unless `force` is
+        set, and returns the number of rows written.
+        """
+        now = time.time()
+        if not force and now - self.last_flush_time < self.flush_interval:
+            return 0
+        self.last_flush_time = now
+        
+        if not self.storage:
             print("Database not connected")
-            return
+            return 0
+        
+        rows = self.dirty_rows()
+        deleted = list(self.deleted_ids)
+        if not rows and not deleted:
+            return 0
         
         try:
-            cursor = self.db_connection.cursor()
-            
-            for npc in self.npcs:
-                cursor.execute("""
-                    INSERT INTO npc (Identificador, x, y, nombre, direccion, velocidad)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                    x = VALUES(x), 
-                    y = VALUES(y), 
-                    direccion = VALUES(direccion), 
-                    velocidad = VALUES(velocidad)
-                """, (
-                    npc.id,
-                    npc.x,
-                    npc.y,
-                    npc.name,
-                    npc.direction,
-                    npc.speed
-                ))
-            
-            self.db_connection.commit()
-        except Error as e:
+            # Upserts and deletes go out in batch_size chunks in a single transaction
+            written = self.storage.write(rows, deleted)
+        except StorageError as e:
             print(f"Error saving to database: {e}")
+            return 0
+        
+        for row in rows:
+            self.saved_rows[row[0]] = row
+        for npc_id in deleted:
+            self.saved_rows.pop(npc_id, None)
+        self.deleted_ids.clear()
+        return written
     
     def load_from_database(self):
         """Load NPCs from the database"""
-        if not self.db_connection or not self.db_connection.is_connected():
+        if not self.storage:
             print("Database not connected")
             return
         
         try:
-            cursor = self.db_connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM npc")
-            records = cursor.fetchall()
-            
             self.npcs = []
-            for record in records:
-                npc = NPC(
-                    id=record['Identificador'],
-                    x=record['x'],
-                    y=record['y'],
-                    name=record['nombre'],
-                    direction=record['direccion'],
-                    speed=record['velocidad'],
-                    color=(random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-                )
-                self.npcs.append(npc)
-                if npc.id >= self.next_id:
-                    self.next_id = npc.id + 1
+            # Streamed in chunks so a large table is never held twice in memory
+            for records in self.storage.load_chunks():
+                for npc_id, x, y, name, direction, speed in records:
+                    rng = self.streams.stream(npc_id)
+                    npc = NPC(
+                        id=npc_id,
+                        x=x,
+                        y=y,
+                        name=name,
+                        direction=direction,
+                        speed=speed,
+                        color=(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)),
+                        rng=rng
+                    )
+                    self.npcs.append(npc)
+                    self.saved_rows[npc.id] = self.npc_row(npc)
+                    if npc.id >= self.next_id:
+                        self.next_id = npc.id + 1
             
             print(f"Loaded {len(self.npcs)} NPCs from database")
-        except Error as e:
+        except StorageError as e:
             print(f"Error loading from database: {e}")
     
     def create_npc(self, name, x=None, y=None, direction=None, speed=None):
         """Create a new NPC with random or specified parameters"""
-        x = x if x is not None else random.uniform(0, self.width)
-        y = y if y is not None else random.uniform(0, self.height)
-        direction = direction if direction is not None else random.uniform(0, 2 * math.pi)
-        speed = speed if speed is not None else random.uniform(0.5, 3.0)
-        color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+        rng = self.streams.stream(self.next_id)
+        x = x if x is not None else rng.uniform(0, self.width)
+        y = y if y is not None else rng.uniform(0, self.height)
+        direction = direction if direction is not None else rng.uniform(0, 2 * math.pi)
+        speed = speed if speed is not None else rng.uniform(0.5, 3.0)
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
         
         npc = NPC(
             id=self.next_id,
@@ -154,14 +179,13 @@ class NPCSimulator:
             name=name,
             direction=direction,
             speed=speed,
-            color=color
+            color=color,
+            rng=rng
         )
         self.npcs.append(npc)
         self.next_id += 1
         
-        # Save immediately to database
-        self.save_to_database()
-        
+        # Written to the database on the next flush
         return npc
     
     def create_npc_set(self, count=10):
@@ -169,26 +193,38 @@ class NPCSimulator:
         names = ["Warrior", "Mage", "Rogue", "Merchant", "Guard", 
                 "Peasant", "King", "Queen", "Blacksmith", "Bard"]
         for i in range(count):
-            name = f"{random.choice(names)}_{i}"
+            name = f"{self.rng.choice(names)}_{i}"
             self.create_npc(name)
     
     def update(self):
-        """Update all NPC positions and save to database"""
+        """Update all NPC positions and flush changes to the database"""
         for npc in self.npcs:
             npc.move(self.width, self.height)
         
-        # Save to database every frame
-        self.save_to_database()
+        # Flushes only once every flush_interval seconds
+        with self.profiler.phase('db'):
+            self.save_to_database()
+    
+    def background(self):
+        """Static layer (background and grid), rebuilt only when world_img is resized"""
+        if self._background is None or self._background.shape != self.world_img.shape:
+            img = self.world_img.copy()
+            for x in range(0, self.width, 50):
+                cv2.line(img, (x, 0), (x, self.height), (220, 220, 220), 1)
+            for y in range(0, self.height, 50):
+                cv2.line(img, (0, y), (self.width, y), (220, 220, 220), 1)
+            cv2.putText(img, "Press 'q' to quit, 'a' to add NPC, 'd' to delete last NPC", 
+                       (10, self.height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+            self._background = img
+        return self._background
+    
+    def invalidate_background(self):
+        """Force the static layer to be redrawn on the next frame"""
+        self._background = None
     
     def draw(self):
         """Draw the world with all NPCs"""
-        img = self.world_img.copy()
-        
-        # Draw grid
-        for x in range(0, self.width, 50):
-            cv2.line(img, (x, 0), (x, self.height), (220, 220, 220), 1)
-        for y in range(0, self.height, 50):
-            cv2.line(img, (0, y), (self.width, y), (220, 220, 220), 1)
+        img = self.background().copy()
         
         # Draw NPCs
         for npc in self.npcs:
@@ -212,8 +248,6 @@ class NPCSimulator:
         # Display stats
         cv2.putText(img, f"NPCs: {len(self.npcs)}", (10, 20), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
-        cv2.putText(img, "Press 'q' to quit, 'a' to add NPC, 'd' to delete last NPC", 
-                   (10, self.height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
         
         return img
     
@@ -229,11 +263,16 @@ class NPCSimulator:
         if not self.npcs:
             self.create_npc_set(5)
         
+        profiler = self.profiler
         while True:
-            img = self.draw()
-            cv2.imshow('NPC Simulation with MySQL', img)
+            with profiler.phase('draw'):
+                img = self.draw()
+            profiler.draw_overlay(img)
+            with profiler.phase('imshow'):
+                cv2.imshow('NPC Simulation with MySQL', img)
             
-            key = cv2.waitKey(30)
+            with profiler.phase('input'):
+                key = cv2.waitKey(30)
             if key == ord('q'):  # Quit
                 break
             elif key == ord('a'):  # Add NPC
@@ -241,16 +280,18 @@ class NPCSimulator:
             elif key == ord('d') and self.npcs:  # Delete last NPC
                 removed = self.npcs.pop()
                 print(f"Removed NPC: {removed.name}")
-                # Delete from database
-                if self.db_connection and self.db_connection.is_connected():
-                    cursor = self.db_connection.cursor()
-                    cursor.execute("DELETE FROM npc WHERE Identificador = %s", (removed.id,))
-                    self.db_connection.commit()
+                # Deleted from the database on the next flush
+                self.deleted_ids.add(removed.id)
             
-            self.update()
+            with profiler.phase('update'):
+                self.update()
+            profiler.frame()
+        
+        profiler.close()
         
-        if self.db_connection and self.db_connection.is_connected():
-            self.db_connection.close()
+        if self.storage:
+            self.save_to_database(force=True)
+            self.storage.close()
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -2,18 +2,60 @@ import cv2
 import numpy as np
 import random
 import math
-import mysql.connector
-from mysql.connector import Error
 from enum import Enum
 import time
+from spatial import SpatialGrid, nearest_within, separation_many
+from render import SpriteBatch
+from storage import ChangeTracker, PersistenceWorker, StorageError, Table, open_storage
+from checkpoint import Checkpoint, save_checkpoint
+from journal import DELETE, KEYFRAME, SPAWN, STATE, Journal
+from names import CODE_DTYPE, NUMBER_DTYPE, NameTable
+from profiler import NULL_PROFILER, from_environment
+from rng import WORLD_STREAM, RandomStreams
+from statemachine import StateMachine
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'database': 'sandybrown',
-    'user': 'sandybrown',
-    'password': 'sandybrown'
-}
+# Database table (the backend is chosen by open_storage)
+NPC_TABLE = Table('npc', (
+    ('Identificador', 'INT'),
+    ('x', 'FLOAT(255,10) NOT NULL'),
+    ('y', 'FLOAT(255,10) NOT NULL'),
+    ('nombre', 'VARCHAR(255) NOT NULL'),
+    ('direccion', 'FLOAT(10,10) NOT NULL'),
+    ('velocidad', 'FLOAT(10,10) NOT NULL'),
+    ('state', 'INT NOT NULL'),
+), mysql_options='ENGINE=MEMORY DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci')
+
+# One checkpoint record per NPC (target_x/target_y are NaN when unset)
+CHECKPOINT_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('direction', '<f8'),
+    ('speed', '<f8'),
+    ('color', 'u1', (3,)),
+    ('state', 'i1'),
+    ('state_timer', '<i4'),
+    ('target_x', '<f8'),
+    ('target_y', '<f8'),
+    ('rng_counter', '<u8'),  # position in the NPC's random stream
+])
+
+# Journal keyframes only pin down what changes every tick
+KEYFRAME_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('direction', '<f8'),
+])
+
+# Fixed simulation timestep (seconds) and catch-up limit per rendered frame
+SIM_DT = 1 / 60
+MAX_TICKS_PER_FRAME = 5
+
+# Distance at which NPCs notice each other
+SOCIAL_RADIUS = 100
+# NPCs closer than this (twice their size) push each other apart
+SEPARATION = 40
 
 # NPC Behavior States
 class NPCState(Enum):
@@ -22,7 +64,16 @@ class NPCState(Enum):
     SOCIALIZING = 3
     RESTING = 4
 
+# State codes of a NPCPopulation: indices into STATES
+STATES = list(NPCState)
+STATE_VALUES = np.array([state.value for state in STATES])
+STATE_CODES = np.zeros(STATE_VALUES.max() + 1, dtype=np.uint8)
+STATE_CODES[STATE_VALUES] = np.arange(len(STATES))
+WANDERING, WORKING, SOCIALIZING, RESTING = (STATES.index(state) for state in NPCState)
+
 class Character:
+    __slots__ = ('x', 'y', 'color', 'speed', 'size', 'direction', 'prev_x', 'prev_y')
+    
     def __init__(self, x, y, color, speed=5, size=20):
         self.x = x
         self.y = y
@@ -30,42 +81,92 @@ class Character:
         self.speed = speed
         self.size = size
         self.direction = 0  # Angle in radians
+        self.prev_x = x  # Position at the start of the last simulation tick
+        self.prev_y = y
     
     def move(self, dx, dy):
         self.x += dx * self.speed
         self.y += dy * self.speed
+    
+    def store_previous(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
+    
+    def interpolated(self, alpha):
+        """Position blended between the last two simulation ticks"""
+        return (self.prev_x + (self.x - self.prev_x) * alpha,
+                self.prev_y + (self.y - self.prev_y) * alpha)
 
 class NPC(Character):
-    def __init__(self, x, y, npc_id, name, color=None):
-        color = color or (random.randint(50, 200), random.randint(50, 200), random.randint(50, 200))
-        super().__init__(x, y, color, speed=random.uniform(1.0, 3.0))
+    __slots__ = ('rng', 'id', 'name', 'state', 'target_x', 'target_y', 'state_timer', 'peer')
+    
+    def __init__(self, x, y, npc_id, name, color=None, speed=None, direction=0, state=None, rng=None):
+        # Own random stream (rng.Stream); the global `random` for NPCs made outside a GameWorld
+        self.rng = rng if rng is not None else random
+        color = color or (self.rng.randint(50, 200), self.rng.randint(50, 200), self.rng.randint(50, 200))
+        super().__init__(x, y, color, speed=speed if speed is not None else self.rng.uniform(1.0, 3.0))
+        self.direction = direction
         self.id = npc_id
         self.name = name
         self.state = NPCState.WANDERING
         self.target_x = None
         self.target_y = None
         self.state_timer = 0
-        self.change_state()
+        self.peer = None  # closest NPC within SOCIAL_RADIUS, only while SOCIALIZING
+        self.change_state(state)
+    
+    @classmethod
+    def from_row(cls, row, rng=None):
+        """NPC from a database row; only the fields that are not stored get random values"""
+        npc_id, x, y, name, direction, speed, state = row
+        return cls(x, y, npc_id, name, speed=speed, direction=direction, state=NPCState(state), rng=rng)
     
-    def change_state(self):
-        self.state = random.choice(list(NPCState))
-        self.state_timer = random.randint(60, 180)  # 1-3 seconds at 60 FPS
+    def change_state(self, state=None):
+        self.state = state or self.rng.choice(list(NPCState))
+        self.state_timer = self.rng.randint(60, 180)  # 1-3 seconds at 60 FPS
         
         if self.state == NPCState.WORKING:
-            self.target_x = random.randint(100, 700)
-            self.target_y = random.randint(100, 500)
+            self.target_x = self.rng.randint(100, 700)
+            self.target_y = self.rng.randint(100, 500)
         else:
             self.target_x = None
             self.target_y = None
     
-    def update(self, npcs, world_width, world_height):
-        self.state_timer -= 1
+    def neighbours(self, npcs, radius, grid=None):
+        """Other NPCs within radius, using the spatial grid when available"""
+        if grid is not None:
+            return grid.query_radius(self.x, self.y, radius, exclude=self)
+        radius_sq = radius * radius
+        return [npc for npc in npcs if npc is not self and
+                (npc.x - self.x) ** 2 + (npc.y - self.y) ** 2 <= radius_sq]
+    
+    def nearest_peer(self, npcs, grid=None):
+        """Closest other NPC within SOCIAL_RADIUS, or None"""
+        if grid is not None:
+            found = grid.k_nearest(self.x, self.y, 1, exclude=self, max_radius=SOCIAL_RADIUS)
+            return found[0] if found else None
+        nearby = self.neighbours(npcs, SOCIAL_RADIUS)
+        return min(nearby, key=lambda npc: (npc.x - self.x) ** 2 + (npc.y - self.y) ** 2, default=None)
+    
+    def update(self, npcs, world_width, world_height, grid=None, profiler=NULL_PROFILER):
+        self.think(npcs, grid, profiler)
+        self.move(world_width, world_height)
+    
+    def think(self, npcs, grid=None, profiler=NULL_PROFILER, elapsed=1):
+        """Decisions: state timer and changes, peer search; `elapsed` ticks since the last call"""
+        self.state_timer -= elapsed
         if self.state_timer <= 0:
-            self.change_state()
+            with profiler.phase('state'):
+                self.change_state()
         
+        # Only SOCIALIZING NPCs look around; overlaps are resolved for everyone by GameWorld.separate
+        self.peer = self.nearest_peer(npcs, grid) if self.state == NPCState.SOCIALIZING else None
+    
+    def move(self, world_width, world_height):
+        """One tick of movement towards the last decision (see think)"""
         if self.state == NPCState.WANDERING:
-            if random.random() < 0.02:
-                self.direction = random.uniform(0, 2 * math.pi)
+            if self.rng.random() < 0.02:
+                self.direction = self.rng.uniform(0, 2 * math.pi)
             self.x += math.cos(self.direction) * self.speed
             self.y += math.sin(self.direction) * self.speed
         
@@ -78,195 +179,834 @@ class NPC(Character):
                 self.x += math.cos(self.direction) * self.speed
                 self.y += math.sin(self.direction) * self.speed
         
+        elif self.state == NPCState.SOCIALIZING and self.peer is not None:
+            # Walk up to the closest peer and stop next to them
+            peer = self.peer
+            dx = peer.x - self.x
+            dy = peer.y - self.y
+            if math.sqrt(dx*dx + dy*dy) > self.size * 2.5:
+                self.direction = math.atan2(dy, dx)
+                self.x += math.cos(self.direction) * self.speed
+                self.y += math.sin(self.direction) * self.speed
+        
         self.x = max(0, min(world_width, self.x))
         self.y = max(0, min(world_height, self.y))
 
+def _column(name):
+    """Property that reads/writes one row of a NPCPopulation column"""
+    def getter(self):
+        return getattr(self._population, name)[self.row]
+    def setter(self, value):
+        getattr(self._population, name)[self.row] = value
+    return property(getter, setter)
+
+def _target(name):
+    """Like _column, with None for NaN (no target)"""
+    def getter(self):
+        value = getattr(self._population, name)[self.row]
+        return None if math.isnan(value) else float(value)
+    def setter(self, value):
+        getattr(self._population, name)[self.row] = np.nan if value is None else value
+    return property(getter, setter)
+
+class NPCView:
+    """NPC-like handle on a row of a NPCPopulation, for code written against NPC objects"""
+    __slots__ = ('_population', 'row')
+    size = 20
+    rng = None  # batched draws are keyed by tick; there is no stream position to keep
+    
+    id = _column('ids')
+    x = _column('x')
+    y = _column('y')
+    prev_x = _column('prev_x')
+    prev_y = _column('prev_y')
+    direction = _column('direction')
+    speed = _column('speed')
+    state_timer = _column('state_timer')
+    target_x = _target('target_x')
+    target_y = _target('target_y')
+    
+    def __init__(self, population, row):
+        self._population = population
+        self.row = row
+    
+    @property
+    def name(self):
+        p = self._population
+        return p.name_table.decode(p.name_code[self.row], p.name_number[self.row])
+    
+    @property
+    def color(self):
+        return tuple(int(c) for c in self._population.color[self.row])
+    
+    @property
+    def state(self):
+        return STATES[self._population.state[self.row]]
+    
+    @state.setter
+    def state(self, value):
+        self._population.state[self.row] = STATES.index(value)
+    
+    def interpolated(self, alpha):
+        return Character.interpolated(self, alpha)
+    
+    def __repr__(self):
+        return f"NPCView(id={self.id}, name={self.name!r}, state={self.state.name}, x={self.x:.1f}, y={self.y:.1f})"
+
+class NPCPopulation:
+    """Structure-of-arrays storage for the NPCs of a VectorizedGameWorld.
+    
+    States are uint8 codes (indices into STATES) and names are interned
+    (see names.py); NPCView handles are only made when asked for.
+    """
+    COLUMNS = (
+        ('ids', np.int64, ()),
+        ('x', np.float64, ()),
+        ('y', np.float64, ()),
+        ('prev_x', np.float64, ()),  # position at the start of the last tick
+        ('prev_y', np.float64, ()),
+        ('direction', np.float64, ()),
+        ('speed', np.float64, ()),
+        ('color', np.uint8, (3,)),
+        ('state', np.uint8, ()),
+        ('state_timer', np.int32, ()),
+        ('target_x', np.float64, ()),  # NaN = no target
+        ('target_y', np.float64, ()),
+        ('name_code', CODE_DTYPE, ()),
+        ('name_number', NUMBER_DTYPE, ()),
+    )
+    
+    def __init__(self, capacity=1024):
+        self.size = 0
+        for name, dtype, shape in self.COLUMNS:
+            setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
+        self.name_table = NameTable()
+    
+    def __len__(self):
+        return self.size
+    
+    def __getitem__(self, row):
+        rows = range(self.size)[row]
+        if isinstance(row, slice):
+            return [NPCView(self, r) for r in rows]
+        return NPCView(self, rows)
+    
+    def __iter__(self):
+        return (NPCView(self, row) for row in range(self.size))
+    
+    def _reserve(self, count):
+        """Grow the arrays so that `count` rows fit"""
+        capacity = len(self.ids)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for name, _, _ in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+    
+    def add_many(self, names, **columns):
+        """Append NPCs given by column values (see COLUMNS).
+        
+        `names` is a sequence of str or a (codes, numbers) pair encoded with
+        `self.name_table`. prev_x/prev_y default to x/y, targets to none.
+        """
+        codes, numbers = names if isinstance(names, tuple) else self.name_table.encode(names)
+        start, end = self.size, self.size + len(codes)
+        self._reserve(end)
+        columns.setdefault('prev_x', columns['x'])
+        columns.setdefault('prev_y', columns['y'])
+        columns.setdefault('target_x', np.nan)
+        columns.setdefault('target_y', np.nan)
+        for name, value in columns.items():
+            getattr(self, name)[start:end] = value
+        self.name_code[start:end] = codes
+        self.name_number[start:end] = numbers
+        self.size = end
+    
+    def remove(self, row):
+        """Remove a row by moving the last row into its place"""
+        last = self.size - 1
+        if row != last:
+            for name, _, _ in self.COLUMNS:
+                array = getattr(self, name)
+                array[row] = array[last]
+        self.size = last
+    
+    def rows_of(self, ids):
+        """Rows of the NPCs with these ids, in the same order"""
+        ids_now = self.ids[:self.size]
+        order = np.argsort(ids_now)
+        return order[np.searchsorted(ids_now, ids, sorter=order)]
+
 class GameWorld:
-    def __init__(self, width=800, height=600):
+    def __init__(self, width=800, height=600, headless=False, sim_dt=SIM_DT, interpolate=True, batched=False,
+                 storage=None, seed=None, profiler=None, scheduler=None):
         self.width = width
         self.height = height
         self.world_img = np.ones((height, width, 3), dtype=np.uint8) * 30
+        self._background = None  # cached static layer, see background()
         self.player = Character(width//2, height//2, (0, 100, 255), 5, 15)
-        self.npcs = []
+        # Time-sliced decisions (scheduler.AIScheduler); None = every NPC thinks every tick
+        self.scheduler = scheduler
+        self.reset_npcs()
         self.next_npc_id = 1
-        self.db_connection = None
+        # Every NPC draws from its own stream, so the same seed gives the same world
+        self.streams = RandomStreams(seed)
+        self.rng = self.streams.stream(WORLD_STREAM)
+        self.profiler = profiler or from_environment()  # phase timings, see profiler.py
+        self.ticks = 0
+        self.journal = None  # see start_journal
+        self.storage = None
+        self.persistence = None  # background writer, see save_npcs_to_db
+        self.saved = ChangeTracker()  # rows as last handed to the writer
         self.mouse_pos = (0, 0)  # Initialize mouse position
+        self.player_input = (0, 0)  # (dx, dy) the player walks every tick, set from the keyboard in run()
+        self.sim_dt = sim_dt
+        self.interpolate = interpolate
+        self.accumulator = 0.0  # wall time not yet simulated, see advance()
+        # Batched NPC drawing; assumes every NPC has the default size of 20
+        self.sprites = None
+        if batched:
+            self.sprites = SpriteBatch(radius=20, line_length=30, label_color=(255, 255, 255),
+                                       label_offset=(-50, -30))
+        self.grid = SpatialGrid(cell_size=SEPARATION)  # peer searches rarely go past the next ring of cells
         
-        self.setup_database()
+        self.setup_database(storage)
         self.load_npcs_from_db()
+        if self.storage:
+            self.persistence = PersistenceWorker(self.storage)
         if not self.npcs:
             self.create_initial_npcs(5)
+        self.rebuild_grid()
         
-        # Set up mouse callback
-        cv2.namedWindow('NPC Simulation')
-        cv2.setMouseCallback('NPC Simulation', self.update_mouse_pos)
+        # Set up mouse callback (no window at all when running headless)
+        if not headless:
+            cv2.namedWindow('NPC Simulation')
+            cv2.setMouseCallback('NPC Simulation', self.update_mouse_pos)
         
     def update_mouse_pos(self, event, x, y, flags, param):
         """Update mouse position whenever it moves"""
         self.mouse_pos = (x, y)
-
-            
     
-    def setup_database(self):
+    def reset_npcs(self):
+        """Start over with no NPCs"""
+        self.npcs = []
+        if self.scheduler:
+            self.scheduler.reset()
+    
+    def rebuild_grid(self):
+        """Re-bucket every NPC in the neighbour grid"""
+        self.grid.rebuild(self.npcs)
+    
+    def setup_database(self, storage=None):
+        """Open the storage backend: 'mysql' (default), 'sqlite[:path]' or 'memory'"""
         try:
-            self.db_connection = mysql.connector.connect(**DB_CONFIG)
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS npc (
-                    Identificador INT PRIMARY KEY,
-                    x FLOAT(255,10) NOT NULL,
-                    y FLOAT(255,10) NOT NULL,
-                    nombre VARCHAR(255) NOT NULL,
-                    direccion FLOAT(10,10) NOT NULL,
-                    velocidad FLOAT(10,10) NOT NULL,
-                    state INT NOT NULL
-                ) ENGINE=MEMORY DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-            """)
-            self.db_connection.commit()
-        except Error as e:
+            self.storage = open_storage(NPC_TABLE, storage)
+        except StorageError as e:
             print(f"Database error: {e}")
     
     def load_npcs_from_db(self):
-        if not self.db_connection:
+        if not self.storage:
             return
         
         try:
-            cursor = self.db_connection.cursor(dictionary=True)  # This is correct inside a method
-            cursor.execute("SELECT * FROM npc")
-            for record in cursor.fetchall():
-                npc = NPC(record['x'], record['y'], record['Identificador'], record['nombre'])
-                npc.direction = record['direccion']
-                npc.speed = record['velocidad']
-                npc.state = NPCState(record['state'])
-                self.npcs.append(npc)
-                if record['Identificador'] >= self.next_npc_id:
-                    self.next_npc_id = record['Identificador'] + 1
-        except Error as e:
+            # Streamed in chunks so a large table is never held twice in memory
+            for rows in self.storage.load_chunks():
+                self.saved.mark_saved(rows)
+                self.npcs.extend(NPC.from_row(row, self.streams.stream(row[0])) for row in rows)
+            if self.npcs:
+                self.next_npc_id = max(self.next_npc_id, max(npc.id for npc in self.npcs) + 1)
+        except StorageError as e:
             print(f"Error loading NPCs: {e}")
+    
+    @staticmethod
+    def npc_row(npc):
+        """Database row for an NPC"""
+        return (npc.id, npc.x, npc.y, npc.name, npc.direction, npc.speed, npc.state.value)
+    
+    def npc_rows(self):
+        """Database rows for every NPC"""
+        return (self.npc_row(npc) for npc in self.npcs)
+    
     def save_npcs_to_db(self):
-        if not self.db_connection:
-            return
+        """Queue upserts for changed NPCs and deletes for removed ones.
         
-        try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("DELETE FROM npc")
-            for npc in self.npcs:
-                cursor.execute("""
-                    INSERT INTO npc (Identificador, x, y, nombre, direccion, velocidad, state)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (npc.id, npc.x, npc.y, npc.name, npc.direction, npc.speed, npc.state.value))
-            self.db_connection.commit()
-        except Error as e:
-            print(f"Error saving NPCs: {e}")
+        The background writer applies them in one transaction; this never
+        waits on the database. Returns the number of rows queued.
+        """
+        if not self.persistence:
+            return 0
+        
+        rows, deleted = self.saved.changes(self.npc_rows())
+        self.persistence.submit(rows, deleted)
+        return len(rows) + len(deleted)
+    
+    def close_database(self):
+        """Write the pending changes and close the storage"""
+        if self.persistence:
+            self.persistence.close()
+            self.persistence = None
+            self.storage = None
+    
+    @staticmethod
+    def npc_records(npcs):
+        """Checkpoint records (CHECKPOINT_DTYPE) for a list of NPCs"""
+        records = np.zeros(len(npcs), dtype=CHECKPOINT_DTYPE)
+        for record, npc in zip(records, npcs):
+            record['id'] = npc.id
+            record['x'] = npc.x
+            record['y'] = npc.y
+            record['direction'] = npc.direction
+            record['speed'] = npc.speed
+            record['color'] = npc.color
+            record['state'] = npc.state.value
+            record['state_timer'] = npc.state_timer
+            record['target_x'] = np.nan if npc.target_x is None else npc.target_x
+            record['target_y'] = np.nan if npc.target_y is None else npc.target_y
+            record['rng_counter'] = getattr(npc.rng, 'counter', 0)
+        return records
+    
+    def npcs_from_records(self, records, names):
+        """NPCs back from checkpoint records, their random streams where they left off"""
+        npcs = []
+        for record, name in zip(records.tolist(), names):
+            npc_id, x, y, direction, speed, color, state, state_timer, target_x, target_y, counter = record
+            # change_state(state) still draws a timer; the stream is put back after it
+            rng = self.streams.stream(npc_id)
+            npc = NPC(x, y, npc_id, name, color=tuple(int(c) for c in color), speed=speed,
+                      direction=direction, state=NPCState(state), rng=rng)
+            rng.counter = counter
+            npc.state_timer = state_timer
+            npc.target_x = None if math.isnan(target_x) else target_x
+            npc.target_y = None if math.isnan(target_y) else target_y
+            npcs.append(npc)
+        return npcs
+    
+    def checkpoint_records(self, start=0):
+        """(records, names) for the NPCs from index `start` on, see CHECKPOINT_DTYPE"""
+        npcs = self.npcs[start:]
+        return self.npc_records(npcs), [npc.name for npc in npcs]
+    
+    def add_records(self, records, names):
+        """Add NPCs from checkpoint records and return them"""
+        new_npcs = self.npcs_from_records(records, names)
+        self.npcs.extend(new_npcs)
+        return new_npcs
+    
+    def save_checkpoint(self, path):
+        """Write the NPCs and the player to a binary checkpoint file"""
+        meta = {
+            'width': self.width,
+            'height': self.height,
+            'ticks': self.ticks,
+            'seed': self.streams.seed,
+            'player': [self.player.x, self.player.y, self.player.direction],
+        }
+        meta.update(self.journal_state())
+        records, names = self.checkpoint_records()
+        save_checkpoint(path, records, names, meta)
+    
+    def load_checkpoint(self, path):
+        """Replace the NPCs and the player with the ones saved by save_checkpoint"""
+        with Checkpoint(path) as checkpoint:
+            if 'seed' in checkpoint.meta:
+                self.streams = RandomStreams(checkpoint.meta['seed'])
+                self.rng = self.streams.stream(WORLD_STREAM)
+            self.reset_npcs()
+            self.add_records(checkpoint.records, checkpoint.names())
+            self.ticks = checkpoint.meta.get('ticks', 0)
+            self.restore_journal_state(checkpoint.meta)
+            self.player.store_previous()
+        self.rebuild_grid()
+    
+    def start_journal(self, directory, **options):
+        """Journal spawns, removals, state changes and keyframes (options go to journal.Journal).
+        
+        Every NPC draws from its own random stream (see rng.py) and the
+        world's stream position is journaled with every spawn, removal and
+        keyframe, so journal.replay reproduces their states exactly.
+        Positions can drift by float rounding (neighbour order in the grid
+        differs after a restore) until the next keyframe pins them down.
+        """
+        self.journal = Journal(directory, **options)
+        self.journal.start(self)
+    
+    def journal_state(self):
+        """What a replay needs besides the event itself to carry on identically"""
+        return {
+            'next_npc_id': self.next_npc_id,
+            'rng': self.rng.counter,
+            'player': [self.player.x, self.player.y, self.player.direction],
+        }
+    
+    def restore_journal_state(self, meta):
+        self.next_npc_id = meta.get('next_npc_id', self.next_npc_id)
+        if 'rng' in meta:
+            self.rng.counter = meta['rng']
+        if 'player' in meta:
+            self.player.x, self.player.y, self.player.direction = meta['player']
+    
+    def keyframe(self):
+        records = np.zeros(len(self.npcs), dtype=KEYFRAME_DTYPE)
+        for record, npc in zip(records, self.npcs):
+            record['id'] = npc.id
+            record['x'] = npc.x
+            record['y'] = npc.y
+            record['direction'] = npc.direction
+        return records, self.journal_state()
+    
+    def replay_event(self, kind, meta, records):
+        by_id = {npc.id: npc for npc in self.npcs}
+        if kind == SPAWN:
+            for npc in self.add_records(records, meta['names']):
+                self.grid.insert(npc)
+        elif kind == DELETE:
+            for npc_id in meta['ids']:
+                npc = by_id[npc_id]
+                self.npcs.remove(npc)
+                self.grid.remove(npc)
+        elif kind == STATE:
+            for npc_id, state in zip(meta['ids'], meta['states']):
+                by_id[npc_id].state = NPCState(state)
+        elif kind == KEYFRAME:
+            for npc_id, x, y, direction in records.tolist():
+                npc = by_id[npc_id]
+                npc.x, npc.y, npc.direction = x, y, direction
+        self.restore_journal_state(meta)
+    
+    def remove_npc(self):
+        """Remove the most recently added NPC"""
+        removed = self.npcs.pop()
+        self.grid.remove(removed)
+        if self.scheduler:
+            self.scheduler.forget(removed)
+        if self.journal:
+            self.journal.append(DELETE, self.ticks, dict(self.journal_state(), ids=[removed.id]))
+        self.save_npcs_to_db()
+        return removed
     
     def create_initial_npcs(self, count):
         names = ["Warrior", "Mage", "Blacksmith", "Merchant", "Guard"]
         for i in range(count):
-            name = f"{random.choice(names)}_{i+1}"
-            npc = NPC(random.randint(50, self.width-50), random.randint(50, self.height-50), self.next_npc_id, name)
+            name = f"{self.rng.choice(names)}_{i+1}"
+            npc = NPC(self.rng.randint(50, self.width-50), self.rng.randint(50, self.height-50), self.next_npc_id, name,
+                      rng=self.streams.stream(self.next_npc_id))
             self.npcs.append(npc)
             self.next_npc_id += 1
+        if self.journal:
+            new_npcs = self.npcs[-count:] if count else []
+            self.journal.append(SPAWN, self.ticks, dict(self.journal_state(), names=[npc.name for npc in new_npcs]),
+                                self.npc_records(new_npcs))
         self.save_npcs_to_db()
     
     def update(self):
-        """Update game state"""
+        """Advance the simulation by one fixed timestep"""
+        self.player.store_previous()
+        self.player.move(*self.player_input)
         for npc in self.npcs:
-            npc.update(self.npcs, self.width, self.height)
+            npc.store_previous()
+        
+        states = [npc.state for npc in self.npcs] if self.journal else None
+        self.grid.update(self.npcs)
+        if self.scheduler is None:
+            for npc in self.npcs:
+                npc.update(self.npcs, self.width, self.height, self.grid, self.profiler)
+        else:
+            # Everyone moves every tick, only the NPCs the scheduler picks think
+            with self.profiler.phase('think'):
+                self.scheduler.run(self.npcs, self.ticks, self.player,
+                                   lambda npc, elapsed: npc.think(self.npcs, self.grid, self.profiler, elapsed),
+                                   self.grid)
+            for npc in self.npcs:
+                npc.move(self.width, self.height)
+        self.separate()
         
         # Get current mouse position and update player direction
         mouse_x, mouse_y = self.mouse_pos
         self.player.direction = math.atan2(mouse_y - self.player.y,
                                          mouse_x - self.player.x)
-    
-    def draw(self):
-        img = self.world_img.copy()
         
-        # Draw grid
-        for x in range(0, self.width, 50):
-            cv2.line(img, (x, 0), (x, self.height), (50, 50, 60), 1)
-        for y in range(0, self.height, 50):
-            cv2.line(img, (0, y), (self.width, y), (50, 50, 60), 1)
+        self.ticks += 1
+        if self.journal:
+            changed = [npc for npc, state in zip(self.npcs, states) if npc.state is not state]
+            if changed:
+                # Replay re-simulates these; the record makes them visible and pins them down
+                self.journal.append(STATE, self.ticks, {'ids': [npc.id for npc in changed],
+                                                        'states': [npc.state.value for npc in changed]})
+            self.journal.tick(self)
+    
+    def separate(self):
+        """Push every overlapping pair of NPCs apart at once (spatial.separation_many), inside the world"""
+        count = len(self.npcs)
+        if count < 2:
+            return
+        x = np.fromiter((npc.x for npc in self.npcs), dtype=np.float64, count=count)
+        y = np.fromiter((npc.y for npc in self.npcs), dtype=np.float64, count=count)
+        ids = np.fromiter((npc.id for npc in self.npcs), dtype=np.int64, count=count)
+        push_x, push_y = separation_many(x, y, ids, SEPARATION)
+        x = np.clip(x + push_x, 0, self.width).tolist()
+        y = np.clip(y + push_y, 0, self.height).tolist()
+        for npc, new_x, new_y in zip(self.npcs, x, y):
+            npc.x = new_x
+            npc.y = new_y
+    
+    def background(self):
+        """Static layer (background, grid, help text), rebuilt only when world_img is resized"""
+        if self._background is None or self._background.shape != self.world_img.shape:
+            img = self.world_img.copy()
+            for x in range(0, self.width, 50):
+                cv2.line(img, (x, 0), (x, self.height), (50, 50, 60), 1)
+            for y in range(0, self.height, 50):
+                cv2.line(img, (0, y), (self.width, y), (50, 50, 60), 1)
+            cv2.putText(img, "WASD: Move | Mouse: Look | +: Add NPC | -: Remove NPC | ESC: Quit", 
+                       (10, self.height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+            self._background = img
+        return self._background
+    
+    def invalidate_background(self):
+        """Force the static layer to be redrawn on the next frame"""
+        self._background = None
+    
+    def render(self, alpha=1.0):
+        """The world as an image; alpha blends positions between the last two ticks"""
+        img = self.background().copy()
         
         # Draw NPCs
-        for npc in self.npcs:
-            center = (int(npc.x), int(npc.y))
+        if self.sprites is not None:
+            positions = [npc.interpolated(alpha) for npc in self.npcs]
+            self.sprites.draw(img,
+                              [p[0] for p in positions],
+                              [p[1] for p in positions],
+                              [npc.direction for npc in self.npcs],
+                              [npc.color for npc in self.npcs],
+                              [f"{npc.name}: {npc.state.name}" for npc in self.npcs])
+        for npc in (self.npcs if self.sprites is None else ()):
+            x, y = npc.interpolated(alpha)
+            center = (int(x), int(y))
             cv2.circle(img, center, npc.size, npc.color, -1)
             cv2.circle(img, center, npc.size, (0, 0, 0), 1)
-            end_point = (int(npc.x + npc.size * 1.5 * math.cos(npc.direction)), 
-                         int(npc.y + npc.size * 1.5 * math.sin(npc.direction)))
+            end_point = (int(x + npc.size * 1.5 * math.cos(npc.direction)), 
+                         int(y + npc.size * 1.5 * math.sin(npc.direction)))
             cv2.line(img, center, end_point, (0, 0, 0), 2)
             cv2.putText(img, f"{npc.name}: {npc.state.name}", 
                        (center[0] - 50, center[1] - npc.size - 10), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
         
         # Draw player
-        player_center = (int(self.player.x), int(self.player.y))
+        player_x, player_y = self.player.interpolated(alpha)
+        player_center = (int(player_x), int(player_y))
         cv2.circle(img, player_center, self.player.size, self.player.color, -1)
         cv2.circle(img, player_center, self.player.size, (0, 0, 0), 1)
-        player_end = (int(self.player.x + self.player.size * 1.5 * math.cos(self.player.direction)), 
-                     int(self.player.y + self.player.size * 1.5 * math.sin(self.player.direction)))
+        player_end = (int(player_x + self.player.size * 1.5 * math.cos(self.player.direction)), 
+                     int(player_y + self.player.size * 1.5 * math.sin(self.player.direction)))
         cv2.line(img, player_center, player_end, (255, 255, 255), 2)
         
         # Draw UI
         cv2.putText(img, f"NPCs: {len(self.npcs)}", (10, 20), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        cv2.putText(img, "WASD: Move | Mouse: Look | A: Add NPC | D: Remove NPC | ESC: Quit", 
-                   (10, self.height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+        return img
+    
+    def draw(self, alpha=1.0):
+        """Render the world into the window"""
+        img = self.render(alpha)
+        self.profiler.draw_overlay(img, color=(255, 255, 255))
+        with self.profiler.phase('imshow'):
+            cv2.imshow('NPC Simulation', img)
+    
+    def advance(self, elapsed):
+        """Run as many fixed ticks as `elapsed` more seconds of wall time call for.
         
-        cv2.imshow('NPC Simulation', img)
+        At most MAX_TICKS_PER_FRAME run per call; when that is not enough
+        the backlog is dropped instead of spiralling. Returns the alpha to
+        draw with: how far the time left over is into the next tick.
+        """
+        self.accumulator += elapsed
+        ticks = 0
+        while self.accumulator >= self.sim_dt and ticks < MAX_TICKS_PER_FRAME:
+            with self.profiler.phase('update'):
+                self.update()
+            self.accumulator -= self.sim_dt
+            ticks += 1
+        if ticks == MAX_TICKS_PER_FRAME:
+            # Too far behind: keep at most one tick of the backlog
+            self.accumulator = min(self.accumulator, self.sim_dt)
+        return self.accumulator / self.sim_dt if self.interpolate else 1.0
     
     def run(self):
         print("Starting simulation. Controls:")
         print("WASD: Move player")
         print("Mouse: Look direction")
-        print("A: Add NPC")
-        print("D: Remove NPC")
+        print("+: Add NPC")
+        print("-: Remove NPC")
         print("ESC: Quit")
         
         last_save_time = time.time()
+        previous_time = time.perf_counter()
+        profiler = self.profiler
         
         while True:
-            # Handle keyboard input
-            key = cv2.waitKey(30)
+            # Poll the keyboard once per frame without blocking the simulation
+            with profiler.phase('input'):
+                key = cv2.waitKeyEx(1)
             if key == 27:  # ESC
                 break
-            elif key == ord('a'):
+            elif key in (ord('+'), ord('=')):
                 self.create_initial_npcs(1)
-            elif key == ord('d') and self.npcs:
-                removed = self.npcs.pop()
+            elif key == ord('-') and self.npcs:
+                removed = self.remove_npc()
                 print(f"Removed NPC: {removed.name}")
-                self.save_npcs_to_db()
             
-            # Player movement
-            keys = cv2.waitKeyEx(30)
+            # Player movement, applied by each tick of this frame
             dx, dy = 0, 0
-            if keys == ord('a') or keys == 2424832:  # Left arrow
+            if key == ord('a') or key == 2424832:  # Left arrow
                 dx = -1
-            if keys == ord('d') or keys == 2555904:  # Right arrow
+            if key == ord('d') or key == 2555904:  # Right arrow
                 dx = 1
-            if keys == ord('w') or keys == 2490368:  # Up arrow
+            if key == ord('w') or key == 2490368:  # Up arrow
                 dy = -1
-            if keys == ord('s') or keys == 2621440:  # Down arrow
+            if key == ord('s') or key == 2621440:  # Down arrow
                 dy = 1
             
             if dx != 0 and dy != 0:
                 dx *= 0.7071
                 dy *= 0.7071
             
-            self.player.move(dx, dy)
+            self.player_input = (dx, dy)
             
-            self.update()
-            self.draw()
+            # Run as many fixed simulation ticks as the elapsed time calls for
+            now = time.perf_counter()
+            alpha = self.advance(now - previous_time)
+            previous_time = now
+            with profiler.phase('draw'):
+                self.draw(alpha)
             
             # Auto-save every 5 seconds
             if time.time() - last_save_time > 5:
-                self.save_npcs_to_db()
+                with profiler.phase('db'):
+                    self.save_npcs_to_db()
                 last_save_time = time.time()
+            profiler.frame()
         
-        if self.db_connection:
-            self.db_connection.close()
+        profiler.close()
+        self.save_npcs_to_db()
+        self.close_database()
         cv2.destroyAllWindows()
 
+class VectorizedGameWorld(GameWorld):
+    """GameWorld that keeps NPC state in contiguous arrays and updates it in batches.
+    
+    `self.npcs` is a sequence of NPCView handles, so drawing, saving and
+    the main loop work unchanged. Each tick a StateMachine counts every
+    timer down at once and draws the expired NPCs' next states from
+    `transitions` (default: any state, uniformly, like NPC.change_state),
+    given as {state: {next_state: weight}} or a 4x4 matrix over STATES.
+    Movement then runs one kernel per state over that state's rows only.
+    
+    NPCs spawn exactly like NPC objects from the same seed: names,
+    positions, colours, speeds, states, timers and targets all come from
+    draws 0, 1, ... of the same streams (see rng.py). Runs differ from
+    GameWorld after the first tick: every NPC reacts to where the others
+    were at the start of the tick rather than where earlier NPCs in the
+    list have already moved, and draws by tick instead of sequentially.
+    """
+    def __init__(self, width=800, height=600, headless=False, sim_dt=SIM_DT, interpolate=True, batched=False,
+                 storage=None, seed=None, profiler=None, transitions=None, capacity=1024):
+        self.capacity = capacity
+        self.machine = StateMachine(STATES, transitions, durations=(60, 180))
+        super().__init__(width, height, headless, sim_dt, interpolate, batched, storage, seed, profiler)
+    
+    def reset_npcs(self):
+        self.population = NPCPopulation(self.capacity)
+        self.npcs = self.population
+    
+    def rebuild_grid(self):
+        pass  # neighbours are found from the arrays every tick
+    
+    def spawn(self, ids, names, x, y, direction=0.0, speed=None, state=None):
+        """Add NPCs, drawing what NPC.__init__ draws, in its order, from draws 0, 1, ... of their streams"""
+        ids = np.asarray(ids, dtype=np.int64)
+        streams = self.streams
+        color = np.stack([streams.integers(50, 201, ids, k) for k in (0, 1, 2)], axis=1)
+        k = 3
+        if speed is None:
+            speed = streams.uniform(1.0, 3.0, ids, k)
+            k += 1
+        if state is None:
+            state = streams.integers(0, len(STATES), ids, k)
+            k += 1
+        state = np.asarray(state, dtype=np.uint8)
+        timer = streams.integers(60, 181, ids, k)
+        working = np.flatnonzero(state == WORKING)
+        target_x = np.full(len(ids), np.nan)
+        target_y = np.full(len(ids), np.nan)
+        target_x[working] = streams.integers(100, 701, ids[working], k + 1)
+        target_y[working] = streams.integers(100, 501, ids[working], k + 2)
+        self.population.add_many(names, ids=ids, x=x, y=y, direction=direction, speed=speed, color=color,
+                                 state=state, state_timer=timer, target_x=target_x, target_y=target_y)
+    
+    def load_npcs_from_db(self):
+        if not self.storage:
+            return
+        
+        try:
+            for rows in self.storage.load_chunks():
+                self.saved.mark_saved(rows)
+                ids, x, y, names, direction, speed, state = zip(*rows)
+                self.spawn(ids, list(names), x, y, direction, speed, STATE_CODES[list(state)])
+            if self.npcs:
+                self.next_npc_id = max(self.next_npc_id, int(self.population.ids[:len(self.npcs)].max()) + 1)
+        except StorageError as e:
+            print(f"Error loading NPCs: {e}")
+    
+    def npc_rows(self):
+        p = self.population
+        n = p.size
+        names = p.name_table.decode_many(p.name_code[:n], p.name_number[:n])
+        return zip(p.ids[:n].tolist(), p.x[:n].tolist(), p.y[:n].tolist(), names,
+                   p.direction[:n].tolist(), p.speed[:n].tolist(), STATE_VALUES[p.state[:n]].tolist())
+    
+    def checkpoint_records(self, start=0):
+        p = self.population
+        n = p.size
+        records = np.empty(n - start, dtype=CHECKPOINT_DTYPE)
+        records['id'] = p.ids[start:n]
+        for name in ('x', 'y', 'direction', 'speed', 'color', 'state_timer', 'target_x', 'target_y'):
+            records[name] = getattr(p, name)[start:n]
+        records['state'] = STATE_VALUES[p.state[start:n]]
+        records['rng_counter'] = 0  # draws are keyed by tick, not by a stream position
+        return records, p.name_table.decode_many(p.name_code[start:n], p.name_number[start:n])
+    
+    def add_records(self, records, names):
+        start = self.population.size
+        self.population.add_many(names, ids=records['id'], x=records['x'], y=records['y'],
+                                 direction=records['direction'], speed=records['speed'], color=records['color'],
+                                 state=STATE_CODES[records['state']], state_timer=records['state_timer'],
+                                 target_x=records['target_x'], target_y=records['target_y'])
+        return self.population[start:]
+    
+    def keyframe(self):
+        p = self.population
+        n = p.size
+        records = np.empty(n, dtype=KEYFRAME_DTYPE)
+        records['id'] = p.ids[:n]
+        records['x'] = p.x[:n]
+        records['y'] = p.y[:n]
+        records['direction'] = p.direction[:n]
+        return records, self.journal_state()
+    
+    def replay_event(self, kind, meta, records):
+        p = self.population
+        if kind == SPAWN:
+            self.add_records(records, meta['names'])
+        elif kind == DELETE:
+            for npc_id in meta['ids']:
+                p.remove(int(p.rows_of([npc_id])[0]))
+        elif kind == STATE:
+            p.state[p.rows_of(meta['ids'])] = STATE_CODES[meta['states']]
+        elif kind == KEYFRAME:
+            rows = p.rows_of(records['id'])
+            p.x[rows] = records['x']
+            p.y[rows] = records['y']
+            p.direction[rows] = records['direction']
+        self.restore_journal_state(meta)
+    
+    def remove_npc(self):
+        """Remove the most recently added NPC and return it as an NPC object"""
+        last = self.population.size - 1
+        removed = self.npcs_from_records(*self.checkpoint_records(last))[0]
+        self.population.remove(last)
+        if self.journal:
+            self.journal.append(DELETE, self.ticks, dict(self.journal_state(), ids=[removed.id]))
+        self.save_npcs_to_db()
+        return removed
+    
+    def create_initial_npcs(self, count):
+        names = ["Warrior", "Mage", "Blacksmith", "Merchant", "Guard"]
+        # The world stream draws name, x and y per NPC, in that order, like GameWorld
+        counters = np.arange(self.rng.counter, self.rng.counter + 3 * count, dtype=np.uint64).reshape(count, 3)
+        self.rng.counter += 3 * count
+        streams = self.streams
+        table = self.population.name_table
+        codes = np.array([table.intern(name) for name in names], dtype=CODE_DTYPE)
+        picks = streams.integers(0, len(names), WORLD_STREAM, counters[:, 0])
+        x = streams.integers(50, self.width - 49, WORLD_STREAM, counters[:, 1])
+        y = streams.integers(50, self.height - 49, WORLD_STREAM, counters[:, 2])
+        ids = np.arange(self.next_npc_id, self.next_npc_id + count)
+        self.next_npc_id += count
+        start = self.population.size
+        self.spawn(ids, (codes[picks], np.arange(1, count + 1, dtype=NUMBER_DTYPE)), x, y)
+        if self.journal:
+            records, names = self.checkpoint_records(start)
+            self.journal.append(SPAWN, self.ticks, dict(self.journal_state(), names=names), records)
+        self.save_npcs_to_db()
+    
+    def update(self):
+        """Advance the simulation by one fixed timestep, every NPC at once"""
+        self.player.store_previous()
+        self.player.move(*self.player_input)
+        p = self.population
+        n = p.size
+        ids, x, y = p.ids[:n], p.x[:n], p.y[:n]
+        prev_x, prev_y, direction, speed = p.prev_x[:n], p.prev_y[:n], p.direction[:n], p.speed[:n]
+        prev_x[:] = x
+        prev_y[:] = y
+        streams, tick = self.streams, self.ticks
+        
+        with self.profiler.phase('state'):
+            before = p.state[:n].copy() if self.journal else None
+            expired = self.machine.step(p.state[:n], p.state_timer[:n], ids, streams, tick)
+            # Working NPCs pick a spot to walk to, everyone else drops theirs
+            working = expired[p.state[expired] == WORKING]
+            p.target_x[expired] = np.nan
+            p.target_y[expired] = np.nan
+            p.target_x[working] = streams.integers(100, 701, ids[working], tick, draw=5)
+            p.target_y[working] = streams.integers(100, 501, ids[working], tick, draw=6)
+        
+        def walk(rows, to_x, to_y, stop):
+            """Move rows towards (to_x, to_y) unless they are within `stop`"""
+            dx = to_x - x[rows]
+            dy = to_y - y[rows]
+            going = np.sqrt(dx*dx + dy*dy) > stop
+            rows = rows[going]
+            direction[rows] = np.arctan2(dy[going], dx[going])
+            x[rows] += np.cos(direction[rows]) * speed[rows]
+            y[rows] += np.sin(direction[rows]) * speed[rows]
+        
+        for code, rows in self.machine.groups(p.state[:n]):
+            if code == WANDERING:
+                turning = rows[streams.random(ids[rows], tick, draw=1) < 0.02]
+                direction[turning] = streams.uniform(0, 2 * math.pi, ids[turning], tick, draw=2)
+                x[rows] += np.cos(direction[rows]) * speed[rows]
+                y[rows] += np.sin(direction[rows]) * speed[rows]
+            elif code == WORKING:
+                rows = rows[~np.isnan(p.target_x[rows])]
+                walk(rows, p.target_x[rows], p.target_y[rows], 5)
+            elif code == SOCIALIZING:
+                # Walk up to the closest peer (where it was when the tick started)
+                peers = nearest_within(prev_x, prev_y, SOCIAL_RADIUS, rows)
+                rows, peers = rows[peers >= 0], peers[peers >= 0]
+                walk(rows, prev_x[peers], prev_y[peers], NPCView.size * 2.5)
+        
+        # Avoid overlapping other NPCs
+        push_x, push_y = separation_many(x, y, ids, NPCView.size * 2)
+        np.clip(x + push_x, 0, self.width, out=x)
+        np.clip(y + push_y, 0, self.height, out=y)
+        
+        mouse_x, mouse_y = self.mouse_pos
+        self.player.direction = math.atan2(mouse_y - self.player.y,
+                                         mouse_x - self.player.x)
+        
+        self.ticks += 1
+        if self.journal:
+            changed = expired[before[expired] != p.state[expired]]
+            if len(changed):
+                self.journal.append(STATE, self.ticks, {'ids': ids[changed].tolist(),
+                                                        'states': STATE_VALUES[p.state[changed]].tolist()})
+            self.journal.tick(self)
+
 if __name__ == "__main__":
     game = GameWorld(1000, 800)
     game.run()
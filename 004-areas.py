@@ -2,17 +2,52 @@ import cv2
 import numpy as np
 import random
 import math
-import mysql.connector
-from mysql.connector import Error
 from enum import Enum
+from spatial import SpatialGrid, nearest_within, separation_many
+from render import SpriteBatch
+from storage import ChangeTracker, PersistenceWorker, StorageError, Table, open_storage
+from checkpoint import Checkpoint, save_checkpoint
+from names import CODE_DTYPE, NUMBER_DTYPE, NameTable
+from profiler import NULL_PROFILER, from_environment
+from rng import WORLD_STREAM, RandomStreams
+from statemachine import StateMachine
 
-# Configuración de la base de datos
-DB_CONFIG = {
-    'host': 'localhost',
-    'database': 'sandybrown',
-    'user': 'sandybrown',
-    'password': 'sandybrown'
-}
+# Tabla de la base de datos (el backend lo elige open_storage)
+NPC_TABLE = Table('npcs', (
+    ('id', 'INT'),
+    ('x', 'FLOAT NOT NULL'),
+    ('y', 'FLOAT NOT NULL'),
+    ('name', 'VARCHAR(255) NOT NULL'),
+    ('direction', 'FLOAT NOT NULL'),
+    ('speed', 'FLOAT NOT NULL'),
+    ('state', 'INT NOT NULL'),
+    ('work_area', 'INT NOT NULL'),
+    ('home_area', 'INT NOT NULL'),
+))
+
+# Un registro de checkpoint por NPC (target_area = índice en game_map.areas, -1 = ninguna;
+# target_x/target_y son NaN si no hay destino)
+CHECKPOINT_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('direction', '<f8'),
+    ('speed', '<f8'),
+    ('color', 'u1', (3,)),
+    ('state', 'i1'),
+    ('state_timer', '<i4'),
+    ('work_area', 'i1'),
+    ('home_area', 'i1'),
+    ('target_area', '<i2'),
+    ('target_x', '<f8'),
+    ('target_y', '<f8'),
+    ('rng_counter', '<u8'),  # posición en el flujo aleatorio del NPC
+])
+
+# Distancia a la que los NPCs se ven entre sí
+SOCIAL_RADIUS = 100
+# Los NPCs a menos de esta distancia (el doble de su tamaño) se separan
+SEPARATION = 30
 
 # Enumeraciones
 class AreaType(Enum):
@@ -28,8 +63,21 @@ class NPCState(Enum):
     SOCIALIZING = 3
     RESTING = 4
 
+# Códigos uint8 de una NPCPopulation: índices en AREA_TYPES y STATES
+AREA_TYPES = list(AreaType)
+AREA_VALUES = np.array([area_type.value for area_type in AREA_TYPES])
+AREA_CODES = np.zeros(AREA_VALUES.max() + 1, dtype=np.uint8)
+AREA_CODES[AREA_VALUES] = np.arange(len(AREA_TYPES))
+STATES = list(NPCState)
+STATE_VALUES = np.array([state.value for state in STATES])
+STATE_CODES = np.zeros(STATE_VALUES.max() + 1, dtype=np.uint8)
+STATE_CODES[STATE_VALUES] = np.arange(len(STATES))
+WANDERING, WORKING, SOCIALIZING, RESTING = (STATES.index(state) for state in NPCState)
+
 # Clase base Character
 class Character:
+    __slots__ = ('x', 'y', 'color', 'speed', 'size', 'direction')
+    
     def __init__(self, x, y, color, speed=2, size=15):
         self.x = x
         self.y = y
@@ -44,20 +92,40 @@ class Character:
 
 # Clase NPC que hereda de Character
 class NPC(Character):
-    def __init__(self, x, y, npc_id, name, color=None):
-        color = color or (random.randint(50, 200), random.randint(50, 200), random.randint(50, 200))
-        super().__init__(x, y, color, random.uniform(1.0, 3.0))
+    __slots__ = ('rng', 'id', 'name', 'state', 'state_timer', 'target_area', 'target_x', 'target_y', 'target_version',
+                 'work_area', 'home_area', 'peer')
+    
+    def __init__(self, x, y, npc_id, name, color=None, speed=None, direction=0, state=None,
+                 work_area=None, home_area=None, rng=None):
+        # Flujo aleatorio propio (rng.Stream); el `random` global si el NPC se crea fuera de un GameWorld
+        self.rng = rng if rng is not None else random
+        color = color or (self.rng.randint(50, 200), self.rng.randint(50, 200), self.rng.randint(50, 200))
+        super().__init__(x, y, color, speed if speed is not None else self.rng.uniform(1.0, 3.0))
+        self.direction = direction
         self.id = npc_id
         self.name = name
         self.state = NPCState.WANDERING
         self.state_timer = 0
-        self.work_area = None
-        self.home_area = None
-        self.assign_areas()
-        self.change_state()
+        self.target_area = None
+        self.target_x = None
+        self.target_y = None
+        self.target_version = None
+        self.peer = None  # el NPC más cercano dentro de SOCIAL_RADIUS, solo al socializar
+        self.work_area = work_area
+        self.home_area = home_area
+        if work_area is None or home_area is None:
+            self.assign_areas()
+        self.change_state(state)
+    
+    @classmethod
+    def from_row(cls, row, rng=None):
+        """NPC a partir de una fila de la DB; solo los campos no guardados son aleatorios"""
+        npc_id, x, y, name, direction, speed, state, work_area, home_area = row
+        return cls(x, y, npc_id, name, speed=speed, direction=direction, state=NPCState(state),
+                   work_area=AreaType(work_area), home_area=AreaType(home_area), rng=rng)
     
     def assign_areas(self):
-        rand = random.random()
+        rand = self.rng.random()
         if rand < 0.3:  # 30% comercial
             self.work_area = AreaType.COMERCIAL
         elif rand < 0.6:  # 30% industrial
@@ -67,54 +135,248 @@ class NPC(Character):
         else:  # 20% rural
             self.work_area = AreaType.RURAL
         
-        self.home_area = AreaType.RESIDENCIAL if random.random() < 0.7 else AreaType.RURAL
+        self.home_area = AreaType.RESIDENCIAL if self.rng.random() < 0.7 else AreaType.RURAL
     
-    def change_state(self):
-        self.state = random.choice(list(NPCState))
-        self.state_timer = random.randint(60, 180)  # 1-3 segundos a 60 FPS
+    def change_state(self, state=None):
+        self.state = state or self.rng.choice(list(NPCState))
+        self.state_timer = self.rng.randint(60, 180)  # 1-3 segundos a 60 FPS
+        self.target_area = None  # se replanifica en el próximo update
     
     def get_target_area(self, game_map):
         if self.state == NPCState.WORKING:
-            return random.choice([a for a in game_map.areas if a['type'] == self.work_area])
+            candidates = game_map.areas_of_type(self.work_area)
         elif self.state == NPCState.RESTING:
-            return random.choice([a for a in game_map.areas if a['type'] == self.home_area])
+            candidates = game_map.areas_of_type(self.home_area)
         elif self.state == NPCState.SOCIALIZING:
-            return random.choice([a for a in game_map.areas if a['type'] == AreaType.RECREATIVA])
+            candidates = game_map.areas_of_type(AreaType.RECREATIVA)
         else:
-            return random.choice(game_map.areas)
+            candidates = game_map.areas
+        # Si el mapa no tiene áreas de ese tipo, cualquier área vale
+        return self.rng.choice(candidates or game_map.areas)
+    
+    def plan_target(self, game_map, new_area=True):
+        """Elige (y guarda) el área y el punto de destino"""
+        if new_area or self.target_version != game_map.version:
+            self.target_area = self.get_target_area(game_map)
+            self.target_version = game_map.version
+        x1, y1, x2, y2 = self.target_area['rect']
+        self.target_x = self.rng.randint(x1, x2)
+        self.target_y = self.rng.randint(y1, y2)
     
-    def update(self, npcs, game_map):
-        self.state_timer -= 1
+    def current_area(self, game_map):
+        return game_map.area_at(self.x, self.y)
+    
+    def neighbours(self, npcs, radius, grid=None):
+        """NPCs a menos de radius, usando la rejilla espacial si existe"""
+        if grid is not None:
+            return grid.query_radius(self.x, self.y, radius, exclude=self)
+        radius_sq = radius * radius
+        return [npc for npc in npcs if npc is not self and
+                (npc.x - self.x) ** 2 + (npc.y - self.y) ** 2 <= radius_sq]
+    
+    def nearest_peer(self, npcs, grid=None):
+        """El otro NPC más cercano dentro de SOCIAL_RADIUS, o None"""
+        if grid is not None:
+            found = grid.k_nearest(self.x, self.y, 1, exclude=self, max_radius=SOCIAL_RADIUS)
+            return found[0] if found else None
+        nearby = self.neighbours(npcs, SOCIAL_RADIUS)
+        return min(nearby, key=lambda npc: (npc.x - self.x) ** 2 + (npc.y - self.y) ** 2, default=None)
+    
+    def update(self, npcs, game_map, grid=None, profiler=NULL_PROFILER):
+        self.think(npcs, game_map, grid, profiler)
+        self.move(game_map, profiler)
+    
+    def think(self, npcs, game_map, grid=None, profiler=NULL_PROFILER, elapsed=1):
+        """Decisiones: temporizador y cambio de estado, vecinos y destino; `elapsed` ticks desde la última"""
+        self.state_timer -= elapsed
         if self.state_timer <= 0:
-            self.change_state()
+            with profiler.phase('state'):
+                self.change_state()
+        
+        # Solo quien socializa mira alrededor; los solapes los resuelve GameWorld.separate para todos
+        self.peer = self.nearest_peer(npcs, grid) if self.state == NPCState.SOCIALIZING else None
+        
+        # Solo se replanifica al cambiar de estado o si el mapa cambió
+        if self.target_area is None or self.target_version != game_map.version:
+            with profiler.phase('target'):
+                self.plan_target(game_map)
+    
+    def move(self, game_map, profiler=NULL_PROFILER):
+        """Un tick de movimiento hacia lo decidido en el último think"""
+        if self.target_x is None:
+            return  # todavía no ha pensado nunca
+        target_x, target_y = self.target_x, self.target_y
+        stop_dist = 10
         
-        target_area = self.get_target_area(game_map)
-        x1, y1, x2, y2 = target_area['rect']
-        target_x = random.randint(x1, x2)
-        target_y = random.randint(y1, y2)
+        # Socializando: acercarse al vecino más cercano
+        if self.state == NPCState.SOCIALIZING and self.peer is not None:
+            target_x, target_y = self.peer.x, self.peer.y
+            stop_dist = self.size * 2.5
         
         dx = target_x - self.x
         dy = target_y - self.y
         dist = math.sqrt(dx*dx + dy*dy)
         
-        if dist > 10:
+        if dist > stop_dist:
             self.direction = math.atan2(dy, dx)
             self.x += math.cos(self.direction) * self.speed
             self.y += math.sin(self.direction) * self.speed
+        elif target_x == self.target_x and target_y == self.target_y:
+            # Llegó: nuevo punto dentro de la misma área
+            with profiler.phase('target'):
+                self.plan_target(game_map, new_area=False)
         
         self.x = max(0, min(game_map.width, self.x))
         self.y = max(0, min(game_map.height, self.y))
 
+def _column(name):
+    """Propiedad que lee/escribe una fila de una columna de NPCPopulation"""
+    def getter(self):
+        return getattr(self._population, name)[self.row]
+    def setter(self, value):
+        getattr(self._population, name)[self.row] = value
+    return property(getter, setter)
+
+def _target(name):
+    """Como _column, con None en lugar de NaN (sin destino)"""
+    def getter(self):
+        value = getattr(self._population, name)[self.row]
+        return None if math.isnan(value) else float(value)
+    def setter(self, value):
+        getattr(self._population, name)[self.row] = np.nan if value is None else value
+    return property(getter, setter)
+
+def _code(name, members):
+    """Como _column, traduciendo el código uint8 al miembro del Enum"""
+    def getter(self):
+        return members[getattr(self._population, name)[self.row]]
+    def setter(self, value):
+        getattr(self._population, name)[self.row] = members.index(value)
+    return property(getter, setter)
+
+class NPCView:
+    """Fila de una NPCPopulation con la interfaz de un NPC, para el código escrito para objetos"""
+    __slots__ = ('_population', 'row')
+    size = 15
+    rng = None  # los sorteos van por tick; no hay posición de flujo que guardar
+    
+    id = _column('ids')
+    x = _column('x')
+    y = _column('y')
+    direction = _column('direction')
+    speed = _column('speed')
+    state_timer = _column('state_timer')
+    target_x = _target('target_x')
+    target_y = _target('target_y')
+    state = _code('state', STATES)
+    work_area = _code('work_area', AREA_TYPES)
+    home_area = _code('home_area', AREA_TYPES)
+    
+    def __init__(self, population, row):
+        self._population = population
+        self.row = row
+    
+    @property
+    def name(self):
+        p = self._population
+        return p.name_table.decode(p.name_code[self.row], p.name_number[self.row])
+    
+    @property
+    def color(self):
+        return tuple(int(c) for c in self._population.color[self.row])
+    
+    def __repr__(self):
+        return f"NPCView(id={self.id}, name={self.name!r}, state={self.state.name}, x={self.x:.1f}, y={self.y:.1f})"
+
+class NPCPopulation:
+    """Columnas NumPy con los NPCs de un VectorizedGameWorld.
+    
+    Estados y tipos de área son códigos uint8 (índices en STATES y
+    AREA_TYPES) y los nombres van internados (ver names.py); los
+    NPCView solo se crean cuando se piden.
+    """
+    COLUMNS = (
+        ('ids', np.int64, ()),
+        ('x', np.float64, ()),
+        ('y', np.float64, ()),
+        ('direction', np.float64, ()),
+        ('speed', np.float64, ()),
+        ('color', np.uint8, (3,)),
+        ('state', np.uint8, ()),
+        ('state_timer', np.int32, ()),
+        ('work_area', np.uint8, ()),
+        ('home_area', np.uint8, ()),
+        ('target_area', np.int16, ()),  # índice en game_map.areas, -1 = ninguna
+        ('target_version', np.int32, ()),  # game_map.version al elegirla
+        ('target_x', np.float64, ()),  # NaN = sin destino
+        ('target_y', np.float64, ()),
+        ('name_code', CODE_DTYPE, ()),
+        ('name_number', NUMBER_DTYPE, ()),
+    )
+    
+    def __init__(self, capacity=1024):
+        self.size = 0
+        for name, dtype, shape in self.COLUMNS:
+            setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
+        self.name_table = NameTable()
+    
+    def __len__(self):
+        return self.size
+    
+    def __getitem__(self, row):
+        rows = range(self.size)[row]
+        if isinstance(row, slice):
+            return [NPCView(self, r) for r in rows]
+        return NPCView(self, rows)
+    
+    def __iter__(self):
+        return (NPCView(self, row) for row in range(self.size))
+    
+    def _reserve(self, count):
+        """Agranda las columnas para que quepan `count` filas"""
+        capacity = len(self.ids)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for name, _, _ in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+    
+    def add_many(self, names, **columns):
+        """Añade NPCs dados por sus columnas (ver COLUMNS).
+        
+        `names` es una secuencia de str o un par (codes, numbers) codificado
+        con `self.name_table`. Por defecto no tienen destino.
+        """
+        codes, numbers = names if isinstance(names, tuple) else self.name_table.encode(names)
+        start, end = self.size, self.size + len(codes)
+        self._reserve(end)
+        columns.setdefault('target_area', -1)
+        columns.setdefault('target_version', -1)
+        columns.setdefault('target_x', np.nan)
+        columns.setdefault('target_y', np.nan)
+        for name, value in columns.items():
+            getattr(self, name)[start:end] = value
+        self.name_code[start:end] = codes
+        self.name_number[start:end] = numbers
+        self.size = end
+
 # Clase GameMap
 class GameMap:
     def __init__(self, width, height):
         self.width = width
         self.height = height
         self.areas = []
+        self.areas_by_type = {}
+        self.area_raster = None
+        self.version = 0  # cambia cada vez que se modifican las áreas
         self.generate_areas()
-        self.map_img = self.create_map_image()
     
     def generate_areas(self):
+        self.areas = []
         self.areas.append({
             'type': AreaType.RESIDENCIAL,
             'rect': (0, 0, self.width//3, self.height//2),
@@ -140,6 +402,48 @@ class GameMap:
             'rect': (self.width//2, self.height//2, self.width, self.height),
             'color': (70, 180, 180)
         })
+        self.refresh()
+    
+    def refresh(self):
+        """Recalcula índices e imagen; llamar tras modificar self.areas a mano"""
+        self.version += 1
+        self.rebuild_index()
+        self.map_img = self.create_map_image()
+    
+    def rebuild_index(self):
+        """Índice por AreaType y raster punto -> índice de área (-1 = ninguna)"""
+        self.areas_by_type = {area_type: [] for area_type in AreaType}
+        self.area_raster = np.full((self.height, self.width), -1, dtype=np.int16)
+        for i, area in enumerate(self.areas):
+            self.areas_by_type[area['type']].append(area)
+            # Las áreas posteriores se pintan encima, igual que en create_map_image
+            x1, y1, x2, y2 = area['rect']
+            self.area_raster[max(0, y1):y2 + 1, max(0, x1):x2 + 1] = i
+    
+    def areas_of_type(self, area_type):
+        return self.areas_by_type.get(area_type, [])
+    
+    def area_at(self, x, y):
+        """Área que contiene el punto (x, y), o None"""
+        col = min(max(int(x), 0), self.width - 1)
+        row = min(max(int(y), 0), self.height - 1)
+        index = self.area_raster[row, col]
+        return self.areas[index] if index >= 0 else None
+    
+    def add_area(self, area_type, rect, color):
+        area = {'type': area_type, 'rect': rect, 'color': color}
+        self.areas.append(area)
+        self.refresh()
+        return area
+    
+    def remove_area(self, area):
+        self.areas.remove(area)
+        self.refresh()
+    
+    def update_area(self, area, **changes):
+        """Modifica 'type', 'rect' o 'color' de un área y recalcula los índices"""
+        area.update(changes)
+        self.refresh()
     
     def create_map_image(self):
         img = np.zeros((self.height, self.width, 3), dtype=np.uint8)
@@ -162,84 +466,190 @@ class GameMap:
 
 # Clase principal GameWorld con conexión a DB
 class GameWorld:
-    def __init__(self, width=1000, height=800):
+    def __init__(self, width=1000, height=800, headless=False, batched=False, storage=None, seed=None, profiler=None,
+                 scheduler=None):
         self.game_map = GameMap(width, height)
         self.player = Character(width//2, height//2, (0, 100, 255), 5, 20)
-        self.npcs = []
-        self.db_connection = None
-        self.setup_database()
+        # Decisiones repartidas en el tiempo (scheduler.AIScheduler); None = todos piensan cada tick
+        self.scheduler = scheduler
+        self.reset_npcs()
+        self.next_npc_id = 1
+        # Cada NPC tiene su propio flujo aleatorio: misma semilla, mismo mundo
+        self.streams = RandomStreams(seed)
+        self.rng = self.streams.stream(WORLD_STREAM)
+        self.profiler = profiler or from_environment()  # tiempos por fase, ver profiler.py
+        # Dibujo por lotes; supone que todos los NPCs tienen el tamaño por defecto (15)
+        self.sprites = None
+        if batched:
+            self.sprites = SpriteBatch(radius=15, outline_radius=7, line_length=15,
+                                       line_thickness=1, arrow=True)
+        self.grid = SpatialGrid(cell_size=SEPARATION)  # la búsqueda de compañía rara vez pasa del anillo siguiente
+        self.storage = None
+        self.persistence = None  # escritor en segundo plano, ver save_npcs_to_db
+        self.saved = ChangeTracker()  # filas tal y como se entregaron al escritor
+        self.ticks = 0
+        self.setup_database(storage)
         self.load_npcs_from_db()
+        if self.storage:
+            self.persistence = PersistenceWorker(self.storage)
         if not self.npcs:
             self.create_initial_npcs(20)
+        self.rebuild_grid()
         self.mouse_pos = (0, 0)
         
-        cv2.namedWindow('NPC Simulation')
-        cv2.setMouseCallback('NPC Simulation', self.update_mouse_pos)
+        # Sin ventana en modo headless
+        if not headless:
+            cv2.namedWindow('NPC Simulation')
+            cv2.setMouseCallback('NPC Simulation', self.update_mouse_pos)
+    
+    def reset_npcs(self):
+        """Empieza de nuevo sin NPCs"""
+        self.npcs = []
+        if self.scheduler:
+            self.scheduler.reset()
+    
+    def rebuild_grid(self):
+        """Vuelve a repartir todos los NPCs en la rejilla de vecinos"""
+        self.grid.rebuild(self.npcs)
     
-    def setup_database(self):
+    def setup_database(self, storage=None):
+        """Abre el backend: 'mysql' (por defecto), 'sqlite[:ruta]' o 'memory'"""
         try:
-            self.db_connection = mysql.connector.connect(**DB_CONFIG)
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS npcs (
-                    id INT PRIMARY KEY,
-                    x FLOAT NOT NULL,
-                    y FLOAT NOT NULL,
-                    name VARCHAR(255) NOT NULL,
-                    direction FLOAT NOT NULL,
-                    speed FLOAT NOT NULL,
-                    state INT NOT NULL,
-                    work_area INT NOT NULL,
-                    home_area INT NOT NULL
-                )
-            """)
-            self.db_connection.commit()
-        except Error as e:
+            self.storage = open_storage(NPC_TABLE, storage)
+        except StorageError as e:
             print(f"Database error: {e}")
     
     def load_npcs_from_db(self):
+        if not self.storage:
+            return
+        
         try:
-            cursor = self.db_connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM npcs")
-            for record in cursor.fetchall():
-                npc = NPC(record['x'], record['y'], record['id'], record['name'])
-                npc.direction = record['direction']
-                npc.speed = record['speed']
-                npc.state = NPCState(record['state'])
-                npc.work_area = AreaType(record['work_area'])
-                npc.home_area = AreaType(record['home_area'])
-                self.npcs.append(npc)
-        except Error as e:
+            # Por bloques, para no tener la tabla entera dos veces en memoria
+            for rows in self.storage.load_chunks():
+                self.saved.mark_saved(rows)
+                self.npcs.extend(NPC.from_row(row, self.streams.stream(row[0])) for row in rows)
+            if self.npcs:
+                self.next_npc_id = max(self.next_npc_id, max(npc.id for npc in self.npcs) + 1)
+        except StorageError as e:
             print(f"Error loading NPCs: {e}")
     
+    @staticmethod
+    def npc_row(npc):
+        """Fila de la base de datos para un NPC"""
+        return (
+            npc.id, npc.x, npc.y, npc.name, 
+            npc.direction, npc.speed, 
+            npc.state.value, npc.work_area.value, npc.home_area.value
+        )
+    
+    def npc_rows(self):
+        """Filas de la base de datos de todos los NPCs"""
+        return (self.npc_row(npc) for npc in self.npcs)
+    
     def save_npcs_to_db(self):
-        try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("DELETE FROM npcs")
-            for npc in self.npcs:
-                cursor.execute("""
-                    INSERT INTO npcs 
-                    (id, x, y, name, direction, speed, state, work_area, home_area)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    npc.id, npc.x, npc.y, npc.name, 
-                    npc.direction, npc.speed, 
-                    npc.state.value, npc.work_area.value, npc.home_area.value
-                ))
-            self.db_connection.commit()
-        except Error as e:
-            print(f"Error saving NPCs: {e}")
+        """Encola upserts de los NPCs que cambiaron y deletes de los eliminados.
+        
+        El escritor en segundo plano los aplica en una sola transacción; aquí
+        nunca se espera a la DB. Devuelve el número de filas encoladas.
+        """
+        if not self.persistence:
+            return 0
+        
+        rows, deleted = self.saved.changes(self.npc_rows())
+        self.persistence.submit(rows, deleted)
+        return len(rows) + len(deleted)
+    
+    def close_database(self):
+        """Escribe los cambios pendientes y cierra el almacenamiento"""
+        if self.persistence:
+            self.persistence.close()
+            self.persistence = None
+            self.storage = None
+    
+    def checkpoint_records(self):
+        """(registros, nombres) de todos los NPCs, ver CHECKPOINT_DTYPE"""
+        area_index = {id(area): i for i, area in enumerate(self.game_map.areas)}
+        records = np.zeros(len(self.npcs), dtype=CHECKPOINT_DTYPE)
+        for record, npc in zip(records, self.npcs):
+            record['id'] = npc.id
+            record['x'] = npc.x
+            record['y'] = npc.y
+            record['direction'] = npc.direction
+            record['speed'] = npc.speed
+            record['color'] = npc.color
+            record['state'] = npc.state.value
+            record['state_timer'] = npc.state_timer
+            record['work_area'] = npc.work_area.value
+            record['home_area'] = npc.home_area.value
+            record['target_area'] = area_index.get(id(npc.target_area), -1)
+            record['target_x'] = np.nan if npc.target_x is None else npc.target_x
+            record['target_y'] = np.nan if npc.target_y is None else npc.target_y
+            record['rng_counter'] = getattr(npc.rng, 'counter', 0)
+        return records, [npc.name for npc in self.npcs]
+    
+    def save_checkpoint(self, path):
+        """Guarda NPCs, jugador y áreas del mapa en un checkpoint binario"""
+        meta = {
+            'width': self.game_map.width,
+            'height': self.game_map.height,
+            'next_npc_id': self.next_npc_id,
+            'ticks': self.ticks,
+            'seed': self.streams.seed,
+            'rng': self.rng.counter,
+            'player': [self.player.x, self.player.y, self.player.direction],
+            'areas': [{'type': area['type'].value, 'rect': list(area['rect']), 'color': list(area['color'])}
+                      for area in self.game_map.areas],
+        }
+        records, names = self.checkpoint_records()
+        save_checkpoint(path, records, names, meta)
+    
+    def add_records(self, records, names):
+        """Añade NPCs a partir de registros de checkpoint, sus flujos donde se quedaron"""
+        for record, name in zip(records.tolist(), names):
+            (npc_id, x, y, direction, speed, color, state, state_timer,
+             work_area, home_area, target_area, target_x, target_y, counter) = record
+            # change_state(state) sigue sacando un temporizador; el flujo se recoloca después
+            rng = self.streams.stream(npc_id)
+            npc = NPC(x, y, npc_id, name, color=tuple(int(c) for c in color), speed=speed,
+                      direction=direction, state=NPCState(state),
+                      work_area=AreaType(work_area), home_area=AreaType(home_area), rng=rng)
+            rng.counter = counter
+            npc.state_timer = state_timer
+            if target_area >= 0:
+                npc.target_area = self.game_map.areas[target_area]
+                npc.target_version = self.game_map.version
+            npc.target_x = None if math.isnan(target_x) else target_x
+            npc.target_y = None if math.isnan(target_y) else target_y
+            self.npcs.append(npc)
+    
+    def load_checkpoint(self, path):
+        """Sustituye NPCs, jugador y áreas por los guardados con save_checkpoint"""
+        with Checkpoint(path) as checkpoint:
+            meta = checkpoint.meta
+            self.game_map.areas = [{'type': AreaType(area['type']), 'rect': tuple(area['rect']),
+                                    'color': tuple(area['color'])} for area in meta['areas']]
+            self.game_map.refresh()
+            if 'seed' in meta:
+                self.streams = RandomStreams(meta['seed'])
+            self.rng = self.streams.stream(WORLD_STREAM, meta.get('rng', 0))
+            self.reset_npcs()
+            self.add_records(checkpoint.records, checkpoint.names())
+            self.next_npc_id = meta['next_npc_id']
+            self.ticks = meta['ticks']
+            self.player.x, self.player.y, self.player.direction = meta['player']
+        self.rebuild_grid()
     
     def create_initial_npcs(self, count):
         names = ["Alex", "Sam", "Taylor", "Jordan", "Casey"]
         for i in range(count):
-            name = f"{random.choice(names)}_{i+1}"
+            name = f"{self.rng.choice(names)}_{i+1}"
             npc = NPC(
-                random.randint(0, self.game_map.width),
-                random.randint(0, self.game_map.height),
-                i+1, name
+                self.rng.randint(0, self.game_map.width),
+                self.rng.randint(0, self.game_map.height),
+                self.next_npc_id, name, rng=self.streams.stream(self.next_npc_id)
             )
             self.npcs.append(npc)
+            self.next_npc_id += 1
         self.save_npcs_to_db()
     
     def update_mouse_pos(self, event, x, y, flags, param):
@@ -249,18 +659,54 @@ class GameWorld:
         mouse_x, mouse_y = self.mouse_pos
         self.player.direction = math.atan2(mouse_y - self.player.y, mouse_x - self.player.x)
         
-        for npc in self.npcs:
-            npc.update(self.npcs, self.game_map)
+        self.grid.update(self.npcs)
+        if self.scheduler is None:
+            for npc in self.npcs:
+                npc.update(self.npcs, self.game_map, self.grid, self.profiler)
+        else:
+            # Todos se mueven cada tick; solo piensan los que elige el scheduler
+            with self.profiler.phase('think'):
+                self.scheduler.run(self.npcs, self.ticks, self.player,
+                                   lambda npc, elapsed: npc.think(self.npcs, self.game_map, self.grid,
+                                                                  self.profiler, elapsed),
+                                   self.grid)
+            for npc in self.npcs:
+                npc.move(self.game_map, self.profiler)
+        self.separate()
         
-        # Auto-guardado cada 5 segundos (ejemplo)
-        if cv2.getTickCount() % 300 == 0:  # Aprox 5 segundos a 60 FPS
-            self.save_npcs_to_db()
+        # Auto-guardado cada 300 ticks (aprox 5 segundos a 60 FPS)
+        self.ticks += 1
+        if self.ticks % 300 == 0:
+            with self.profiler.phase('db'):
+                self.save_npcs_to_db()
     
-    def draw(self):
+    def separate(self):
+        """Separa a la vez todos los NPCs solapados (spatial.separation_many) y los deja en el mapa"""
+        count = len(self.npcs)
+        if count < 2:
+            return
+        x = np.fromiter((npc.x for npc in self.npcs), dtype=np.float64, count=count)
+        y = np.fromiter((npc.y for npc in self.npcs), dtype=np.float64, count=count)
+        ids = np.fromiter((npc.id for npc in self.npcs), dtype=np.int64, count=count)
+        push_x, push_y = separation_many(x, y, ids, SEPARATION)
+        x = np.clip(x + push_x, 0, self.game_map.width).tolist()
+        y = np.clip(y + push_y, 0, self.game_map.height).tolist()
+        for npc, new_x, new_y in zip(self.npcs, x, y):
+            npc.x = new_x
+            npc.y = new_y
+    
+    def render(self):
+        """El mundo como imagen"""
         img = self.game_map.map_img.copy()
         
         # Dibujar NPCs
-        for npc in self.npcs:
+        if self.sprites is not None:
+            self.sprites.draw(img,
+                              [npc.x for npc in self.npcs],
+                              [npc.y for npc in self.npcs],
+                              [npc.direction for npc in self.npcs],
+                              [npc.color for npc in self.npcs])
+        for npc in (self.npcs if self.sprites is None else ()):
             center = (int(npc.x), int(npc.y))
             cv2.circle(img, center, npc.size, npc.color, -1)
             cv2.circle(img, center, npc.size//2, (0, 0, 0), 1)
@@ -280,8 +726,14 @@ class GameWorld:
         # UI
         cv2.putText(img, f"NPCs: {len(self.npcs)}", (10, 30), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        cv2.imshow('NPC Simulation', img)
+        return img
+    
+    def draw(self):
+        """Dibuja el mundo en la ventana"""
+        img = self.render()
+        self.profiler.draw_overlay(img, color=(255, 255, 255))
+        with self.profiler.phase('imshow'):
+            cv2.imshow('NPC Simulation', img)
     
     def handle_input(self):
         key = cv2.waitKey(30)
@@ -303,19 +755,241 @@ class GameWorld:
         self.player.move(dx, dy)
     
     def run(self):
+        profiler = self.profiler
         while True:
-            self.handle_input()
-            self.update()
-            self.draw()
+            with profiler.phase('input'):
+                self.handle_input()
+            with profiler.phase('update'):
+                self.update()
+            with profiler.phase('draw'):
+                self.draw()
             
-            if cv2.waitKey(30) == 27:  # ESC para salir
+            with profiler.phase('input'):
+                key = cv2.waitKey(30)
+            if key == 27:  # ESC para salir
+                profiler.close()
                 self.save_npcs_to_db()
-                if self.db_connection:
-                    self.db_connection.close()
+                self.close_database()
                 break
+            profiler.frame()
         
         cv2.destroyAllWindows()
 
+class VectorizedGameWorld(GameWorld):
+    """GameWorld con el estado de los NPCs en columnas NumPy, actualizado por lotes.
+    
+    `self.npcs` es una secuencia de NPCView, así que dibujar, guardar y el
+    bucle principal funcionan igual. En cada tick un StateMachine descuenta
+    todos los temporizadores a la vez y sortea el siguiente estado de los
+    que expiran según `transitions` (por defecto cualquier estado por igual,
+    como NPC.change_state), dado como {estado: {siguiente: peso}} o como
+    matriz 4x4 sobre STATES. Después cada estado mueve solo sus filas.
+    
+    Con la misma semilla los NPCs nacen igual que los objetos NPC: nombres,
+    posiciones, colores, velocidades, áreas, estados, temporizadores y
+    destinos salen de los sorteos 0, 1, ... de los mismos flujos (ver
+    rng.py). A partir del primer tick el resultado difiere del de
+    GameWorld: cada NPC reacciona a dónde estaban los demás al empezar el
+    tick y no a dónde ya se han movido los anteriores de la lista, y los
+    sorteos van por tick en vez de uno tras otro.
+    """
+    def __init__(self, width=1000, height=800, headless=False, batched=False, storage=None, seed=None,
+                 profiler=None, transitions=None, capacity=1024):
+        self.capacity = capacity
+        self.machine = StateMachine(STATES, transitions, durations=(60, 180))
+        self._areas = None  # (versión, rects, índices por tipo), ver area_tables
+        super().__init__(width, height, headless, batched, storage, seed, profiler)
+    
+    def reset_npcs(self):
+        self.population = NPCPopulation(self.capacity)
+        self.npcs = self.population
+    
+    def rebuild_grid(self):
+        pass  # los vecinos salen de las columnas en cada tick
+    
+    def spawn(self, ids, names, x, y, direction=0.0, speed=None, state=None, work_area=None, home_area=None):
+        """Añade NPCs sorteando lo que NPC.__init__, en su orden, de los sorteos 0, 1, ... de sus flujos"""
+        ids = np.asarray(ids, dtype=np.int64)
+        streams = self.streams
+        color = np.stack([streams.integers(50, 201, ids, k) for k in (0, 1, 2)], axis=1)
+        k = 3
+        if speed is None:
+            speed = streams.uniform(1.0, 3.0, ids, k)
+            k += 1
+        if work_area is None or home_area is None:
+            # Como assign_areas: 30% comercial, 30% industrial, 20% recreativa, 20% rural
+            work_types = np.array([AREA_TYPES.index(t) for t in (AreaType.COMERCIAL, AreaType.INDUSTRIAL,
+                                                                AreaType.RECREATIVA, AreaType.RURAL)])
+            work_area = work_types[np.searchsorted([0.3, 0.6, 0.8], streams.random(ids, k), side='right')]
+            home_area = np.where(streams.random(ids, k + 1) < 0.7, AREA_TYPES.index(AreaType.RESIDENCIAL),
+                                 AREA_TYPES.index(AreaType.RURAL))
+            k += 2
+        if state is None:
+            state = streams.integers(0, len(STATES), ids, k)
+            k += 1
+        self.population.add_many(names, ids=ids, x=x, y=y, direction=direction, speed=speed, color=color,
+                                 state=state, state_timer=streams.integers(60, 181, ids, k),
+                                 work_area=work_area, home_area=home_area)
+    
+    def load_npcs_from_db(self):
+        if not self.storage:
+            return
+        
+        try:
+            for rows in self.storage.load_chunks():
+                self.saved.mark_saved(rows)
+                ids, x, y, names, direction, speed, state, work_area, home_area = zip(*rows)
+                self.spawn(ids, list(names), x, y, direction, speed, STATE_CODES[list(state)],
+                           AREA_CODES[list(work_area)], AREA_CODES[list(home_area)])
+            if self.npcs:
+                self.next_npc_id = max(self.next_npc_id, int(self.population.ids[:len(self.npcs)].max()) + 1)
+        except StorageError as e:
+            print(f"Error loading NPCs: {e}")
+    
+    def npc_rows(self):
+        p = self.population
+        n = p.size
+        names = p.name_table.decode_many(p.name_code[:n], p.name_number[:n])
+        return zip(p.ids[:n].tolist(), p.x[:n].tolist(), p.y[:n].tolist(), names,
+                   p.direction[:n].tolist(), p.speed[:n].tolist(), STATE_VALUES[p.state[:n]].tolist(),
+                   AREA_VALUES[p.work_area[:n]].tolist(), AREA_VALUES[p.home_area[:n]].tolist())
+    
+    def checkpoint_records(self):
+        p = self.population
+        n = p.size
+        records = np.empty(n, dtype=CHECKPOINT_DTYPE)
+        records['id'] = p.ids[:n]
+        for name in ('x', 'y', 'direction', 'speed', 'color', 'state_timer', 'target_area', 'target_x', 'target_y'):
+            records[name] = getattr(p, name)[:n]
+        records['state'] = STATE_VALUES[p.state[:n]]
+        records['work_area'] = AREA_VALUES[p.work_area[:n]]
+        records['home_area'] = AREA_VALUES[p.home_area[:n]]
+        # Un destino de otra versión del mapa se replanifica igual que en GameWorld
+        records['target_area'][p.target_version[:n] != self.game_map.version] = -1
+        records['rng_counter'] = 0  # los sorteos van por tick, no por posición en el flujo
+        return records, p.name_table.decode_many(p.name_code[:n], p.name_number[:n])
+    
+    def add_records(self, records, names):
+        target_area = records['target_area']
+        self.population.add_many(names, ids=records['id'], x=records['x'], y=records['y'],
+                                 direction=records['direction'], speed=records['speed'], color=records['color'],
+                                 state=STATE_CODES[records['state']], state_timer=records['state_timer'],
+                                 work_area=AREA_CODES[records['work_area']],
+                                 home_area=AREA_CODES[records['home_area']], target_area=target_area,
+                                 target_version=np.where(target_area >= 0, self.game_map.version, -1),
+                                 target_x=records['target_x'], target_y=records['target_y'])
+    
+    def create_initial_npcs(self, count):
+        names = ["Alex", "Sam", "Taylor", "Jordan", "Casey"]
+        # El flujo del mundo saca nombre, x e y por NPC, en ese orden, como GameWorld
+        counters = np.arange(self.rng.counter, self.rng.counter + 3 * count, dtype=np.uint64).reshape(count, 3)
+        self.rng.counter += 3 * count
+        streams = self.streams
+        table = self.population.name_table
+        codes = np.array([table.intern(name) for name in names], dtype=CODE_DTYPE)
+        picks = streams.integers(0, len(names), WORLD_STREAM, counters[:, 0])
+        x = streams.integers(0, self.game_map.width + 1, WORLD_STREAM, counters[:, 1])
+        y = streams.integers(0, self.game_map.height + 1, WORLD_STREAM, counters[:, 2])
+        ids = np.arange(self.next_npc_id, self.next_npc_id + count)
+        self.next_npc_id += count
+        self.spawn(ids, (codes[picks], np.arange(1, count + 1, dtype=NUMBER_DTYPE)), x, y)
+        self.save_npcs_to_db()
+    
+    def area_tables(self):
+        """(rects, índices de área por código de AreaType) del mapa actual"""
+        game_map = self.game_map
+        if self._areas is None or self._areas[0] != game_map.version:
+            rects = np.array([area['rect'] for area in game_map.areas], dtype=np.int64).reshape(-1, 4)
+            by_type = [np.array([i for i, area in enumerate(game_map.areas) if area['type'] is area_type],
+                                dtype=np.int64) for area_type in AREA_TYPES]
+            self._areas = (game_map.version, rects, by_type)
+        return self._areas[1], self._areas[2]
+    
+    def plan_targets(self, rows, tick, new_area=True):
+        """plan_target para varias filas a la vez"""
+        p = self.population
+        streams = self.streams
+        ids = p.ids[rows]
+        rects, by_type = self.area_tables()
+        if new_area:
+            # Candidatas como en get_target_area; código len(AREA_TYPES) = cualquier área
+            anywhere = len(AREA_TYPES)
+            state = p.state[rows]
+            kind = np.full(len(rows), anywhere)
+            kind[state == WORKING] = p.work_area[rows][state == WORKING]
+            kind[state == RESTING] = p.home_area[rows][state == RESTING]
+            kind[state == SOCIALIZING] = AREA_TYPES.index(AreaType.RECREATIVA)
+            every_area = np.arange(len(rects))
+            areas = np.empty(len(rows), dtype=np.int64)
+            for code in np.unique(kind):
+                chosen = np.flatnonzero(kind == code)
+                candidates = by_type[code] if code < anywhere and len(by_type[code]) else every_area
+                areas[chosen] = candidates[streams.integers(0, len(candidates), ids[chosen], tick, draw=7)]
+            p.target_area[rows] = areas
+            p.target_version[rows] = self.game_map.version
+        x1, y1, x2, y2 = rects[p.target_area[rows]].T
+        lanes = (5, 6) if new_area else (8, 9)
+        p.target_x[rows] = streams.integers(x1, x2 + 1, ids, tick, draw=lanes[0])
+        p.target_y[rows] = streams.integers(y1, y2 + 1, ids, tick, draw=lanes[1])
+    
+    def update(self):
+        mouse_x, mouse_y = self.mouse_pos
+        self.player.direction = math.atan2(mouse_y - self.player.y, mouse_x - self.player.x)
+        
+        p = self.population
+        n = p.size
+        ids, x, y, direction, speed = p.ids[:n], p.x[:n], p.y[:n], p.direction[:n], p.speed[:n]
+        start_x, start_y = x.copy(), y.copy()  # donde estaba cada NPC al empezar el tick
+        tick = self.ticks
+        
+        with self.profiler.phase('state'):
+            expired = self.machine.step(p.state[:n], p.state_timer[:n], ids, self.streams, tick)
+            p.target_area[expired] = -1  # se replanifica abajo
+        
+        # Solo se replanifica al cambiar de estado o si el mapa cambió
+        stale = np.flatnonzero((p.target_area[:n] < 0) | (p.target_version[:n] != self.game_map.version))
+        if len(stale):
+            with self.profiler.phase('target'):
+                self.plan_targets(stale, tick)
+        
+        arrived = []
+        for code, rows in self.machine.groups(p.state[:n]):
+            to_x, to_y = p.target_x[rows], p.target_y[rows]
+            stop = np.full(len(rows), 10.0)
+            own = np.ones(len(rows), dtype=bool)
+            if code == SOCIALIZING:
+                # Socializando: acercarse al vecino más cercano
+                peers = nearest_within(start_x, start_y, SOCIAL_RADIUS, rows)
+                social = peers >= 0
+                to_x[social] = start_x[peers[social]]
+                to_y[social] = start_y[peers[social]]
+                stop[social] = NPCView.size * 2.5
+                own = ~social
+            dx = to_x - x[rows]
+            dy = to_y - y[rows]
+            going = np.sqrt(dx*dx + dy*dy) > stop
+            moving = rows[going]
+            direction[moving] = np.arctan2(dy[going], dx[going])
+            x[moving] += np.cos(direction[moving]) * speed[moving]
+            y[moving] += np.sin(direction[moving]) * speed[moving]
+            arrived.append(rows[~going & own])
+        
+        # Llegó: nuevo punto dentro de la misma área
+        arrived = np.concatenate(arrived) if arrived else np.zeros(0, dtype=np.int64)
+        if len(arrived):
+            with self.profiler.phase('target'):
+                self.plan_targets(arrived, tick, new_area=False)
+        
+        # Evitar colisiones con otros NPCs
+        push_x, push_y = separation_many(x, y, ids, NPCView.size * 2)
+        np.clip(x + push_x, 0, self.game_map.width, out=x)
+        np.clip(y + push_y, 0, self.game_map.height, out=y)
+        
+        self.ticks += 1
+        if self.ticks % 300 == 0:
+            with self.profiler.phase('db'):
+                self.save_npcs_to_db()
+
 if __name__ == "__main__":
     game = GameWorld(1200, 800)
     game.run()
@@ -0,0 +1,9 @@
+"""Put the repository root on sys.path, so the benchmarks can import its modules and scripts."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from scripts import load_script  # noqa: E402  (needs ROOT on sys.path)
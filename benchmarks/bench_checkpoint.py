@@ -0,0 +1,46 @@
+"""Binary checkpoints of VectorizedNPCSimulator: save, open (memory-mapped) and full restore.
+
+Usage: python benchmarks/bench_checkpoint.py [--npcs 1000000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import _scripts  # noqa: F401  (only for its side effect: the repository root on sys.path, for the imports below)
+from checkpoint import Checkpoint
+from sandybrown import VectorizedNPCSimulator
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--npcs', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    simulator = VectorizedNPCSimulator(20000, 16000, seed=args.seed)
+    simulator.create_npc_set(args.npcs)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'world.ckpt')
+        _, save = timed(simulator.save_checkpoint, path)
+        checkpoint, open_time = timed(Checkpoint, path)
+        _, inspect = timed(lambda: float(checkpoint.records['x'].mean()))
+        checkpoint.close()
+        restored = VectorizedNPCSimulator(20000, 16000)
+        _, restore = timed(restored.load_checkpoint, path)
+        assert restored.population.size == args.npcs
+        print(f"{args.npcs} NPCs, {os.path.getsize(path) / 2**20:.1f} MiB")
+        print(f"  save:              {save * 1000:8.1f} ms")
+        print(f"  open (mmap):       {open_time * 1000:8.2f} ms")
+        print(f"  mean x via mmap:   {inspect * 1000:8.1f} ms")
+        print(f"  restore into sim:  {restore * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Cold start of 004-areas.py from a saved table: fetchall + NPC() vs streamed NPC.from_row.
+
+Usage: python benchmarks/bench_load.py [--rows 100000] [--chunk 1000]
+
+The table lives in a temporary SQLite file. Peak memory is measured with
+tracemalloc, so the times include its overhead.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from _scripts import load_script
+
+areas = load_script('004-areas.py')
+from storage import SQLiteStorage
+
+
+def fill(storage, count, rng):
+    storage.replace(
+        (i, rng.uniform(0, 1000), rng.uniform(0, 800), f"NPC_{i}", rng.uniform(0, 6.28), rng.uniform(1, 3),
+         rng.randint(1, 4), rng.randint(1, 5), rng.choice((1, 5)))
+        for i in range(1, count + 1))
+
+
+def load_fetchall(storage, chunk_size):
+    """The loader before streaming: every row at once, random init then overwritten"""
+    npcs = []
+    for npc_id, x, y, name, direction, speed, state, work_area, home_area in storage.load():
+        npc = areas.NPC(x, y, npc_id, name)
+        npc.direction = direction
+        npc.speed = speed
+        npc.state = areas.NPCState(state)
+        npc.work_area = areas.AreaType(work_area)
+        npc.home_area = areas.AreaType(home_area)
+        npcs.append(npc)
+    return npcs
+
+
+def load_streamed(storage, chunk_size):
+    npcs = []
+    for rows in storage.load_chunks(chunk_size):
+        npcs.extend(areas.NPC.from_row(row) for row in rows)
+    return npcs
+
+
+def measure(loader, storage, chunk_size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    npcs = loader(storage, chunk_size)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(npcs), seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--chunk', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(areas.NPC_TABLE, os.path.join(directory, 'load.db'))
+        fill(storage, args.rows, random.Random(args.seed))
+        print(f"{args.rows} rows, chunks of {args.chunk}")
+        for label, loader in (("fetchall + NPC()", load_fetchall), ("streamed from_row", load_streamed)):
+            count, seconds, peak = measure(loader, storage, args.chunk)
+            assert count == args.rows
+            print(f"  {label:<18} {seconds:6.2f} s  peak {peak / 2**20:7.1f} MiB")
+        storage.close()
+
+
+if __name__ == '__main__':
+    main()
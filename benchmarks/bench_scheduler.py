@@ -0,0 +1,61 @@
+"""Per-tick GameWorld.update cost with and without time-sliced NPC decisions.
+
+Usage: python benchmarks/bench_scheduler.py [--script 004-areas.py] [--npcs 5000] [--ticks 100]
+                                            [--slices 8] [--budget 4] [--near 200]
+
+Runs the same seeded world three times: every NPC thinking every tick,
+round-robin over --slices ticks, and round-robin with a --budget of
+milliseconds of decisions per tick (NPCs within --near of the player
+first). Reports p50/p99/max tick time and decisions per tick.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from _scripts import load_script
+from scheduler import AIScheduler
+
+
+def run(module, scheduler, args):
+    world = module.GameWorld(args.width, args.height, headless=True, storage='memory', seed=args.seed,
+                             scheduler=scheduler)
+    world.create_initial_npcs(args.npcs - len(world.npcs))
+    world.update()  # warm-up
+    times = []
+    decisions = []
+    for _ in range(args.ticks):
+        start = time.perf_counter()
+        world.update()
+        times.append(time.perf_counter() - start)
+        decisions.append(scheduler.thought if scheduler else len(world.npcs))
+    return np.array(times) * 1000, np.mean(decisions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--script', default='004-areas.py', choices=['003-personaje principal.py', '004-areas.py'])
+    parser.add_argument('--npcs', type=int, default=5000)
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--width', type=int, default=3000)
+    parser.add_argument('--height', type=int, default=2400)
+    parser.add_argument('--slices', type=int, default=8)
+    parser.add_argument('--budget', type=float, default=4.0, help="milliseconds of decisions per tick")
+    parser.add_argument('--near', type=float, default=200.0, help="radius around the player that thinks every tick")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    module = load_script(args.script)
+    print(f"{args.script}: {args.npcs} NPCs, {args.ticks} ticks")
+    for label, scheduler in (('every tick', None),
+                             (f'{args.slices} slices', AIScheduler(args.slices)),
+                             (f'{args.slices} slices, {args.budget:g} ms',
+                              AIScheduler(args.slices, args.budget, args.near))):
+        times, decisions = run(module, scheduler, args)
+        p50, p99 = np.percentile(times, [50, 99])
+        print(f"  {label:<22} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  max {times.max():8.2f} ms"
+              f"  {decisions:8.0f} decisions/tick")
+
+
+if __name__ == '__main__':
+    main()
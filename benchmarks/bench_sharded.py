@@ -0,0 +1,58 @@
+"""Sharded simulation: ticks/sec of ShardedSimulation per worker count vs the single-process update.
+
+Usage: python benchmarks/bench_sharded.py [--npcs 1000000] [--ticks 20] [--workers 1 2 4 8] [--min-dist 10]
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+import _scripts  # noqa: F401  (only for its side effect: the repository root on sys.path, for the imports below)
+from sandybrown import VectorizedNPCSimulator
+from sharded import ShardedSimulation
+
+
+def make_simulator(npcs, seed, min_dist):
+    simulator = VectorizedNPCSimulator(20000, 16000, seed=seed, min_dist=min_dist)
+    simulator.create_npc_set(npcs)
+    return simulator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--npcs', type=int, default=1000000)
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="worker counts to try (default: powers of two up to the core count)")
+    parser.add_argument('--min-dist', type=float, default=None, help="also run the separation step")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    workers = args.workers
+    if workers is None:
+        cores = multiprocessing.cpu_count()
+        workers = [1 << i for i in range(cores.bit_length()) if 1 << i <= cores]
+
+    reference = make_simulator(args.npcs, args.seed, args.min_dist)
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        reference.update()
+    single = args.ticks / (time.perf_counter() - start)
+    print(f"{args.npcs} NPCs, {args.ticks} ticks, {multiprocessing.cpu_count()} cores")
+    print(f"  single process: {single:8.2f} ticks/sec")
+
+    for count in workers:
+        simulator = make_simulator(args.npcs, args.seed, args.min_dist)
+        with ShardedSimulation.from_simulator(simulator, count) as sharded:
+            sharded.run(1)  # warm-up: workers attached, pages touched
+            start = time.perf_counter()
+            sharded.run(args.ticks - 1)
+            rate = (args.ticks - 1) / (time.perf_counter() - start)
+            sharded.store(simulator)
+        same = np.array_equal(simulator.population.x, reference.population.x)
+        print(f"  {count:3d} workers:    {rate:8.2f} ticks/sec  {rate / single:5.2f}x"
+              f"  {'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Neighbour queries: SpatialGrid against a brute-force O(n^2) scan.
+
+Usage: python benchmarks/bench_spatial_grid.py [--radius 100] [--sizes 250 500 ...]
+"""
+import argparse
+import random
+import time
+
+import _scripts  # noqa: F401  (only for its side effect: the repository root on sys.path, for the imports below)
+from spatial import SpatialGrid
+
+
+class Point:
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def brute_force(points, radius):
+    radius_sq = radius * radius
+    total = 0
+    for p in points:
+        for q in points:
+            if q is not p and (q.x - p.x) ** 2 + (q.y - p.y) ** 2 <= radius_sq:
+                total += 1
+    return total
+
+
+def with_grid(points, radius):
+    grid = SpatialGrid(cell_size=radius)
+    grid.rebuild(points)
+    return sum(len(grid.query_radius(p.x, p.y, radius, exclude=p)) for p in points)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--radius', type=float, default=100)
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--height', type=int, default=800)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000, 2000, 4000])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Keep density constant so the grid's per-query cost stays flat
+    base_area = args.width * args.height
+    print(f"{'npcs':>8} {'brute ms':>10} {'grid ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        rng = random.Random(args.seed)
+        scale = (n / args.sizes[0]) ** 0.5
+        w, h = args.width * scale, args.height * scale
+        points = [Point(rng.uniform(0, w), rng.uniform(0, h)) for _ in range(n)]
+        brute_pairs, brute_time = timed(brute_force, points, args.radius)
+        grid_pairs, grid_time = timed(with_grid, points, args.radius)
+        assert brute_pairs == grid_pairs, (brute_pairs, grid_pairs)
+        print(f"{n:>8} {brute_time * 1000:>10.1f} {grid_time * 1000:>10.1f} {brute_time / grid_time:>7.1f}x")
+    print(f"(world area grows with n from {base_area} px^2 to keep density constant)")
+
+
+if __name__ == '__main__':
+    main()
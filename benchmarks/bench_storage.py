@@ -0,0 +1,80 @@
+"""Persistence cost per storage backend: full replace, dirty-row upsert and load.
+
+Usage: python benchmarks/bench_storage.py [--rows 10000] [--dirty 0.1] [--backends memory sqlite mysql]
+
+SQLite runs on a temporary file (WAL). MySQL is skipped if the server
+cannot be reached.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import _scripts  # noqa: F401  (only for its side effect: the repository root on sys.path, for the imports below)
+from storage import MemoryStorage, MySQLStorage, SQLiteStorage, StorageError, Table
+
+BENCH_TABLE = Table('npc_bench', (
+    ('id', 'INT'),
+    ('x', 'FLOAT NOT NULL'),
+    ('y', 'FLOAT NOT NULL'),
+    ('name', 'VARCHAR(255) NOT NULL'),
+    ('direction', 'FLOAT NOT NULL'),
+    ('speed', 'FLOAT NOT NULL'),
+))
+
+
+def make_rows(count, rng):
+    return [(i, rng.uniform(0, 1000), rng.uniform(0, 800), f"NPC_{i}", rng.uniform(0, 6.28), rng.uniform(0.5, 3))
+            for i in range(1, count + 1)]
+
+
+def open_backend(kind, directory, batch_size):
+    if kind == 'memory':
+        return MemoryStorage(BENCH_TABLE, batch_size)
+    if kind == 'sqlite':
+        return SQLiteStorage(BENCH_TABLE, os.path.join(directory, 'bench.db'), batch_size)
+    if kind == 'mysql':
+        return MySQLStorage(BENCH_TABLE, batch_size=batch_size)
+    raise ValueError(kind)
+
+
+def timed_ms(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--dirty', type=float, default=0.1, help="fraction of rows changed per flush")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--backends', nargs='+', default=['memory', 'sqlite', 'mysql'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = make_rows(args.rows, rng)
+    dirty = [(row[0], row[1] + 1, row[2] + 1) + row[3:] for row in rng.sample(rows, int(len(rows) * args.dirty))]
+
+    print(f"{args.rows} rows, {len(dirty)} dirty per flush")
+    print(f"{'backend':>8} {'replace ms':>11} {'upsert ms':>10} {'load ms':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in args.backends:
+            try:
+                storage = open_backend(kind, directory, args.batch_size)
+            except StorageError as e:
+                print(f"{kind:>8}  skipped ({e})")
+                continue
+            replace = timed_ms(storage.replace, rows)
+            upsert = timed_ms(storage.write, dirty)
+            load = timed_ms(storage.load)
+            assert len(storage.load()) == len(rows)
+            storage.clear()
+            storage.close()
+            print(f"{kind:>8} {replace:>11.1f} {upsert:>10.1f} {load:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""Benchmark suite: ticks/sec, render time, memory per NPC and save/load throughput as JSON.
+
+Usage: python benchmarks/bench_suite.py [--targets sandybrown vectorized 003 004 003-vectorized 004-vectorized]
+                                        [--sizes 100 1000 ...]
+                                        [--output results.json] [--baseline baseline.json] [--tolerance 0.1]
+
+Every world is built headless with a fixed seed. Per target and size the
+suite runs up to --ticks updates and --frames renders, each stopping early
+after --budget seconds (but running at least once). Memory per NPC is the
+tracemalloc size of the populated world, counted from before it is built,
+minus that of an empty one, both after a throwaway warm-up world with a
+few NPCs; column-based worlds start at capacity 1 so their columns grow
+with the NPCs. 003 and 004 persist to a temporary SQLite file standing
+in for MySQL; every target also saves and loads a binary checkpoint (the
+fastest of --repeat runs).
+
+Sizes above a target's limit (the object-per-NPC worlds cannot tick a
+million NPCs) are skipped unless --max-npcs raises it.
+
+With --baseline the results are compared metric by metric against an
+earlier --output file: regressions beyond --tolerance are listed and the
+exit status is 1, so a run can gate a change.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from _scripts import ROOT, load_script
+
+WIDTH, HEIGHT = 1000, 800
+SIZES = (100, 1000, 10000, 100000, 1000000)
+
+# target -> (script, largest default size)
+TARGETS = {
+    'sandybrown': ('sandybrown.py', 100000),
+    'vectorized': ('sandybrown.py', 1000000),
+    '003': ('003-personaje principal.py', 10000),
+    '004': ('004-areas.py', 10000),
+    '003-vectorized': ('003-personaje principal.py', 100000),
+    '004-vectorized': ('004-areas.py', 100000),
+}
+
+# metric -> +1 if higher is better, -1 if lower is better
+METRICS = {
+    'ticks_per_sec': 1,
+    'render_ms': -1,
+    'bytes_per_npc': -1,
+    'db_save_rows_per_sec': 1,
+    'db_load_rows_per_sec': 1,
+    'checkpoint_save_rows_per_sec': 1,
+    'checkpoint_load_rows_per_sec': 1,
+}
+
+
+def measure(func, count, budget):
+    """Seconds per call of func(), over up to `count` calls or `budget` seconds"""
+    start = time.perf_counter()
+    done = 0
+    while done < count:
+        func()
+        done += 1
+        if time.perf_counter() - start >= budget:
+            break
+    return (time.perf_counter() - start) / done
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def best(func, repeat, *args):
+    """Fastest of `repeat` calls of func(*args), in seconds"""
+    return min(timed(func, *args)[1] for _ in range(repeat))
+
+
+def build(target, seed, storage=None, capacity=1024):
+    """(world, populate(count), render()) for a target, with as few NPCs as it allows.
+
+    `capacity` is the initial column size of the column-based worlds.
+    """
+    module = load_script(TARGETS[target][0])
+    if target == 'sandybrown':
+        world = module.NPCSimulator(WIDTH, HEIGHT, seed=seed)
+        return world, world.create_npc_set, world.draw
+    if target == 'vectorized':
+        world = module.VectorizedNPCSimulator(WIDTH, HEIGHT, capacity=capacity, seed=seed, view_size=(WIDTH, HEIGHT))
+        return world, world.create_npc_set, world.draw
+    if target.endswith('-vectorized'):
+        world = module.VectorizedGameWorld(WIDTH, HEIGHT, headless=True, storage=storage, seed=seed, capacity=capacity)
+    else:
+        world = module.GameWorld(WIDTH, HEIGHT, headless=True, storage=storage, seed=seed)
+    return world, world.create_initial_npcs, world.render
+
+
+def close(world):
+    """Release a world's database connection and worker threads, if it has them"""
+    if getattr(world, 'persistence', None) is not None:
+        world.close_database()
+    if hasattr(world, 'close'):
+        world.close()
+
+
+def allocated(target, seed, storage, npcs=0):
+    """(world, populate, render, bytes traced from before the build) with `npcs` NPCs in it"""
+    tracemalloc.start()
+    world, populate, render = build(target, seed, storage, capacity=1)
+    populate(max(npcs - len(world.npcs), 0))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return world, populate, render, size
+
+
+def run_target(target, npcs, args, directory):
+    def sqlite(name):
+        return f"sqlite:{os.path.join(directory, f'{target}-{npcs}{name}.db')}"
+    storage = sqlite('')
+    result = {'target': target, 'npcs': npcs}
+
+    # Caches filled by the first build and the first NPCs stay out of both sizes
+    warm, populate, _ = build(target, args.seed, sqlite('-warm'), capacity=1)
+    populate(min(npcs, 100))
+    close(warm)
+    del warm
+    empty, _, _, empty_size = allocated(target, args.seed, sqlite('-empty'))
+    added = npcs - len(empty.npcs)
+    close(empty)
+    del empty
+    world, populate, render, size = allocated(target, args.seed, storage, npcs)
+    result['bytes_per_npc'] = (size - empty_size) / max(added, 1)
+
+    world.update()  # warm-up
+    per_tick = measure(world.update, args.ticks, args.budget)
+    result['ticks_per_sec'] = 1 / per_tick
+    result['render_ms'] = measure(render, args.frames, args.budget) * 1000
+
+    persistence = getattr(world, 'persistence', None)
+    if persistence is not None:
+        persistence.flush()  # the initial population
+        start = time.perf_counter()
+        queued = world.save_npcs_to_db()
+        persistence.flush()
+        result['db_save_rows_per_sec'] = queued / (time.perf_counter() - start)
+        fresh, seconds = timed(build, target, args.seed, storage)
+        result['db_load_rows_per_sec'] = len(fresh[0].npcs) / seconds
+        close(fresh[0])
+
+    path = os.path.join(directory, f'{target}-{npcs}.ckpt')
+    result['checkpoint_save_rows_per_sec'] = len(world.npcs) / best(world.save_checkpoint, args.repeat, path)
+    result['checkpoint_load_rows_per_sec'] = len(world.npcs) / best(world.load_checkpoint, args.repeat, path)
+    close(world)
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of every metric against the baseline; return the regressions"""
+    old = {(r['target'], r['npcs']): r for r in baseline['results']}
+    regressions = []
+    print(f"Compared with {baseline['environment'].get('commit') or 'baseline'}:")
+    for result in results:
+        previous = old.get((result['target'], result['npcs']))
+        if previous is None:
+            continue
+        for metric, sign in METRICS.items():
+            if not previous.get(metric) or metric not in result:
+                continue
+            change = (result[metric] / previous[metric] - 1) * sign  # > 0 is better
+            flag = ''
+            if change < -tolerance:
+                flag = '  REGRESSION'
+                regressions.append((result['target'], result['npcs'], metric, change))
+            print(f"  {result['target']:<14} {result['npcs']:>8} {metric:<30} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--max-npcs', type=int, default=None, help="override every target's size limit")
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=10.0, help="seconds per measurement at most")
+    parser.add_argument('--repeat', type=int, default=3, help="checkpoint save/load runs, the fastest counts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="write the results here as JSON")
+    parser.add_argument('--baseline', default=None, help="JSON from an earlier --output to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed slowdown per metric (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for target in args.targets:
+            limit = args.max_npcs or TARGETS[target][1]
+            for npcs in args.sizes:
+                if npcs > limit:
+                    continue
+                result = run_target(target, npcs, args, directory)
+                results.append(result)
+                print(f"{target:<14} {npcs:>8} NPCs: {result['ticks_per_sec']:9.1f} ticks/s"
+                      f"  render {result['render_ms']:8.2f} ms  {result['bytes_per_npc']:7.0f} B/NPC"
+                      f"  checkpoint {result['checkpoint_save_rows_per_sec']:10.0f} / "
+                      f"{result['checkpoint_load_rows_per_sec']:10.0f} rows/s"
+                      + (f"  db {result['db_save_rows_per_sec']:9.0f} / {result['db_load_rows_per_sec']:9.0f} rows/s"
+                         if 'db_save_rows_per_sec' in result else ''))
+
+    report = {'environment': environment(), 'settings': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
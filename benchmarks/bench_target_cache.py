@@ -0,0 +1,53 @@
+"""Per-tick NPC.update cost in 004-areas.py: re-planning every frame vs cached targets.
+
+Usage: python benchmarks/bench_target_cache.py [--npcs 10000] [--ticks 50]
+
+Neighbour queries go to an empty SpatialGrid so only target planning and
+movement are measured.
+"""
+import argparse
+import random
+import time
+
+from _scripts import load_script
+
+areas = load_script('004-areas.py')
+from spatial import SpatialGrid
+
+
+class ReplanningNPC(areas.NPC):
+    """NPC.update as it behaved before targets were cached: re-plan every tick"""
+    def update(self, npcs, game_map, grid=None):
+        self.target_area = None
+        super().update(npcs, game_map, grid)
+
+
+def per_tick_ms(npc_class, game_map, count, ticks, seed):
+    random.seed(seed)
+    npcs = [npc_class(random.uniform(0, game_map.width), random.uniform(0, game_map.height), i, f"NPC_{i}")
+            for i in range(count)]
+    grid = SpatialGrid()
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for npc in npcs:
+            npc.update(npcs, game_map, grid)
+    return (time.perf_counter() - start) / ticks * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--npcs', type=int, default=10000)
+    parser.add_argument('--ticks', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    game_map = areas.GameMap(1000, 800)
+    before = per_tick_ms(ReplanningNPC, game_map, args.npcs, args.ticks, args.seed)
+    after = per_tick_ms(areas.NPC, game_map, args.npcs, args.ticks, args.seed)
+    print(f"{args.npcs} NPCs, {args.ticks} ticks")
+    print(f"  re-plan every tick: {before:8.2f} ms/tick")
+    print(f"  cached targets:     {after:8.2f} ms/tick ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
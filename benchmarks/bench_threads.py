@@ -0,0 +1,52 @@
+"""Thread-pool update: ticks/sec of VectorizedNPCSimulator with chunked movement per thread count.
+
+Usage: python benchmarks/bench_threads.py [--npcs 1000000] [--ticks 50] [--threads 1 2 4 8] [--chunk-size 65536]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+import _scripts  # noqa: F401  (only for its side effect: the repository root on sys.path, for the imports below)
+from sandybrown import VectorizedNPCSimulator
+
+
+def ticks_per_sec(npcs, ticks, seed, **options):
+    simulator = VectorizedNPCSimulator(20000, 16000, seed=seed, **options)
+    simulator.create_npc_set(npcs)
+    simulator.update()  # warm-up: pool threads started, pages touched
+    start = time.perf_counter()
+    for _ in range(ticks):
+        simulator.update()
+    rate = ticks / (time.perf_counter() - start)
+    simulator.close()
+    return rate, simulator.population.x[:npcs].copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--npcs', type=int, default=1000000)
+    parser.add_argument('--ticks', type=int, default=50)
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help="thread counts to try (default: powers of two up to the core count)")
+    parser.add_argument('--chunk-size', type=int, default=65536)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    threads = args.threads
+    if threads is None:
+        cores = os.cpu_count()
+        threads = [1 << i for i in range(cores.bit_length()) if 1 << i <= cores]
+
+    single, reference = ticks_per_sec(args.npcs, args.ticks, args.seed)
+    print(f"{args.npcs} NPCs, {args.ticks} ticks, chunks of {args.chunk_size}, {os.cpu_count()} cores")
+    print(f"  single-threaded update: {single:8.2f} ticks/sec")
+    for count in threads:
+        rate, x = ticks_per_sec(args.npcs, args.ticks, args.seed, threads=count, chunk_size=args.chunk_size)
+        same = np.array_equal(x, reference)
+        print(f"  {count:3d} threads:            {rate:8.2f} ticks/sec  {rate / single:5.2f}x"
+              f"  {rate / single / count:5.2f}x per core  {'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Binary world checkpoints that can be memory-mapped instead of parsed.
+
+A checkpoint file holds one NumPy structured array (one record per NPC),
+a string table with the NPC names and a small JSON header:
+
+    magic      8 bytes   b'SBCKPT' + format version (uint16)
+    header     uint64 length + UTF-8 JSON: count, dtype, section offsets
+               and a free-form 'meta' dict (world size, tick, ...)
+    records    count * dtype.itemsize bytes
+    name index (count + 1) int64 byte offsets into the name blob
+    name blob  the UTF-8 names back to back
+
+Sections start on 64-byte boundaries. Opening a checkpoint only reads the
+header, so inspection tools get at the records of a million NPCs in
+constant time; the pages are read when they are touched.
+
+    save_checkpoint('world.ckpt', records, names, meta={'tick': 120})
+    with Checkpoint('world.ckpt') as checkpoint:
+        print(checkpoint.count, checkpoint.records['x'].mean(), checkpoint.name(0))
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'SBCKPT'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def encode_names(names):
+    """(offsets, blob) string table for a sequence of str"""
+    encoded = [name.encode('utf-8') for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+def save_checkpoint(path, records, names, meta=None):
+    """Write `records` (structured array) and `names` (one per record) to `path`.
+
+    The file is written next to `path` and renamed over it, so a reader
+    never sees a half-written checkpoint.
+    """
+    records = np.ascontiguousarray(records)
+    if len(names) != len(records):
+        raise ValueError(f"{len(records)} records but {len(names)} names")
+    offsets, blob = encode_names(names)
+
+    header = {
+        'count': len(records),
+        'dtype': np.lib.format.dtype_to_descr(records.dtype),
+        'meta': meta or {},
+    }
+    # The offsets depend on the header length, which depends on the offsets;
+    # reserve room for the digits first, then fill them in
+    for key in ('records_offset', 'name_offsets_offset', 'names_offset', 'names_size'):
+        header[key] = 10 ** 15
+    start = _aligned(len(MAGIC) + 2 + 8 + len(json.dumps(header).encode('utf-8')))
+    header['records_offset'] = start
+    header['name_offsets_offset'] = _aligned(start + records.nbytes)
+    header['names_offset'] = _aligned(header['name_offsets_offset'] + offsets.nbytes)
+    header['names_size'] = len(blob)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<HQ', FORMAT_VERSION, len(header_bytes)) + header_bytes)
+        for offset, data in ((header['records_offset'], records),
+                             (header['name_offsets_offset'], offsets),
+                             (header['names_offset'], blob)):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(data.view(np.uint8) if isinstance(data, np.ndarray) else data)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """Read-only view of a checkpoint file.
+
+    With `mmap=True` (the default) `records` and the string table are
+    np.memmap views of the file: nothing is parsed or copied until it is
+    used. Copy what you keep (`np.array(checkpoint.records)`) before
+    closing.
+    """
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a checkpoint")
+            version, header_size = struct.unpack('<HQ', f.read(10))
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported checkpoint version {version}")
+            header = json.loads(f.read(header_size).decode('utf-8'))
+        self.count = header['count']
+        self.dtype = np.lib.format.descr_to_dtype(header['dtype'])
+        self.meta = header['meta']
+        self.records = self._section(header['records_offset'], self.dtype, self.count, mmap)
+        self.name_offsets = self._section(header['name_offsets_offset'], np.int64, self.count + 1, mmap)
+        self.name_blob = self._section(header['names_offset'], np.uint8, header['names_size'], mmap)
+
+    def _section(self, offset, dtype, count, mmap):
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        if mmap:
+            return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+        return np.fromfile(self.path, dtype=dtype, count=count, offset=offset)
+
+    def __len__(self):
+        return self.count
+
+    def name(self, i):
+        """Name of record `i`, decoded on its own"""
+        start, end = self.name_offsets[i], self.name_offsets[i + 1]
+        return self.name_blob[start:end].tobytes().decode('utf-8')
+
+    def names(self):
+        """Every name, as a list of str"""
+        blob = self.name_blob.tobytes()
+        offsets = self.name_offsets.tolist()
+        text = blob.decode('utf-8')
+        if len(text) == len(blob):
+            # ASCII only: byte offsets are character offsets, slice the str directly
+            return [text[a:b] for a, b in zip(offsets, offsets[1:])]
+        return [blob[a:b].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+
+    def close(self):
+        """Drop the memory maps (arrays taken from them must not be used afterwards)"""
+        self.records = self.name_offsets = self.name_blob = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,148 @@
+"""Run a simulation without an OpenCV window.
+
+The runner only calls `update()`, so no HighGUI function (imshow, waitKey,
+namedWindow) is ever touched and the scripts run fine with the
+opencv-python-headless build on display-less machines.
+
+    python headless.py sandybrown.py --npcs 10000 --ticks 2000
+    python headless.py "003-personaje principal.py" --duration 30 --rate 60
+    python headless.py 004-areas.py --storage sqlite:/tmp/npcs.db --seed 42
+    python headless.py 004-areas.py --profile --trace /tmp/ticks.json
+    python headless.py 004-areas.py --npcs 5000 --ai-slices 8 --ai-budget 4 --ai-near 200
+"""
+import argparse
+import os
+import time
+
+from profiler import NULL_PROFILER, Profiler
+from scheduler import AIScheduler
+from scripts import load_script
+
+
+class HeadlessRunner:
+    """Advance a simulation as fast as possible or at a fixed tick rate"""
+    def __init__(self, world, tick_rate=None):
+        self.world = world
+        self.tick_rate = tick_rate  # ticks per second, None = unthrottled
+        self.ticks = 0
+        self.elapsed = 0.0
+
+    def run(self, ticks=None, duration=None, report_every=None):
+        """Run for `ticks` ticks and/or `duration` seconds, whichever ends first"""
+        if ticks is None and duration is None:
+            raise ValueError("give ticks, duration or both")
+
+        period = 1.0 / self.tick_rate if self.tick_rate else 0.0
+        profiler = getattr(self.world, 'profiler', NULL_PROFILER)
+        start = time.perf_counter()
+        next_tick = start
+        next_report = start + report_every if report_every else None
+        done = 0
+
+        while ticks is None or done < ticks:
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+            if period:
+                # Sleep until the tick is due; schedule from the deadline so there is no drift
+                if now < next_tick:
+                    time.sleep(next_tick - now)
+                next_tick += period
+
+            with profiler.phase('update'):
+                self.world.update()
+            profiler.frame()
+            done += 1
+
+            if next_report is not None and time.perf_counter() >= next_report:
+                elapsed = time.perf_counter() - start
+                print(f"  {done} ticks, {done / elapsed:.1f} ticks/sec")
+                next_report += report_every
+
+        self.ticks += done
+        self.elapsed += time.perf_counter() - start
+        return self.stats()
+
+    def stats(self):
+        return {
+            'ticks': self.ticks,
+            'seconds': self.elapsed,
+            'ticks_per_sec': self.ticks / self.elapsed if self.elapsed else 0.0,
+        }
+
+
+def build_world(module, width, height, npcs, vectorized=False, storage=None, seed=None, threads=None):
+    """Create the script's world without opening a window and populate it"""
+    # Only the scripts with persistence take a storage spec
+    options = {'storage': storage} if storage else {}
+    if seed is not None:
+        options['seed'] = seed
+    if hasattr(module, 'GameWorld'):
+        world_class = module.VectorizedGameWorld if vectorized else module.GameWorld
+        world = world_class(width, height, headless=True, **options)
+        missing = npcs - len(world.npcs)
+        if missing > 0:
+            world.create_initial_npcs(missing)
+        return world
+
+    simulator_class = module.NPCSimulator
+    if vectorized:
+        simulator_class = module.VectorizedNPCSimulator
+        if threads:
+            options['threads'] = threads
+    world = simulator_class(width, height, **options)
+    world.create_npc_set(npcs)
+    return world
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a simulation script without a window")
+    parser.add_argument('script', help="e.g. sandybrown.py or 004-areas.py")
+    parser.add_argument('--npcs', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=None)
+    parser.add_argument('--duration', type=float, default=None, help="seconds of wall-clock time")
+    parser.add_argument('--rate', type=float, default=None, help="target ticks per second (default: unthrottled)")
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--height', type=int, default=800)
+    parser.add_argument('--vectorized', action='store_true',
+                        help="use VectorizedNPCSimulator (sandybrown.py) or VectorizedGameWorld (003, 004)")
+    parser.add_argument('--report-every', type=float, default=None, help="print progress every N seconds")
+    parser.add_argument('--storage', default=None,
+                        help="mysql, sqlite[:path] or memory (scripts 002-004; default $SANDYBROWN_STORAGE or mysql)")
+    parser.add_argument('--threads', type=int, default=None, help="move NPCs in chunks on N threads (--vectorized)")
+    parser.add_argument('--profile', action='store_true', help="print per-phase p50/p95/p99 at the end")
+    parser.add_argument('--trace', default=None, help="also write a Chrome trace of every tick to this file")
+    parser.add_argument('--seed', type=int, default=None, help="same seed, same run (default: random)")
+    parser.add_argument('--ai-slices', type=int, default=None,
+                        help="NPCs think every N ticks in round-robin buckets (GameWorld in 003, 004)")
+    parser.add_argument('--ai-budget', type=float, default=None, help="milliseconds of NPC decisions per tick at most")
+    parser.add_argument('--ai-near', type=float, default=0.0, help="NPCs this close to the player think every tick")
+    args = parser.parse_args()
+    if args.ticks is None and args.duration is None:
+        args.ticks = 1000
+
+    module = load_script(os.path.abspath(args.script))
+    vectorized_class = 'VectorizedGameWorld' if hasattr(module, 'GameWorld') else 'VectorizedNPCSimulator'
+    if args.vectorized and not hasattr(module, vectorized_class):
+        parser.error(f"--vectorized needs sandybrown.py, 003-personaje principal.py or 004-areas.py, not {args.script}")
+    if args.storage and not hasattr(module, 'NPC_TABLE'):
+        parser.error(f"--storage needs a script with persistence (002, 003 or 004), not {args.script}")
+    world = build_world(module, args.width, args.height, args.npcs, args.vectorized,
+                        args.storage, args.seed, args.threads)
+    if args.profile or args.trace:
+        world.profiler = Profiler(trace_path=args.trace)
+    if args.ai_slices or args.ai_budget is not None or args.ai_near:
+        if args.vectorized or not hasattr(world, 'scheduler'):
+            parser.error("--ai-* options need the GameWorld of 003-personaje principal.py or 004-areas.py")
+        world.scheduler = AIScheduler(args.ai_slices or 1, args.ai_budget, args.ai_near)
+    runner = HeadlessRunner(world, args.rate)
+    stats = runner.run(args.ticks, args.duration, args.report_every)
+    getattr(world, 'profiler', NULL_PROFILER).close()
+    if hasattr(world, 'close'):
+        world.close()  # the --threads pool
+    print(f"{stats['ticks']} ticks in {stats['seconds']:.2f}s: "
+          f"{stats['ticks_per_sec']:.1f} ticks/sec with {len(world.npcs)} NPCs")
+
+
+if __name__ == '__main__':
+    main()
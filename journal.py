@@ -0,0 +1,201 @@
+"""Append-only journal of world changes, for replay and crash recovery.
+
+A journal directory holds generations of
+
+    base-<g>.ckpt   checkpoint of the world when generation g started
+    journal-<g>.log what happened after it, one record per event
+
+Records are SPAWN (new NPCs), DELETE (removed NPC ids), STATE (NPC state
+changes) and KEYFRAME (every NPC's position and direction, written every
+`keyframe_interval` ticks). Every event also carries the world's RNG
+state after it, so replaying the log on top of the base checkpoint
+re-simulates the run exactly; keyframes are applied on the way and pin
+the positions down even if something drifted.
+
+Every `compact_interval` ticks the world is checkpointed into a new
+generation and the log starts over, so replay never has to run far. The
+newest `keep` generations stay on disk, which is how far back `replay`
+can go.
+
+Each record has a CRC; a record cut short by a crash ends the log, so
+`replay(world, directory)` after a crash recovers everything up to the
+last record that made it to disk. Records are flushed to the OS at every
+keyframe (and fsynced too with sync=True).
+
+The world passed to `Journal.start` and `replay` provides:
+
+    ticks                               number of updates so far
+    update()                            advance one tick
+    save_checkpoint(path)               must store ticks and the RNG state
+    load_checkpoint(path)
+    keyframe() -> (records, meta)
+    replay_event(kind, meta, records)   apply a SPAWN/DELETE/STATE/KEYFRAME
+"""
+import glob
+import json
+import os
+import re
+import struct
+import zlib
+
+import numpy as np
+
+from checkpoint import Checkpoint
+
+MAGIC = b'SBJRNL01'
+RECORD = struct.Struct('<BqII')  # kind, tick, payload size, crc32 of payload
+
+SPAWN = 1
+DELETE = 2
+STATE = 3
+KEYFRAME = 4
+
+
+def _pack(meta, records=None):
+    """JSON meta plus an optional structured array, as one payload"""
+    if records is not None:
+        records = np.ascontiguousarray(records)
+        meta = dict(meta, dtype=np.lib.format.dtype_to_descr(records.dtype), count=len(records))
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    payload = struct.pack('<I', len(meta_bytes)) + meta_bytes
+    if records is not None:
+        payload += records.tobytes()
+    return payload
+
+
+def _unpack(payload):
+    (size,) = struct.unpack_from('<I', payload)
+    meta = json.loads(payload[4:4 + size].decode('utf-8'))
+    records = None
+    if 'dtype' in meta:
+        dtype = np.lib.format.descr_to_dtype(meta.pop('dtype'))
+        records = np.frombuffer(payload, dtype=dtype, count=meta.pop('count'), offset=4 + size)
+    return meta, records
+
+
+def generations(directory):
+    """[(generation, checkpoint path, log path)] in the directory, oldest first"""
+    found = []
+    for path in glob.glob(os.path.join(directory, 'base-*.ckpt')):
+        match = re.fullmatch(r'base-(\d+)\.ckpt', os.path.basename(path))
+        if match:
+            g = int(match.group(1))
+            found.append((g, path, os.path.join(directory, f'journal-{g}.log')))
+    return sorted(found)
+
+
+def read_log(path):
+    """Yield (kind, tick, meta, records) for every intact record in a log file"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, tick, size, crc = RECORD.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                return  # torn or corrupt tail: everything after it is lost
+            meta, records = _unpack(payload)
+            yield kind, tick, meta, records
+
+
+class Journal:
+    """Writes the journal of one world; see the module docstring"""
+    def __init__(self, directory, keyframe_interval=300, compact_interval=3000, keep=2, sync=False):
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.compact_interval = compact_interval
+        self.keep = keep
+        self.sync = sync
+        self.file = None
+        self.base_tick = 0
+        existing = generations(directory) if os.path.isdir(directory) else []
+        self.generation = existing[-1][0] if existing else 0
+        self.records_written = 0
+        self.bytes_written = 0
+
+    def start(self, world):
+        """Begin a new generation from the world as it is now"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.compact(world)
+
+    def append(self, kind, tick, meta, records=None):
+        payload = _pack(meta, records)
+        self.file.write(RECORD.pack(kind, tick, len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.records_written += 1
+        self.bytes_written += RECORD.size + len(payload)
+
+    def flush(self):
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def tick(self, world):
+        """Call after every update: writes keyframes and compacts when due"""
+        if world.ticks - self.base_tick >= self.compact_interval:
+            self.compact(world)
+        elif world.ticks % self.keyframe_interval == 0:
+            records, meta = world.keyframe()
+            self.append(KEYFRAME, world.ticks, meta, records)
+            self.flush()
+
+    def compact(self, world):
+        """Checkpoint the world into a new generation and start an empty log for it"""
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+        self.generation += 1
+        # The checkpoint is complete (renamed into place) before its log exists
+        world.save_checkpoint(os.path.join(self.directory, f'base-{self.generation}.ckpt'))
+        self.base_tick = world.ticks
+        self.file = open(os.path.join(self.directory, f'journal-{self.generation}.log'), 'wb')
+        self.file.write(MAGIC)
+        self.flush()
+        for g, checkpoint_path, log_path in generations(self.directory)[:-self.keep]:
+            os.remove(checkpoint_path)
+            if os.path.exists(log_path):
+                os.remove(log_path)
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+def replay(world, directory, tick=None):
+    """Rebuild the world as it was right after its `tick`-th update and return it.
+
+    Events journaled at `tick` itself happened after that update and are
+    not applied; with tick=None everything in the journal is. Starts from
+    the newest base checkpoint at or before `tick`.
+    """
+    candidates = []
+    for g, checkpoint_path, log_path in generations(directory):
+        with Checkpoint(checkpoint_path) as checkpoint:
+            base_tick = checkpoint.meta['ticks']
+        if tick is None or base_tick <= tick:
+            candidates.append((checkpoint_path, log_path))
+    if not candidates:
+        raise ValueError(f"no checkpoint in {directory} at or before tick {tick}")
+    checkpoint_path, log_path = candidates[-1]
+
+    journal, world.journal = getattr(world, 'journal', None), None  # don't journal the replay
+    try:
+        world.load_checkpoint(checkpoint_path)
+        for kind, event_tick, meta, records in read_log(log_path):
+            if tick is not None and event_tick >= tick:
+                break
+            while world.ticks < event_tick:
+                world.update()
+            world.replay_event(kind, meta, records)
+        while tick is not None and world.ticks < tick:
+            world.update()
+    finally:
+        world.journal = journal
+    return world
@@ -0,0 +1,66 @@
+"""Interned NPC names: two small integers per NPC instead of a string.
+
+Generated names are a base and a number, "Warrior_17". A NameTable keeps
+every distinct base once and an NPC stores (code, number): the base's
+index in the table and the number, or -1 for a name without a number
+suffix, which is then interned whole.
+
+    table = NameTable()
+    codes, numbers = table.encode(["Mage_1", "Mage_2", "Bob"])  # [0, 0, 1], [1, 2, -1]
+    table.decode(codes[1], numbers[1])                         # 'Mage_2'
+
+Only canonical numbers (no sign, no leading zeros, below 2**31) are
+split off, so decode(*encode(name)) always gives the name back.
+"""
+import numpy as np
+
+CODE_DTYPE = np.uint32
+NUMBER_DTYPE = np.int32
+NO_NUMBER = -1
+_MAX_NUMBER = np.iinfo(NUMBER_DTYPE).max
+
+
+class NameTable:
+    """Distinct name bases, each stored once; see the module docstring"""
+    def __init__(self):
+        self.bases = []
+        self.codes = {}  # base -> code
+
+    def __len__(self):
+        return len(self.bases)
+
+    def intern(self, base):
+        """Code of `base`, adding it to the table if needed"""
+        code = self.codes.get(base)
+        if code is None:
+            code = self.codes[base] = len(self.bases)
+            self.bases.append(base)
+        return code
+
+    def split(self, name):
+        """(base, number) of a name; number is NO_NUMBER when there is no suffix"""
+        base, underscore, digits = name.rpartition('_')
+        if (underscore and digits.isascii() and digits.isdigit() and (digits == '0' or digits[0] != '0')
+                and int(digits) <= _MAX_NUMBER):
+            return base, int(digits)
+        return name, NO_NUMBER
+
+    def encode(self, names):
+        """(codes, numbers) arrays for a sequence of names"""
+        count = len(names)
+        codes = np.empty(count, dtype=CODE_DTYPE)
+        numbers = np.empty(count, dtype=NUMBER_DTYPE)
+        for i, name in enumerate(names):
+            base, numbers[i] = self.split(name)
+            codes[i] = self.intern(base)
+        return codes, numbers
+
+    def decode(self, code, number):
+        base = self.bases[code]
+        return base if number == NO_NUMBER else f"{base}_{number}"
+
+    def decode_many(self, codes, numbers):
+        """List of names for arrays of codes and numbers"""
+        bases = self.bases
+        return [bases[code] if number == NO_NUMBER else f"{bases[code]}_{number}"
+                for code, number in zip(codes.tolist(), numbers.tolist())]
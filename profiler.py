@@ -0,0 +1,172 @@
+"""Per-phase frame timings: rolling percentiles, an overlay and trace export.
+
+    profiler = Profiler(trace=True)
+    while running:
+        with profiler.phase('update'):
+            world.update()
+        with profiler.phase('draw'):
+            img = world.draw()
+        profiler.draw_overlay(img)
+        profiler.frame()
+    print(profiler.report())
+    profiler.save_trace('frames.json')
+
+Phases may nest (e.g. 'state' inside 'update') and may run several times
+per frame; `frame()` closes a frame and stores each phase's total for it.
+The last `window` frames give p50/p95/p99 per phase. With `trace=True`
+every phase is also kept as a Chrome trace event; the file opens in
+chrome://tracing or https://ui.perfetto.dev.
+
+The scripts take a `profiler` and otherwise use `from_environment()`:
+SANDYBROWN_PROFILE=1 turns on the overlay and a report at exit, and
+SANDYBROWN_TRACE=path also writes the trace there. Without either they
+get NULL_PROFILER, whose `phase()` hands back one shared do-nothing
+context manager, so instrumented code costs a method call per phase.
+"""
+import json
+import os
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, self.start, time.perf_counter())
+
+
+class Profiler:
+    """Collects phase timings; see the module docstring"""
+    enabled = True
+
+    def __init__(self, window=600, trace=False, print_every=None, trace_path=None):
+        self.window = window
+        self.trace_path = trace_path  # written by close()
+        self.print_every = print_every  # frames between reports on stdout
+        self.samples = {}  # phase -> deque of per-frame totals, seconds
+        self.current = {}  # phase -> total so far in this frame
+        self.order = []  # phases in the order they first ran
+        self.frames = 0
+        self.events = [] if trace or trace_path else None
+        self.origin = time.perf_counter()
+
+    def phase(self, name):
+        """Context manager timing one run of phase `name`"""
+        return _Phase(self, name)
+
+    def add(self, name, start, end):
+        """Record a phase that ran from `start` to `end` (perf_counter seconds)"""
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.window)
+            self.order.append(name)
+        self.current[name] = self.current.get(name, 0.0) + end - start
+        if self.events is not None:
+            self.events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                                'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6})
+
+    def frame(self):
+        """End the current frame"""
+        for name, samples in self.samples.items():
+            samples.append(self.current.get(name, 0.0))
+        self.current = {}
+        self.frames += 1
+        if self.print_every and self.frames % self.print_every == 0:
+            print(self.report())
+
+    def percentiles(self, name):
+        """(p50, p95, p99) of the phase's per-frame total, in ms"""
+        samples = self.samples.get(name)
+        if not samples:
+            return (0.0,) * len(PERCENTILES)
+        return tuple(np.percentile(np.fromiter(samples, dtype=np.float64), PERCENTILES) * 1000)
+
+    def lines(self):
+        return [f"{name:<8} " + " ".join(f"{value:7.2f}" for value in self.percentiles(name))
+                for name in self.order]
+
+    def report(self):
+        """Text table of every phase's percentiles"""
+        header = f"{'phase':<8} " + " ".join(f"{'p' + str(p):>7}" for p in PERCENTILES) + "  ms/frame"
+        return "\n".join([f"{self.frames} frames", header] + self.lines())
+
+    def draw_overlay(self, img, origin=(10, 50), color=(0, 0, 0)):
+        """Draw the percentile table onto a frame and return the boxes it covers"""
+        x, y = origin
+        header = "phase    " + " ".join(f"{'p' + str(p):>7}" for p in PERCENTILES)
+        boxes = []
+        for i, line in enumerate([header] + self.lines()):
+            baseline_y = y + i * 16
+            cv2.putText(img, line, (x, baseline_y), cv2.FONT_HERSHEY_PLAIN, 1.0, color, 1)
+            (w, h), baseline = cv2.getTextSize(line, cv2.FONT_HERSHEY_PLAIN, 1.0, 1)
+            boxes.append((x - 2, baseline_y - h - 2, x + w + 2, baseline_y + baseline + 2))
+        return boxes
+
+    def save_trace(self, path):
+        """Write the phases as a Chrome trace file (needs trace=True)"""
+        if self.events is None:
+            raise ValueError("profiler was created without trace=True")
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def close(self):
+        """Print the report and write the trace to trace_path, if any"""
+        print(self.report())
+        if self.trace_path:
+            self.save_trace(self.trace_path)
+            print(f"Trace written to {self.trace_path}")
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullProfiler:
+    """Profiler stand-in that records nothing"""
+    enabled = False
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def add(self, name, start, end):
+        pass
+
+    def frame(self):
+        pass
+
+    def draw_overlay(self, img, origin=(10, 50), color=(0, 0, 0)):
+        return []
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def from_environment():
+    """Profiler configured by $SANDYBROWN_PROFILE and $SANDYBROWN_TRACE, else NULL_PROFILER"""
+    trace_path = os.environ.get('SANDYBROWN_TRACE')
+    if not os.environ.get('SANDYBROWN_PROFILE') and not trace_path:
+        return NULL_PROFILER
+    return Profiler(trace_path=trace_path)
@@ -0,0 +1,395 @@
+import cv2
+import numpy as np
+
+
+class DirtyRectRenderer:
+    """Persistent frame buffer that only repaints the regions sprites touched.
+
+    Every frame each item's sprite signature (whatever determines how it
+    looks, e.g. rounded position and name) is compared with the previous
+    frame. Only items whose signature changed are erased, by copying their
+    old and new bounding boxes back from the background, and redrawn.
+    Unchanged items overlapping an erased box are erased and redrawn too;
+    they are found through a coarse tile index so the cost follows the
+    number of moving sprites, not the screen area.
+
+    draw_sprite(img, item)   paints one item
+    sprite_bounds(item)      (x1, y1, x2, y2) box covering everything draw_sprite paints
+    sprite_key(item)         hashable signature; the item is redrawn when it changes
+    item_id(item)            stable identity across frames
+    """
+    def __init__(self, draw_sprite, sprite_bounds, sprite_key, item_id=id, tile_size=32):
+        self.draw_sprite = draw_sprite
+        self.sprite_bounds = sprite_bounds
+        self.sprite_key = sprite_key
+        self.item_id = item_id
+        self.tile_size = tile_size
+        self.frame = None
+        self.background = None
+        self.boxes = {}  # item id -> box drawn last frame
+        self.keys = {}  # item id -> signature drawn last frame
+        self.tiles = {}  # (tx, ty) -> set of item ids whose box covers the tile
+        self.overlay_boxes = []
+        self.last_redrawn = 0
+
+    def reset(self):
+        """Forget the frame buffer; the next render repaints everything"""
+        self.frame = None
+
+    def _clip(self, box):
+        height, width = self.frame.shape[:2]
+        x1, y1, x2, y2 = box
+        return (max(0, int(x1)), max(0, int(y1)), min(width, int(x2) + 1), min(height, int(y2) + 1))
+
+    def _tiles_of(self, box):
+        x1, y1, x2, y2 = box
+        t = self.tile_size
+        for tx in range(x1 // t, max(x1, x2 - 1) // t + 1):
+            for ty in range(y1 // t, max(y1, y2 - 1) // t + 1):
+                yield (tx, ty)
+
+    def _index(self, item_id, box):
+        for tile in self._tiles_of(box):
+            self.tiles.setdefault(tile, set()).add(item_id)
+
+    def _unindex(self, item_id, box):
+        for tile in self._tiles_of(box):
+            owners = self.tiles.get(tile)
+            if owners is not None:
+                owners.discard(item_id)
+                if not owners:
+                    del self.tiles[tile]
+
+    def _restore(self, box):
+        x1, y1, x2, y2 = box
+        if x2 > x1 and y2 > y1:
+            self.frame[y1:y2, x1:x2] = self.background[y1:y2, x1:x2]
+
+    def _full_redraw(self, background, items, draw_overlay):
+        self.background = background
+        self.frame = background.copy()
+        self.boxes, self.keys, self.tiles = {}, {}, {}
+        for item in items:
+            item_id = self.item_id(item)
+            box = self._clip(self.sprite_bounds(item))
+            self.draw_sprite(self.frame, item)
+            self.boxes[item_id] = box
+            self.keys[item_id] = self.sprite_key(item)
+            self._index(item_id, box)
+        self.overlay_boxes = draw_overlay(self.frame) if draw_overlay else []
+        self.last_redrawn = len(items)
+        return self.frame
+
+    def render(self, background, items, draw_overlay=None):
+        """Bring the frame buffer up to date and return it.
+
+        draw_overlay(img), if given, paints HUD elements on top every frame
+        and returns the list of boxes it painted over.
+        """
+        if (self.frame is None or background is not self.background
+                or self.frame.shape != background.shape):
+            return self._full_redraw(background, items, draw_overlay)
+
+        current = {}
+        moved = []
+        dirty = list(self.overlay_boxes)
+        for item in items:
+            item_id = self.item_id(item)
+            current[item_id] = item
+            key = self.sprite_key(item)
+            if self.keys.get(item_id) == key:
+                continue
+            old_box = self.boxes.get(item_id)
+            if old_box is not None:
+                dirty.append(old_box)
+                self._unindex(item_id, old_box)
+            moved.append((item_id, item, key))
+
+        for item_id in [i for i in self.boxes if i not in current]:
+            box = self.boxes.pop(item_id)
+            del self.keys[item_id]
+            dirty.append(box)
+            self._unindex(item_id, box)
+
+        redraw = set()
+        for item_id, item, key in moved:
+            box = self._clip(self.sprite_bounds(item))
+            self.boxes[item_id] = box
+            self.keys[item_id] = key
+            self._index(item_id, box)
+            redraw.add(item_id)
+            dirty.append(box)
+
+        # Restore every dirty box from the background. A sprite touching a
+        # restored box is redrawn whole, so its own box is restored as well;
+        # redrawing over leftover pixels would double anti-aliased edges.
+        while dirty:
+            box = dirty.pop()
+            self._restore(box)
+            for tile in self._tiles_of(box):
+                for other in self.tiles.get(tile, ()):
+                    if other in redraw:
+                        continue
+                    other_box = self.boxes[other]
+                    if _intersects(box, other_box):
+                        redraw.add(other)
+                        dirty.append(other_box)
+
+        # Paint in the caller's order so overlapping sprites stack as in a full redraw
+        for item in items:
+            if self.item_id(item) in redraw:
+                self.draw_sprite(self.frame, item)
+
+        self.overlay_boxes = draw_overlay(self.frame) if draw_overlay else []
+        self.last_redrawn = len(redraw)
+        return self.frame
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class SpriteBatch:
+    """Draws all NPC sprites with as few OpenCV calls as possible.
+
+    Name labels, by far the most expensive part, are rendered with
+    cv2.putText once per distinct text and then stamped into the frame with
+    a slice-wise cv2.min/cv2.max, so a label is only re-rendered when an
+    NPC's label text (name, state, ...) changes. Direction lines/arrows for
+    every NPC go out as a single cv2.polylines call. Circles stay one
+    cv2.circle call each: OpenCV's Bresenham circle is cheaper than
+    stamping a masked bitmap or batching polygons.
+
+    Sprites are painted layer by layer (all circles, then lines, then
+    labels), so where NPCs overlap the stacking differs slightly from
+    drawing them one at a time.
+    """
+    def __init__(self, radius=10, outline_radius=None, line_length=15, line_thickness=2,
+                 arrow=False, ink_color=(0, 0, 0), font_scale=0.4, label_color=(0, 0, 0),
+                 label_offset=(15, 5)):
+        self.radius = radius
+        self.outline_radius = radius if outline_radius is None else outline_radius
+        self.line_length = line_length
+        self.line_thickness = line_thickness
+        self.arrow = arrow
+        self.ink_color = ink_color
+        self.font_scale = font_scale
+        self.label_color = label_color
+        self.label_offset = label_offset
+        # Dark text is composited with cv2.min over a white bitmap, light text with cv2.max over black
+        self.dark_labels = sum(label_color) < 3 * 128
+        self.labels = {}  # text -> (bitmap, height above baseline)
+
+    def label(self, text):
+        """Cached label bitmap for `text`"""
+        cached = self.labels.get(text)
+        if cached is None:
+            (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, 1)
+            background = (255, 255, 255) if self.dark_labels else (0, 0, 0)
+            bitmap = np.empty((h + baseline + 2, w + 2, 3), dtype=np.uint8)
+            bitmap[:] = background
+            cv2.putText(bitmap, text, (0, h), cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, self.label_color, 1)
+            cached = (bitmap, h)
+            self.labels[text] = cached
+        return cached
+
+    def _stamp_label(self, img, text, x, y):
+        bitmap, above = self.label(text)
+        height, width = img.shape[:2]
+        y0, x0 = y - above, x
+        y1, x1 = y0 + bitmap.shape[0], x0 + bitmap.shape[1]
+        if x1 <= 0 or y1 <= 0 or x0 >= width or y0 >= height:
+            return
+        if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+            # Partly off-screen: crop the bitmap to the visible part
+            bitmap = bitmap[max(0, -y0):bitmap.shape[0] - max(0, y1 - height),
+                            max(0, -x0):bitmap.shape[1] - max(0, x1 - width)]
+            y0, x0 = max(0, y0), max(0, x0)
+            y1, x1 = y0 + bitmap.shape[0], x0 + bitmap.shape[1]
+        region = img[y0:y1, x0:x1]
+        if self.dark_labels:
+            cv2.min(region, bitmap, dst=region)
+        else:
+            cv2.max(region, bitmap, dst=region)
+
+    def _segments(self, x, y, direction, centers):
+        """Direction line (and arrow head) segments as an (N*k, 2, 2) int32 array"""
+        ends = np.stack([x + self.line_length * np.cos(direction),
+                         y + self.line_length * np.sin(direction)], axis=1).astype(np.int32)
+        segments = [np.stack([centers, ends], axis=1)]
+        if self.arrow:
+            # Same head geometry as cv2.arrowedLine with its default tipLength=0.1
+            delta = (centers - ends).astype(np.float64)
+            tip = 0.1 * np.hypot(delta[:, 0], delta[:, 1])
+            angle = np.arctan2(delta[:, 1], delta[:, 0])
+            for side in (np.pi / 4, -np.pi / 4):
+                head = np.stack([np.rint(ends[:, 0] + tip * np.cos(angle + side)),
+                                 np.rint(ends[:, 1] + tip * np.sin(angle + side))], axis=1)
+                segments.append(np.stack([ends, head.astype(np.int32)], axis=1))
+        return np.concatenate(segments)
+
+    def draw(self, img, x, y, direction, colors, labels=None):
+        """Draw one sprite per NPC from sequences of x, y, direction (radians) and BGR color"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) == 0:
+            return img
+        direction = np.asarray(direction, dtype=np.float64)
+        centers = np.stack([x, y], axis=1).astype(np.int32)
+        center_list = centers.tolist()
+        color_list = np.asarray(colors, dtype=np.int64).reshape(-1, 3).tolist()
+
+        for center, color in zip(center_list, color_list):
+            cv2.circle(img, center, self.radius, color, -1)
+            cv2.circle(img, center, self.outline_radius, self.ink_color, 1)
+        if self.line_length:
+            cv2.polylines(img, self._segments(x, y, direction, centers), False,
+                          self.ink_color, self.line_thickness)
+        if labels is not None:
+            ox, oy = self.label_offset
+            for (cx, cy), text in zip(center_list, labels):
+                self._stamp_label(img, text, cx + ox, cy + oy)
+        return img
+
+
+class Camera:
+    """Viewport onto a world that can be larger than the window.
+
+    (x, y) is the world point at the centre of the view and zoom is screen
+    pixels per world unit.
+    """
+    def __init__(self, view_width, view_height, x=0.0, y=0.0, zoom=1.0, min_zoom=0.01, max_zoom=4.0):
+        self.view_width = view_width
+        self.view_height = view_height
+        self.x = x
+        self.y = y
+        self.zoom = zoom
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+
+    def visible_rect(self, margin=0):
+        """World-space (x1, y1, x2, y2) covered by the view, grown by `margin` screen pixels"""
+        half_w = (self.view_width / 2 + margin) / self.zoom
+        half_h = (self.view_height / 2 + margin) / self.zoom
+        return (self.x - half_w, self.y - half_h, self.x + half_w, self.y + half_h)
+
+    def to_screen(self, x, y):
+        return ((x - self.x) * self.zoom + self.view_width / 2,
+                (y - self.y) * self.zoom + self.view_height / 2)
+
+    def pan(self, dx, dy):
+        """Move by (dx, dy) screen pixels"""
+        self.x += dx / self.zoom
+        self.y += dy / self.zoom
+
+    def zoom_by(self, factor):
+        self.zoom = min(self.max_zoom, max(self.min_zoom, self.zoom * factor))
+
+    def fit(self, width, height):
+        """Centre on a width x height world and zoom so all of it is visible"""
+        self.x = width / 2
+        self.y = height / 2
+        self.zoom = min(self.view_width / width, self.view_height / height)
+
+
+class LODRenderer:
+    """Draws only the NPCs inside a Camera, with less detail as it zooms out.
+
+    zoom >= detail_zoom   full sprites with direction lines and labels
+    zoom >= dot_zoom      one small coloured dot per NPC
+    otherwise             density heatmap over heatmap_cell x heatmap_cell pixel bins
+
+    Full detail also falls back to dots when more than max_detailed NPCs are
+    on screen. Culling goes through a spatial.CellIndex when one is given.
+    """
+    def __init__(self, sprites=None, detail_zoom=0.75, dot_zoom=0.2, max_detailed=3000,
+                 heatmap_cell=4, background=(255, 255, 255), grid_color=(220, 220, 220), grid_step=50):
+        self.sprites = sprites or SpriteBatch()
+        self.detail_zoom = detail_zoom
+        self.dot_zoom = dot_zoom
+        self.max_detailed = max_detailed
+        self.heatmap_cell = heatmap_cell
+        self.background = background
+        self.grid_color = grid_color
+        self.grid_step = grid_step
+        self.last_visible = 0
+        self.last_level = None
+
+    def _draw_grid(self, img, camera, world_width, world_height):
+        spacing = self.grid_step * camera.zoom
+        if spacing < 8:
+            return
+        x0, y0 = camera.to_screen(0, 0)
+        x1, y1 = camera.to_screen(world_width, world_height)
+        top, bottom = int(max(y0, 0)), int(min(y1, camera.view_height))
+        left, right = int(max(x0, 0)), int(min(x1, camera.view_width))
+        first = max(0, int(-x0 // spacing))
+        for i in range(first, int(world_width // self.grid_step) + 1):
+            sx = int(x0 + i * spacing)
+            if sx > right:
+                break
+            cv2.line(img, (sx, top), (sx, bottom), self.grid_color, 1)
+        first = max(0, int(-y0 // spacing))
+        for i in range(first, int(world_height // self.grid_step) + 1):
+            sy = int(y0 + i * spacing)
+            if sy > bottom:
+                break
+            cv2.line(img, (left, sy), (right, sy), self.grid_color, 1)
+
+    def _draw_dots(self, img, sx, sy, colors):
+        h, w = img.shape[:2]
+        px = sx.astype(np.int64)
+        py = sy.astype(np.int64)
+        for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            qx, qy = px + dx, py + dy
+            inside = (qx >= 0) & (qx < w) & (qy >= 0) & (qy < h)
+            img[qy[inside], qx[inside]] = colors[inside]
+
+    def _draw_heatmap(self, img, sx, sy):
+        h, w = img.shape[:2]
+        cell = self.heatmap_cell
+        bins_w, bins_h = -(-w // cell), -(-h // cell)
+        bx = np.clip(sx // cell, 0, bins_w - 1).astype(np.int64)
+        by = np.clip(sy // cell, 0, bins_h - 1).astype(np.int64)
+        counts = np.bincount(by * bins_w + bx, minlength=bins_w * bins_h).reshape(bins_h, bins_w)
+        if not counts.any():
+            return
+        level = np.log1p(counts)
+        level = (level * (255 / level.max())).astype(np.uint8)
+        heat = cv2.applyColorMap(level, cv2.COLORMAP_INFERNO)
+        heat = cv2.resize(heat, (bins_w * cell, bins_h * cell), interpolation=cv2.INTER_NEAREST)[:h, :w]
+        occupied = cv2.resize((counts > 0).astype(np.uint8), (bins_w * cell, bins_h * cell),
+                              interpolation=cv2.INTER_NEAREST)[:h, :w].astype(bool)
+        img[occupied] = heat[occupied]
+
+    def render(self, camera, world_width, world_height, x, y, direction, colors, labels=None,
+               index=None, slack=0.0):
+        """Draw the view and return it; x, y, direction, colors are per-NPC arrays.
+
+        `slack` is passed on to index.query_rect when the index is older than the positions.
+        """
+        img = np.empty((camera.view_height, camera.view_width, 3), dtype=np.uint8)
+        img[:] = self.background
+        self._draw_grid(img, camera, world_width, world_height)
+
+        # Margin so sprites and labels just outside the view still poke in
+        margin = 100 if camera.zoom >= self.detail_zoom else 2
+        x1, y1, x2, y2 = camera.visible_rect(margin)
+        if index is not None:
+            visible = index.query_rect(x1, y1, x2, y2, slack)
+        else:
+            visible = np.flatnonzero((x >= x1) & (x <= x2) & (y >= y1) & (y <= y2))
+        self.last_visible = len(visible)
+        sx, sy = camera.to_screen(x[visible], y[visible])
+
+        if camera.zoom >= self.detail_zoom and len(visible) <= self.max_detailed:
+            self.last_level = 'detail'
+            self.sprites.draw(img, sx, sy, direction[visible], colors[visible],
+                              None if labels is None else [labels[i] for i in visible])
+        elif camera.zoom >= self.dot_zoom:
+            self.last_level = 'dots'
+            self._draw_dots(img, sx, sy, np.asarray(colors)[visible])
+        else:
+            self.last_level = 'heatmap'
+            self._draw_heatmap(img, sx, sy)
+        return img
@@ -0,0 +1,151 @@
+"""Counter-based random streams, reproducible however the work is split.
+
+Every draw is a pure function of (seed, stream, counter, draw)
+
+    bits = mix(key(seed) + stream*GOLDEN + counter*STEP + lane(draw))
+
+where `mix` is the SplitMix64 finalizer and lane(draw) = mix(draw*GOLDEN)
+puts each draw lane far away from the others (lane 0 is 0). Within a
+stream and lane this is plain SplitMix64 started at a per-stream offset.
+Nothing is shared between streams, so NPCs (streams keyed by NPC id) or
+chunks can be advanced in any order, on any number of workers, and still
+come out bit-identical for the same seed.
+
+Vectorized code passes arrays of stream ids and/or counters:
+
+    streams = RandomStreams(seed=42)
+    turn = streams.random(ids, tick) < 0.1          # one value per NPC
+    amount = streams.uniform(-0.5, 0.5, ids, tick, draw=1)
+
+Object-per-NPC code keeps a `Stream`, a cursor into one stream with the
+`random.Random` methods the NPCs use (random, uniform, randint, choice).
+Its position is a single int (`counter`), which is all a checkpoint has
+to store to continue the stream exactly. A Stream's n-th draw is
+`streams.bits(stream, n)`, so scalar and vectorized code agree. It keeps
+its stream's offset, so a draw is one mix on Python ints (under 1 us)
+and a Stream takes about 100 bytes.
+"""
+import secrets
+
+import numpy as np
+
+MASK = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+M1 = 0xBF58476D1CE4E5B9
+M2 = 0x94D049BB133111EB
+# Counter increment; odd and unrelated to GOLDEN, the stream increment
+STEP = 0xD1B54A32D192ED03
+
+# Stream 0 is the world's own (names, spawn positions, ...); NPC ids start at 1
+WORLD_STREAM = 0
+
+
+def mix64(z):
+    """SplitMix64 finalizer on a Python int"""
+    z = ((z ^ (z >> 30)) * M1) & MASK
+    z = ((z ^ (z >> 27)) * M2) & MASK
+    return z ^ (z >> 31)
+
+
+def _mix(z):
+    """mix64 on a uint64 array, in place"""
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(M1)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(M2)
+    z ^= z >> np.uint64(31)
+    return z
+
+
+def _to_float(bits):
+    """Top 52 bits as a float in [0, 1).
+
+    They become the mantissa of a float in [1, 2), which is several times
+    faster than converting the integers.
+    """
+    bits = np.asarray(bits >> np.uint64(12))
+    bits |= np.uint64(0x3FF0000000000000)
+    return bits.view(np.float64) - 1.0
+
+
+class RandomStreams:
+    """Independent counter-based random streams derived from one seed"""
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = secrets.randbits(64)
+        self.seed = seed & MASK
+        self.key = mix64(self.seed)
+
+    def bits(self, stream, counter, draw=0):
+        """Raw uint64 draws; stream, counter and draw may be ints or arrays"""
+        with np.errstate(over='ignore'):
+            if np.isscalar(counter) and np.isscalar(draw):
+                # The usual case: one tick for many streams
+                base = (self.key + counter * STEP + mix64((draw * GOLDEN) & MASK)) & MASK
+                return _mix(np.asarray(stream, dtype=np.uint64) * np.uint64(GOLDEN) + np.uint64(base))
+            z = _mix(np.asarray(draw, dtype=np.uint64) * np.uint64(GOLDEN))
+            z = z + np.asarray(counter, dtype=np.uint64) * np.uint64(STEP) + np.uint64(self.key)
+            return _mix(z + np.asarray(stream, dtype=np.uint64) * np.uint64(GOLDEN))
+
+    def random(self, stream, counter, draw=0):
+        """Floats in [0, 1)"""
+        return _to_float(self.bits(stream, counter, draw))
+
+    def uniform(self, low, high, stream, counter, draw=0):
+        """Floats in [low, high)"""
+        return low + (high - low) * self.random(stream, counter, draw)
+
+    def integers(self, low, high, stream, counter, draw=0):
+        """Integers in [low, high), int64"""
+        span = np.uint64(high - low)
+        return ((self.bits(stream, counter, draw) >> np.uint64(32)) * span >> np.uint64(32)).astype(np.int64) + low
+
+    def stream(self, stream, counter=0):
+        """Sequential Stream over one stream id, starting at `counter`"""
+        return Stream(self, stream, counter)
+
+
+class Stream:
+    """One stream drawn one value at a time, like a random.Random.
+
+    Draw n of the stream is `streams.bits(id, n)`: `counter` is the only
+    state and can be saved and set back to resume.
+    """
+    __slots__ = ('streams', 'id', 'counter', '_offset')
+
+    def __init__(self, streams, stream_id, counter=0):
+        self.streams = streams
+        self.id = stream_id = int(stream_id)
+        self.counter = int(counter)
+        self._offset = (streams.key + stream_id * GOLDEN) & MASK  # lane 0
+
+    def bits(self):
+        counter = self.counter
+        self.counter = counter + 1
+        return mix64((self._offset + counter * STEP) & MASK)
+
+    def random(self):
+        # bits() inlined: NPCs draw from here every tick
+        counter = self.counter
+        self.counter = counter + 1
+        z = (self._offset + counter * STEP) & MASK
+        z = ((z ^ (z >> 30)) * M1) & MASK
+        z = ((z ^ (z >> 27)) * M2) & MASK
+        return ((z ^ (z >> 31)) >> 12) * (1.0 / (1 << 52))  # same value as _to_float
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def randint(self, a, b):
+        """Integer in [a, b], both ends included"""
+        return a + (((self.bits() >> 32) * (b - a + 1)) >> 32)
+
+    def choice(self, seq):
+        return seq[self.randint(0, len(seq) - 1)]
+
+    def integers(self, low, high, count):
+        """The next `count` randint(low, high - 1) draws as one array"""
+        counters = np.arange(self.counter, self.counter + count, dtype=np.uint64)
+        self.counter += count
+        return self.streams.integers(low, high, self.id, counters)
+
@@ -2,9 +2,36 @@ import numpy as np
 import cv2
 import random
 import math
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from render import Camera, DirtyRectRenderer, LODRenderer, SpriteBatch
+from spatial import CellIndex, separation_many
+from checkpoint import Checkpoint, save_checkpoint
+from journal import DELETE, KEYFRAME, SPAWN, Journal
+from names import CODE_DTYPE, NUMBER_DTYPE, NameTable
+from profiler import from_environment
+from rng import WORLD_STREAM, RandomStreams
 
-@dataclass
+# One checkpoint record per NPC; names go to the checkpoint's string table
+CHECKPOINT_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('direction', '<f8'),
+    ('speed', '<f8'),
+    ('color', 'u1', (3,)),
+    ('rng_counter', '<u8'),  # position in the NPC's random stream
+])
+
+# Journal keyframes only pin down what changes every tick
+KEYFRAME_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('direction', '<f8'),
+])
+
+@dataclass(slots=True)
 class NPC:
     id: int
     x: float
@@ -13,6 +40,7 @@ class NPC:
     direction: float  # in radians (0 to 2π)
     speed: float
     color: tuple = (0, 0, 0)  # BGR color
+    rng: object = field(default=random, repr=False, compare=False)  # random.Random-like, see rng.Stream
     
     def move(self, world_width, world_height):
         # Calculate new position based on direction and speed
@@ -28,25 +56,254 @@ class NPC:
             self.y = np.clip(self.y, 0, world_height)
         
         # Random direction changes (10% chance)
-        if random.random() < 0.1:
-            self.direction += random.uniform(-0.5, 0.5)
+        if self.rng.random() < 0.1:
+            self.direction += self.rng.uniform(-0.5, 0.5)
             self.direction %= 2 * math.pi
 
+def _column(name):
+    """Property that reads/writes one row of a NPCPopulation column"""
+    def getter(self):
+        return getattr(self._population, name)[self.row]
+    def setter(self, value):
+        getattr(self._population, name)[self.row] = value
+    return property(getter, setter)
+
+class NPCView:
+    """Lightweight NPC handle backed by a row of a NPCPopulation"""
+    __slots__ = ('_population', 'row')
+    
+    id = _column('ids')
+    x = _column('x')
+    y = _column('y')
+    direction = _column('direction')
+    speed = _column('speed')
+    
+    def __init__(self, population, row):
+        self._population = population
+        self.row = row
+    
+    @property
+    def name(self):
+        return self._population.names[self.row]
+    
+    @name.setter
+    def name(self, value):
+        self._population.names[self.row] = value
+    
+    @property
+    def color(self):
+        return tuple(int(c) for c in self._population.color[self.row])
+    
+    @color.setter
+    def color(self, value):
+        self._population.color[self.row] = value
+    
+    def __repr__(self):
+        return f"NPCView(id={self.id}, name={self.name!r}, x={self.x:.1f}, y={self.y:.1f})"
+
+class NameColumn:
+    """The names of a NPCPopulation's rows, as a sequence of str.
+    
+    Rows store interned (code, number) pairs, see names.py; a name string
+    only exists while someone holds it.
+    """
+    __slots__ = ('_population',)
+    
+    def __init__(self, population):
+        self._population = population
+    
+    def __len__(self):
+        return self._population.size
+    
+    def __getitem__(self, row):
+        p = self._population
+        if isinstance(row, slice):
+            return p.name_table.decode_many(p.name_code[:p.size][row], p.name_number[:p.size][row])
+        row = range(p.size)[row]
+        return p.name_table.decode(p.name_code[row], p.name_number[row])
+    
+    def __setitem__(self, row, name):
+        p = self._population
+        row = range(p.size)[row]
+        base, p.name_number[row] = p.name_table.split(name)
+        p.name_code[row] = p.name_table.intern(base)
+    
+    def __iter__(self):
+        return iter(self[:])
+
+class ViewColumn:
+    """NPCView handles for a NPCPopulation's rows, made when they are asked for"""
+    __slots__ = ('_population',)
+    
+    def __init__(self, population):
+        self._population = population
+    
+    def __len__(self):
+        return self._population.size
+    
+    def __getitem__(self, row):
+        rows = range(self._population.size)[row]
+        if isinstance(row, slice):
+            return [NPCView(self._population, r) for r in rows]
+        return NPCView(self._population, rows)
+    
+    def __iter__(self):
+        population = self._population
+        return (NPCView(population, row) for row in range(population.size))
+
+class NPCPopulation:
+    """Structure-of-arrays storage for NPCs, advanced in one batched step.
+    
+    About 50 bytes per NPC: names are interned (see names.py) and
+    NPCView handles are only made on demand (`views`).
+    """
+    COLUMNS = ('ids', 'x', 'y', 'direction', 'speed', 'color', 'name_code', 'name_number')
+    
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.direction = np.zeros(capacity, dtype=np.float64)
+        self.speed = np.zeros(capacity, dtype=np.float64)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self.name_code = np.zeros(capacity, dtype=CODE_DTYPE)
+        self.name_number = np.zeros(capacity, dtype=NUMBER_DTYPE)
+        self.name_table = NameTable()
+        self.names = NameColumn(self)
+        self.views = ViewColumn(self)
+    
+    def _reserve(self, count):
+        """Grow the arrays so that `count` rows fit"""
+        capacity = len(self.ids)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for column in self.COLUMNS:
+            old = getattr(self, column)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, column, new)
+    
+    def add_many(self, ids, x, y, names, direction, speed, color):
+        """Append a batch of NPCs.
+        
+        `names` is a sequence of str, or a (codes, numbers) pair already
+        encoded with `self.name_table`.
+        """
+        codes, numbers = names if isinstance(names, tuple) else self.name_table.encode(names)
+        count = len(codes)
+        start, end = self.size, self.size + count
+        self._reserve(end)
+        self.ids[start:end] = ids
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.direction[start:end] = direction
+        self.speed[start:end] = speed
+        self.color[start:end] = color
+        self.name_code[start:end] = codes
+        self.name_number[start:end] = numbers
+        self.size = end
+    
+    def add(self, id, x, y, name, direction, speed, color):
+        """Append a single NPC and return its view"""
+        self.add_many([id], [x], [y], [name], [direction], [speed], [color])
+        return NPCView(self, self.size - 1)
+    
+    def snapshot(self, row):
+        """Copy a row out into a standalone NPC"""
+        return NPC(
+            id=int(self.ids[row]),
+            x=float(self.x[row]),
+            y=float(self.y[row]),
+            name=self.names[row],
+            direction=float(self.direction[row]),
+            speed=float(self.speed[row]),
+            color=tuple(int(c) for c in self.color[row])
+        )
+    
+    def remove(self, row):
+        """Remove a row by moving the last row into its place"""
+        removed = self.snapshot(row)
+        last = self.size - 1
+        if row != last:
+            for column in self.COLUMNS:
+                array = getattr(self, column)
+                array[row] = array[last]
+        self.size = last
+        return removed
+    
+    def move(self, world_width, world_height, streams, tick, executor=None, chunk_size=65536):
+        """Vectorized NPC.move over every row.
+        
+        With an `executor` the rows are moved in chunks of `chunk_size` on
+        its threads: every row moves independently and the NumPy kernels
+        release the GIL, so the chunks really run in parallel.
+        """
+        n = self.size
+        # Only the first `size` rows; the rest is spare capacity
+        columns = [column[:n] for column in (self.ids, self.x, self.y, self.direction, self.speed)]
+        if executor is None or n <= chunk_size:
+            move_npcs(*columns, world_width, world_height, streams, tick)
+            return
+        futures = [executor.submit(move_npcs, *(column[start:start + chunk_size] for column in columns),
+                                   world_width, world_height, streams, tick)
+                   for start in range(0, n, chunk_size)]
+        for future in futures:
+            future.result()
+
+def move_npcs(ids, x, y, direction, speed, world_width, world_height, streams, tick):
+    """NPC.move over NPC column arrays, in place.
+    
+    Random draws come from each NPC's own stream in `streams` (a
+    rng.RandomStreams), keyed by tick, so any subset of rows moves the
+    same way on its own as it does together with the rest.
+    """
+    x += np.cos(direction) * speed
+    y += np.sin(direction) * speed
+    
+    # Boundary checking - bounce off walls
+    out_x = (x < 0) | (x > world_width)
+    direction[out_x] = math.pi - direction[out_x]
+    np.clip(x, 0, world_width, out=x)
+    out_y = (y < 0) | (y > world_height)
+    direction[out_y] = -direction[out_y]
+    np.clip(y, 0, world_height, out=y)
+    
+    # Random direction changes (10% chance)
+    # Draw lanes 1 and 2: lane 0 is the sequential lane rng.Stream (and spawning) uses
+    turning = np.flatnonzero(streams.random(ids, tick, draw=1) < 0.1)
+    turn = streams.uniform(-0.5, 0.5, ids[turning], tick, draw=2)
+    direction[turning] = (direction[turning] + turn) % (2 * math.pi)
+
 class NPCSimulator:
-    def __init__(self, width=800, height=600):
+    def __init__(self, width=800, height=600, dirty_rects=False, batched=False, seed=None, profiler=None):
         self.width = width
         self.height = height
         self.npcs = []
         self.world_img = np.ones((height, width, 3), dtype=np.uint8) * 255
+        self._background = None  # cached static layer, see background()
+        self._label_sizes = {}  # name -> (width, height, baseline) of its label
+        self.renderer = None
+        if dirty_rects:
+            self.renderer = DirtyRectRenderer(self.draw_npc, self.npc_bounds, self.npc_sprite_key,
+                                              item_id=lambda npc: npc.id)
+        self.sprites = SpriteBatch() if batched else None
         self.next_id = 1
+        # Every NPC draws from its own stream, so the same seed gives the same world
+        self.streams = RandomStreams(seed)
+        self.rng = self.streams.stream(WORLD_STREAM)
+        self.profiler = profiler or from_environment()  # phase timings, see profiler.py
     
     def create_npc(self, name, x=None, y=None, direction=None, speed=None):
         """Create a new NPC with random or specified parameters"""
-        x = x if x is not None else random.uniform(0, self.width)
-        y = y if y is not None else random.uniform(0, self.height)
-        direction = direction if direction is not None else random.uniform(0, 2 * math.pi)
-        speed = speed if speed is not None else random.uniform(0.5, 3.0)
-        color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+        rng = self.streams.stream(self.next_id)
+        x = x if x is not None else rng.uniform(0, self.width)
+        y = y if y is not None else rng.uniform(0, self.height)
+        direction = direction if direction is not None else rng.uniform(0, 2 * math.pi)
+        speed = speed if speed is not None else rng.uniform(0.5, 3.0)
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
         
         npc = NPC(
             id=self.next_id,
@@ -55,18 +312,27 @@ class NPCSimulator:
             name=name,
             direction=direction,
             speed=speed,
-            color=color
+            color=color,
+            rng=rng
         )
-        self.npcs.append(npc)
         self.next_id += 1
+        return self.add_npc(npc)
+    
+    def add_npc(self, npc):
+        """Register an NPC with the simulation"""
+        self.npcs.append(npc)
         return npc
     
+    def remove_npc(self):
+        """Remove the most recently added NPC"""
+        return self.npcs.pop()
+    
     def create_npc_set(self, count=10):
         """Create a set of NPCs with random parameters"""
         names = ["Warrior", "Mage", "Rogue", "Merchant", "Guard", 
                 "Peasant", "King", "Queen", "Blacksmith", "Bard"]
         for i in range(count):
-            name = f"{random.choice(names)}_{i}"
+            name = f"{self.rng.choice(names)}_{i}"
             self.create_npc(name)
     
     def update(self):
@@ -74,63 +340,406 @@ class NPCSimulator:
         for npc in self.npcs:
             npc.move(self.width, self.height)
     
+    def background(self):
+        """Static layer (background and grid), rebuilt only when world_img is resized"""
+        if self._background is None or self._background.shape != self.world_img.shape:
+            img = self.world_img.copy()
+            for x in range(0, self.width, 50):
+                cv2.line(img, (x, 0), (x, self.height), (220, 220, 220), 1)
+            for y in range(0, self.height, 50):
+                cv2.line(img, (0, y), (self.width, y), (220, 220, 220), 1)
+            self._background = img
+        return self._background
+    
+    def invalidate_background(self):
+        """Force the static layer to be redrawn on the next frame"""
+        self._background = None
+    
+    def label_size(self, name):
+        if name not in self._label_sizes:
+            (w, h), baseline = cv2.getTextSize(name, cv2.FONT_HERSHEY_SIMPLEX, 0.4, 1)
+            self._label_sizes[name] = (w, h, baseline)
+        return self._label_sizes[name]
+    
+    def npc_sprite_key(self, npc):
+        """Everything that changes how an NPC looks on screen"""
+        x, y = int(npc.x), int(npc.y)
+        end_point = (
+            int(npc.x + 15 * math.cos(npc.direction)),
+            int(npc.y + 15 * math.sin(npc.direction))
+        )
+        return (x, y, end_point, npc.name, npc.color)
+    
+    def npc_bounds(self, npc):
+        """Box covering the circle, direction line and name of an NPC"""
+        x, y = int(npc.x), int(npc.y)
+        text_w, text_h, baseline = self.label_size(npc.name)
+        return (x - 18, min(y - 18, y + 5 - text_h - 2),
+                max(x + 18, x + 15 + text_w + 2), max(y + 18, y + 5 + baseline + 2))
+    
+    def draw_npc(self, img, npc):
+        center = (int(npc.x), int(npc.y))
+        
+        # Draw NPC as a circle with direction indicator
+        cv2.circle(img, center, 10, npc.color, -1)
+        cv2.circle(img, center, 10, (0, 0, 0), 1)  # outline
+        
+        # Direction indicator line
+        end_point = (
+            int(npc.x + 15 * math.cos(npc.direction)),
+            int(npc.y + 15 * math.sin(npc.direction))
+        )
+        cv2.line(img, center, end_point, (0, 0, 0), 2)
+        
+        # Draw name
+        cv2.putText(img, npc.name, (center[0] + 15, center[1] + 5), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+    
+    def npc_arrays(self):
+        """x, y, direction, color and name of every NPC, for batched drawing"""
+        return (
+            [npc.x for npc in self.npcs],
+            [npc.y for npc in self.npcs],
+            [npc.direction for npc in self.npcs],
+            [npc.color for npc in self.npcs],
+            [npc.name for npc in self.npcs]
+        )
+    
+    def draw_stats(self, img):
+        """Draw the stats overlay and return the boxes it covers"""
+        text = f"NPCs: {len(self.npcs)}"
+        cv2.putText(img, text, (10, 20), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+        (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
+        return [(8, 20 - h - 2, 10 + w + 2, 20 + baseline + 2)]
+    
+    def draw_overlays(self, img):
+        """Draw the stats and the profiler table and return the boxes they cover"""
+        return self.draw_stats(img) + self.profiler.draw_overlay(img)
+    
     def draw(self):
         """Draw the world with all NPCs"""
-        img = self.world_img.copy()
+        if self.renderer is not None:
+            # Only repaint what moved; the returned frame is reused, don't modify it
+            return self.renderer.render(self.background(), self.npcs, self.draw_overlays)
         
-        # Draw grid
-        for x in range(0, self.width, 50):
-            cv2.line(img, (x, 0), (x, self.height), (220, 220, 220), 1)
-        for y in range(0, self.height, 50):
-            cv2.line(img, (0, y), (self.width, y), (220, 220, 220), 1)
+        img = self.background().copy()
         
         # Draw NPCs
-        for npc in self.npcs:
-            center = (int(npc.x), int(npc.y))
-            
-            # Draw NPC as a circle with direction indicator
-            cv2.circle(img, center, 10, npc.color, -1)
-            cv2.circle(img, center, 10, (0, 0, 0), 1)  # outline
-            
-            # Direction indicator line
-            end_point = (
-                int(npc.x + 15 * math.cos(npc.direction)),
-                int(npc.y + 15 * math.sin(npc.direction))
-            )
-            cv2.line(img, center, end_point, (0, 0, 0), 2)
-            
-            # Draw name
-            cv2.putText(img, npc.name, (center[0] + 15, center[1] + 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+        if self.sprites is not None:
+            self.sprites.draw(img, *self.npc_arrays())
+        else:
+            for npc in self.npcs:
+                self.draw_npc(img, npc)
         
         # Display stats
-        cv2.putText(img, f"NPCs: {len(self.npcs)}", (10, 20), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+        self.draw_overlays(img)
         
         return img
     
+    def checkpoint_records(self):
+        """(records, names) describing every NPC, see CHECKPOINT_DTYPE"""
+        records = np.zeros(len(self.npcs), dtype=CHECKPOINT_DTYPE)
+        for record, npc in zip(records, self.npcs):
+            record['id'] = npc.id
+            record['x'] = npc.x
+            record['y'] = npc.y
+            record['direction'] = npc.direction
+            record['speed'] = npc.speed
+            record['color'] = npc.color
+            record['rng_counter'] = getattr(npc.rng, 'counter', 0)
+        return records, [npc.name for npc in self.npcs]
+    
+    def checkpoint_meta(self):
+        return {'width': self.width, 'height': self.height, 'next_id': self.next_id,
+                'seed': self.streams.seed, 'rng': self.rng.counter}
+    
+    def save_checkpoint(self, path):
+        """Write every NPC to a binary checkpoint file"""
+        records, names = self.checkpoint_records()
+        save_checkpoint(path, records, names, self.checkpoint_meta())
+    
+    def restore_checkpoint(self, checkpoint):
+        """Replace the NPCs with the ones in an open Checkpoint"""
+        self.restore_streams(checkpoint.meta)
+        self.npcs = []
+        names = checkpoint.names()
+        for record, name in zip(checkpoint.records.tolist(), names):
+            npc_id, x, y, direction, speed, color, counter = record
+            self.add_npc(NPC(id=npc_id, x=x, y=y, name=name, direction=direction, speed=speed,
+                             color=tuple(int(c) for c in color), rng=self.streams.stream(npc_id, counter)))
+    
+    def restore_streams(self, meta):
+        """Continue the random streams saved in checkpoint_meta"""
+        if 'seed' in meta:
+            self.streams = RandomStreams(meta['seed'])
+        self.rng = self.streams.stream(WORLD_STREAM, meta.get('rng', 0))
+    
+    def load_checkpoint(self, path):
+        """Restore the NPCs saved by save_checkpoint"""
+        with Checkpoint(path) as checkpoint:
+            self.restore_checkpoint(checkpoint)
+            self.next_id = checkpoint.meta.get('next_id', self.next_id)
+    
+    def handle_key(self, key):
+        """Hook for keys the main loop doesn't handle itself"""
+        pass
+    
     def run_simulation(self):
         """Main simulation loop"""
         print("Starting NPC simulation. Press 'q' to quit, 'a' to add NPC, 'd' to delete last NPC")
         
         self.create_npc_set(5)  # Initial NPCs
         
+        profiler = self.profiler
         while True:
-            img = self.draw()
-            cv2.imshow('NPC Simulation', img)
+            with profiler.phase('draw'):
+                img = self.draw()  # overlays included
+            with profiler.phase('imshow'):
+                cv2.imshow('NPC Simulation', img)
             
-            key = cv2.waitKey(30)
+            with profiler.phase('input'):
+                key = cv2.waitKey(30)
             if key == ord('q'):  # Quit
                 break
             elif key == ord('a'):  # Add NPC
                 self.create_npc(f"New_{self.next_id}")
             elif key == ord('d') and self.npcs:  # Delete last NPC
-                removed = self.npcs.pop()
+                removed = self.remove_npc()
                 print(f"Removed NPC: {removed.name}")
+            elif key != -1:
+                self.handle_key(key)
             
-            self.update()
+            with profiler.phase('update'):
+                self.update()
+            profiler.frame()
         
+        profiler.close()
+        self.close()
         cv2.destroyAllWindows()
+    
+    def close(self):
+        """Release what the simulator holds besides memory (nothing here)"""
+        pass
+
+class VectorizedNPCSimulator(NPCSimulator):
+    """NPCSimulator that keeps NPC state in contiguous arrays.
+    
+    `self.npcs` holds NPCView objects, so drawing and the main loop work
+    unchanged, while `update` advances every NPC in a single NumPy step.
+    
+    With `view_size=(w, h)` the world can be larger than the window: draw()
+    renders a zoomable Camera view that culls off-screen NPCs and drops to
+    dots and then a density heatmap as it zooms out. Keys: +/- zoom,
+    i/j/k/l pan, f fit the whole world.
+    
+    `start_journal(directory)` records spawns, deletions and keyframes to
+    an append-only journal; journal.replay rebuilds the world at any tick.
+    
+    With `min_dist` NPCs closer than that are pushed apart after moving,
+    like the separation step of the 003/004 NPCs.
+    
+    With `threads` the movement runs in chunks of `chunk_size` rows on a
+    thread pool; the result is identical to the single-threaded update.
+    """
+    def __init__(self, width=800, height=600, capacity=1024, seed=None, dirty_rects=False, batched=False,
+                 view_size=None, min_dist=None, threads=None, chunk_size=65536, profiler=None):
+        super().__init__(width, height, dirty_rects, batched, seed, profiler)
+        self.population = NPCPopulation(capacity)
+        self.npcs = self.population.views
+        self.min_dist = min_dist
+        self.executor = ThreadPoolExecutor(threads) if threads else None
+        self.chunk_size = chunk_size
+        self.ticks = 0
+        self.journal = None
+        self.camera = None
+        if view_size is not None:
+            self.camera = Camera(*view_size)
+            self.camera.fit(width, height)
+            self.lod = LODRenderer(self.sprites)
+            self.index = CellIndex(cell_size=64)
+            self.index_rebuild_ticks = 10  # reuse the culling index for this many ticks
+            self._index_size = None
+            self._index_tick = 0
+            self._index_speed = 0.0
+    
+    def add_npc(self, npc):
+        view = self.population.add(npc.id, npc.x, npc.y, npc.name, npc.direction, npc.speed, npc.color)
+        if self.journal:
+            self.journal_spawn(view.row)
+        return view
+    
+    def remove_npc(self):
+        removed = self.population.remove(self.population.size - 1)
+        if self.journal:
+            self.journal.append(DELETE, self.ticks, dict(self.journal_state(), ids=[removed.id]))
+        return removed
+    
+    def create_npc_set(self, count=10):
+        """Create a set of NPCs with random parameters in one batch"""
+        names = ["Warrior", "Mage", "Rogue", "Merchant", "Guard", 
+                "Peasant", "King", "Queen", "Blacksmith", "Bard"]
+        picks = self.rng.integers(0, len(names), count)
+        ids = np.arange(self.next_id, self.next_id + count)
+        self.next_id += count
+        start = self.population.size
+        # f"{names[pick]}_{i}", straight into the interned form
+        table = self.population.name_table
+        codes = np.array([table.intern(name) for name in names], dtype=CODE_DTYPE)[picks]
+        numbers = np.arange(count, dtype=NUMBER_DTYPE)
+        # Draw k of each NPC's stream, exactly what create_npc draws one at a time
+        streams = self.streams
+        self.population.add_many(
+            ids,
+            streams.uniform(0, self.width, ids, 0),
+            streams.uniform(0, self.height, ids, 1),
+            (codes, numbers),
+            streams.uniform(0, 2 * math.pi, ids, 2),
+            streams.uniform(0.5, 3.0, ids, 3),
+            np.stack([streams.integers(0, 256, ids, k) for k in (4, 5, 6)], axis=1)
+        )
+        if self.journal:
+            self.journal_spawn(start)
+    
+    def npc_arrays(self):
+        n = self.population.size
+        p = self.population
+        return p.x[:n], p.y[:n], p.direction[:n], p.color[:n], p.names
+    
+    def checkpoint_records(self, start=0):
+        p = self.population
+        n = p.size
+        records = np.empty(n - start, dtype=CHECKPOINT_DTYPE)
+        records['id'] = p.ids[start:n]
+        records['x'] = p.x[start:n]
+        records['y'] = p.y[start:n]
+        records['direction'] = p.direction[start:n]
+        records['speed'] = p.speed[start:n]
+        records['color'] = p.color[start:n]
+        records['rng_counter'] = 0  # moves draw by tick, not from a stream position
+        return records, p.names[start:]
+    
+    def checkpoint_meta(self):
+        # Moves are keyed by tick, so the tick and the seed continue the run exactly
+        meta = super().checkpoint_meta()
+        meta.update(ticks=self.ticks)
+        return meta
+    
+    def restore_checkpoint(self, checkpoint):
+        """Copy the checkpoint's columns straight into a fresh population"""
+        records = checkpoint.records
+        self.population = NPCPopulation(max(len(self.population.ids), checkpoint.count, 1))
+        self.npcs = self.population.views
+        self.population.add_many(records['id'], records['x'], records['y'], checkpoint.names(),
+                                 records['direction'], records['speed'], records['color'])
+        self._index_size = None
+        self.ticks = checkpoint.meta.get('ticks', self.ticks)
+        self.restore_streams(checkpoint.meta)
+    
+    def start_journal(self, directory, **options):
+        """Journal every change from now on (options go to journal.Journal)"""
+        self.journal = Journal(directory, **options)
+        self.journal.start(self)
+    
+    def journal_state(self):
+        """What a replay needs besides the event itself to carry on identically"""
+        return {'next_id': self.next_id, 'rng': self.rng.counter}
+    
+    def journal_spawn(self, start):
+        """Journal the NPCs in rows start.. as one SPAWN"""
+        records, names = self.checkpoint_records(start)
+        self.journal.append(SPAWN, self.ticks, dict(self.journal_state(), names=names), records)
+    
+    def keyframe(self):
+        p = self.population
+        n = p.size
+        records = np.empty(n, dtype=KEYFRAME_DTYPE)
+        records['id'] = p.ids[:n]
+        records['x'] = p.x[:n]
+        records['y'] = p.y[:n]
+        records['direction'] = p.direction[:n]
+        return records, self.journal_state()
+    
+    def replay_event(self, kind, meta, records):
+        p = self.population
+        if kind == SPAWN:
+            p.add_many(records['id'], records['x'], records['y'], meta['names'],
+                       records['direction'], records['speed'], records['color'])
+        elif kind == DELETE:
+            for npc_id in meta['ids']:
+                p.remove(int(np.flatnonzero(p.ids[:p.size] == npc_id)[0]))
+        elif kind == KEYFRAME:
+            # Rows are in the same order as when the keyframe was taken
+            n = p.size
+            p.x[:n] = records['x']
+            p.y[:n] = records['y']
+            p.direction[:n] = records['direction']
+        self.next_id = meta['next_id']
+        self.rng.counter = meta['rng']
+    
+    def close(self):
+        """Stop the worker threads, if any; update() runs single-threaded afterwards"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+    
+    def update(self):
+        """Update all NPC positions in one batched step"""
+        self.population.move(self.width, self.height, self.streams, self.ticks, self.executor, self.chunk_size)
+        if self.min_dist:
+            self.separate()
+        self.ticks += 1
+        if self.journal:
+            self.journal.tick(self)
+    
+    def separate(self):
+        """Push overlapping NPCs apart (positions after this tick's move)"""
+        p = self.population
+        n = p.size
+        push_x, push_y = separation_many(p.x[:n], p.y[:n], p.ids[:n], self.min_dist)
+        np.clip(p.x[:n] + push_x, 0, self.width, out=p.x[:n])
+        np.clip(p.y[:n] + push_y, 0, self.height, out=p.y[:n])
+    
+    def draw(self):
+        if self.camera is None:
+            return super().draw()
+        
+        p = self.population
+        n = p.size
+        # The index is only rebuilt every few ticks (or when NPCs are added or
+        # removed); in between queries are widened by how far NPCs can have moved
+        age = self.ticks - self._index_tick
+        if self._index_size != n or age >= self.index_rebuild_ticks:
+            self.index.build(p.x[:n], p.y[:n])
+            self._index_size = n
+            self._index_tick = self.ticks
+            self._index_speed = float(p.speed[:n].max()) if n else 0.0
+            age = 0
+        img = self.lod.render(self.camera, self.width, self.height,
+                              p.x[:n], p.y[:n], p.direction[:n], p.color[:n], p.names,
+                              self.index, slack=age * self._index_speed)
+        cv2.putText(img, f"NPCs: {n}  visible: {self.lod.last_visible}  zoom: {self.camera.zoom:.2f}", 
+                   (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+        self.profiler.draw_overlay(img)
+        return img
+    
+    def handle_key(self, key):
+        if self.camera is None:
+            return
+        if key in (ord('+'), ord('=')):
+            self.camera.zoom_by(1.25)
+        elif key == ord('-'):
+            self.camera.zoom_by(0.8)
+        elif key == ord('i'):
+            self.camera.pan(0, -50)
+        elif key == ord('k'):
+            self.camera.pan(0, 50)
+        elif key == ord('j'):
+            self.camera.pan(-50, 0)
+        elif key == ord('l'):
+            self.camera.pan(50, 0)
+        elif key == ord('f'):
+            self.camera.fit(self.width, self.height)
 
 if __name__ == "__main__":
     simulator = NPCSimulator(1000, 800)
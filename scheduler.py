@@ -0,0 +1,104 @@
+"""Time-sliced NPC decisions: movement every tick, thinking every few ticks.
+
+An NPC's update is split in two: `think` (state timer, state changes,
+target selection, peer search) and `move` (walking towards the last
+decision, clamping). The world moves every NPC every tick, and pushes
+overlapping NPCs apart, but only lets the NPCs the scheduler picks think:
+
+    scheduler.run(npcs, tick, player, lambda npc, elapsed: npc.think(..., elapsed=elapsed), grid)
+    for npc in npcs:
+        npc.move(...)
+
+Each tick the picks are, in order:
+
+  1. NPCs within `near_radius` of the player, every tick;
+  2. NPCs left over from earlier ticks because the budget ran out,
+     oldest first, so none of them starves as long as the budget
+     covers the NPCs near the player;
+  3. the tick's round-robin bucket, every slices-th NPC of the list
+     starting at tick % slices.
+
+`elapsed` is the number of ticks since the NPC last thought, so its
+state timer runs at the same speed whatever the slicing. The first time
+it counts from the tick the NPC's bucket last came round (or from the
+first tick the scheduler ran), as if it had thought then; until then an
+NPC just waits where it is.
+
+With `budget_ms` the loop stops once the decisions of the tick have
+taken that long; whatever was not reached goes to the backlog for the
+next tick. At least one NPC, the first in the order above, thinks every
+tick however small the budget.
+
+With slices=1 and no budget every NPC thinks every tick.
+"""
+import time
+from itertools import chain
+
+
+class AIScheduler:
+    """Which NPCs think this tick; see the module docstring"""
+    def __init__(self, slices=1, budget_ms=None, near_radius=0.0, clock=time.perf_counter):
+        if slices < 1:
+            raise ValueError(f"slices must be at least 1, got {slices}")
+        self.slices = slices
+        self.budget = None if budget_ms is None else budget_ms / 1000
+        self.near_radius = near_radius
+        self.clock = clock
+        self.last = {}  # NPC id -> tick it last thought
+        self.first = None  # tick of the first run since the last reset
+        self.backlog = []  # NPCs due but not reached, oldest first
+        self.thought = 0  # decisions made in the last tick
+
+    def reset(self):
+        """Forget every NPC, e.g. after loading a checkpoint"""
+        self.last = {}
+        self.first = None
+        self.backlog = []
+
+    def forget(self, npc):
+        """Drop a removed NPC"""
+        self.last.pop(npc.id, None)
+        self.backlog = [other for other in self.backlog if other is not npc]
+
+    def near(self, npcs, player, grid=None):
+        """NPCs within near_radius of the player"""
+        if self.near_radius <= 0:
+            return []
+        if grid is not None:
+            return grid.query_radius(player.x, player.y, self.near_radius)
+        radius_sq = self.near_radius * self.near_radius
+        return [npc for npc in npcs if (npc.x - player.x) ** 2 + (npc.y - player.y) ** 2 <= radius_sq]
+
+    def run(self, npcs, tick, player, think, grid=None):
+        """Call think(npc, elapsed) for this tick's NPCs, most urgent first, within the budget.
+
+        Returns the number of decisions made; NPCs not reached wait in
+        the backlog for the next tick.
+        """
+        deadline = None if self.budget is None else self.clock() + self.budget
+        last = self.last
+        if self.first is None:
+            self.first = tick
+        # When the bucket of an NPC that has not thought yet last came round
+        scheduled = max(tick - self.slices, self.first - 1)
+        backlog, self.backlog = self.backlog, []
+        queue = chain(self.near(npcs, player, grid), backlog, npcs[tick % self.slices::self.slices])
+        seen = set()
+        for npc in queue:
+            if npc.id in seen:
+                continue
+            if seen and deadline is not None and self.clock() >= deadline:
+                # The rest waits, in the same order, for the next tick
+                rest = {npc.id: npc}
+                for other in queue:
+                    if other.id not in seen:
+                        rest.setdefault(other.id, other)
+                for other in rest:
+                    last.setdefault(other, scheduled)
+                self.backlog = list(rest.values())
+                break
+            seen.add(npc.id)
+            think(npc, tick - last.get(npc.id, scheduled))
+            last[npc.id] = tick
+        self.thought = len(seen)
+        return self.thought
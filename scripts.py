@@ -0,0 +1,21 @@
+"""Import the numbered example scripts (their file names are not valid module names)."""
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename, module_name=None):
+    """Load e.g. '004-areas.py' as a module without running its __main__ block.
+
+    `filename` is relative to the repository root, or an absolute path.
+    """
+    module_name = module_name or 'script_' + os.path.basename(filename).split('-')[0].split('.')[0]
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
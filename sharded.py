@@ -0,0 +1,330 @@
+"""VectorizedNPCSimulator movement sharded across worker processes.
+
+The world is cut into vertical strips, one per worker process. NPC
+columns live in shared memory (multiprocessing.shared_memory), one
+fixed-capacity slab per shard, so every worker advances its own NPCs in
+place and the main process reads them back without pickling anything.
+
+Each tick every worker, with a barrier between the phases,
+
+    1. moves its NPCs (sandybrown.move_npcs)
+    2. copies the NPCs of the neighbouring strips that are within
+       `min_dist` of its own (the ghost zone)
+    3. pushes its NPCs apart from their own and ghost neighbours
+       (spatial.separation_many)
+    4. hands the NPCs that left its strip over to the shard they are in now
+
+Movement draws are keyed by NPC id and tick, and separation sums pushes
+in neighbour id order, so a sharded run is bit-identical to a
+VectorizedNPCSimulator with the same seed, whatever the number of workers.
+
+    simulator = VectorizedNPCSimulator(20000, 16000, seed=1, min_dist=10)
+    simulator.create_npc_set(1_000_000)
+    with ShardedSimulation.from_simulator(simulator, workers=8) as sharded:
+        sharded.run(1000)
+        sharded.store(simulator)
+
+Colors and names never change, so they stay in the simulator.
+"""
+import math
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+from threading import BrokenBarrierError
+
+import numpy as np
+
+from rng import RandomStreams
+from sandybrown import move_npcs
+from spatial import separation_many
+
+COLUMNS = (
+    ('ids', np.int64),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('direction', np.float64),
+    ('speed', np.float64),
+)
+
+
+class _SharedArrays:
+    """NumPy arrays backed by named shared memory blocks.
+
+    Pass `names` to attach to blocks another process created.
+    """
+    def __init__(self, shapes, names=None):
+        self.blocks = {}
+        self.arrays = {}
+        for key, (shape, dtype) in shapes.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=names[key])
+            self.blocks[key] = block
+            self.arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    def names(self):
+        return {key: block.name for key, block in self.blocks.items()}
+
+    def close(self, unlink=False):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+        self.blocks = {}
+
+
+def _layout(shards, capacity):
+    shapes = {name: ((shards, capacity), dtype) for name, dtype in COLUMNS}
+    shapes['counts'] = ((shards,), np.int64)     # NPCs owned by each shard
+    shapes['outgoing'] = ((shards,), np.int64)   # rows after counts[s] leaving shard s
+    return shapes
+
+
+class _Shard:
+    """One worker's view of the shared state; see the module docstring"""
+    def __init__(self, index, arrays, config, barrier):
+        self.index = index
+        self.arrays = arrays
+        self.shards = config['shards']
+        self.capacity = config['capacity']
+        self.width = config['width']
+        self.height = config['height']
+        self.min_dist = config['min_dist']
+        self.streams = RandomStreams(config['seed'])
+        self.barrier = barrier
+        self.columns = [arrays[name][index] for name, _ in COLUMNS]
+        self.counts = arrays['counts']
+        self.outgoing = arrays['outgoing']
+
+    def strip_of(self, x):
+        return np.minimum((x * (self.shards / self.width)).astype(np.int64), self.shards - 1)
+
+    def step(self, tick):
+        s = self.index
+        n = int(self.counts[s])
+        ids, x, y, direction, speed = (column[:n] for column in self.columns)
+        move_npcs(ids, x, y, direction, speed, self.width, self.height, self.streams, tick)
+
+        if self.min_dist:
+            self.barrier.wait()  # everyone has moved
+            ghosts = self.ghosts(x) if n else None
+            self.barrier.wait()  # everyone has copied its ghosts
+            if n:
+                push_x, push_y = separation_many(np.concatenate((x, ghosts[1])), np.concatenate((y, ghosts[2])),
+                                                 np.concatenate((ids, ghosts[0])), self.min_dist, n)
+                np.clip(x + push_x, 0, self.width, out=x)
+                np.clip(y + push_y, 0, self.height, out=y)
+
+        self.handoff(n)
+
+    def ghosts(self, x):
+        """(ids, x, y) of the neighbouring shards' NPCs within min_dist of ours"""
+        low = x.min() - self.min_dist
+        high = x.max() + self.min_dist
+        parts = []
+        for t in (self.index - 1, self.index + 1):
+            if 0 <= t < self.shards:
+                count = int(self.counts[t])
+                other_ids = self.arrays['ids'][t, :count]
+                other_x = self.arrays['x'][t, :count]
+                other_y = self.arrays['y'][t, :count]
+                near = (other_x >= low) & (other_x <= high)
+                parts.append((other_ids[near], other_x[near], other_y[near]))
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def handoff(self, n):
+        """Move NPCs that left the strip to the shard they are in now"""
+        s = self.index
+        leaving = self.strip_of(self.columns[1][:n]) != s
+        out = int(leaving.sum())
+        if out:
+            # Kept rows first, leaving rows after them as this shard's outbox
+            order = np.argsort(leaving, kind='stable')
+            for column in self.columns:
+                column[:n] = column[:n][order]
+        kept = n - out
+        self.counts[s] = kept
+        self.outgoing[s] = out
+        self.barrier.wait()  # every outbox is filled
+
+        # Incoming rows go after our own outbox, which the others are reading now
+        end = kept + out
+        for t in range(self.shards):
+            if t == s or not self.outgoing[t]:
+                continue
+            start = int(self.counts[t])
+            rows = slice(start, start + int(self.outgoing[t]))
+            mine = np.flatnonzero(self.strip_of(self.arrays['x'][t, rows]) == s) + start
+            if end + len(mine) > self.capacity:
+                raise RuntimeError(f"shard {s} is full ({self.capacity} NPCs); use a larger capacity")
+            for (name, _), column in zip(COLUMNS, self.columns):
+                column[end:end + len(mine)] = self.arrays[name][t, mine]
+            end += len(mine)
+        self.barrier.wait()  # every outbox has been read
+
+        incoming = end - kept - out
+        if out and incoming:
+            for column in self.columns:
+                column[kept:kept + incoming] = column[kept + out:end]
+        self.counts[s] = kept + incoming
+        self.outgoing[s] = 0
+
+
+def _worker(index, names, config, barrier, connection):
+    arrays = _SharedArrays(_layout(config['shards'], config['capacity']), names)
+    shard = _Shard(index, arrays.arrays, config, barrier)
+    try:
+        while True:
+            command = connection.recv()
+            if command is None:
+                break
+            tick, ticks = command
+            try:
+                for t in range(tick, tick + ticks):
+                    shard.step(t)
+            except BrokenBarrierError:
+                connection.send(('aborted', None))
+            except Exception:
+                barrier.abort()  # don't leave the other workers waiting
+                connection.send(('error', traceback.format_exc()))
+            else:
+                connection.send(('done', None))
+    finally:
+        shard = None
+        arrays.close()
+        connection.close()
+
+
+class ShardedSimulation:
+    """Runs the NPC update of a VectorizedNPCSimulator on `workers` processes.
+
+    `capacity` is the most NPCs a single shard can hold; from_simulator
+    defaults it to twice an even share of the NPCs, at least 1024. Strips
+    must be wide enough that an NPC never crosses a whole strip, or sees
+    past one, in a single tick.
+    """
+    def __init__(self, width, height, seed, workers=None, min_dist=None, capacity=1024, ticks=0):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.width = width
+        self.height = height
+        self.ticks = ticks
+        self.config = {'shards': self.workers, 'capacity': capacity, 'width': width, 'height': height,
+                       'min_dist': min_dist, 'seed': seed}
+        strip_width = width / self.workers
+        if min_dist and strip_width < 4 * min_dist:
+            raise ValueError(f"{self.workers} strips of {strip_width:.0f} are too narrow for min_dist={min_dist}")
+        self.shared = _SharedArrays(_layout(self.workers, capacity))
+        self.arrays = self.shared.arrays
+        self.arrays['counts'][:] = 0
+        self.arrays['outgoing'][:] = 0
+        self.processes = []
+        self.connections = []
+
+    @classmethod
+    def from_simulator(cls, simulator, workers=None, capacity=None):
+        """Sharded copy of a VectorizedNPCSimulator's NPCs, workers started"""
+        p = simulator.population
+        n = p.size
+        workers = workers or multiprocessing.cpu_count()
+        if capacity is None:
+            capacity = max(2 * math.ceil(n / workers), 1024)
+        sharded = cls(simulator.width, simulator.height, simulator.streams.seed, workers,
+                      simulator.min_dist, capacity, simulator.ticks)
+        sharded.add_many(p.ids[:n], p.x[:n], p.y[:n], p.direction[:n], p.speed[:n])
+        sharded.start()
+        return sharded
+
+    def __len__(self):
+        return int(self.arrays['counts'].sum())
+
+    def add_many(self, ids, x, y, direction, speed):
+        """Add NPCs to the shards their x falls in (only between runs)"""
+        x = np.asarray(x, dtype=np.float64)
+        strips = np.minimum((x * (self.workers / self.width)).astype(np.int64), self.workers - 1)
+        values = [np.asarray(ids), x, np.asarray(y), np.asarray(direction), np.asarray(speed)]
+        counts = self.arrays['counts']
+        capacity = self.config['capacity']
+        for s in range(self.workers):
+            rows = np.flatnonzero(strips == s)
+            start = int(counts[s])
+            if start + len(rows) > capacity:
+                raise ValueError(f"shard {s} would hold {start + len(rows)} NPCs, capacity is {capacity}")
+            for (name, _), value in zip(COLUMNS, values):
+                self.arrays[name][s, start:start + len(rows)] = value[rows]
+            counts[s] = start + len(rows)
+
+    def start(self):
+        context = multiprocessing.get_context()
+        barrier = context.Barrier(self.workers)
+        names = self.shared.names()
+        for index in range(self.workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker, args=(index, names, self.config, barrier, child),
+                                      daemon=True)
+            process.start()
+            child.close()
+            self.processes.append(process)
+            self.connections.append(parent)
+
+    def run(self, ticks=1):
+        """Advance every shard `ticks` ticks and wait for them"""
+        for connection in self.connections:
+            connection.send((self.ticks, ticks))
+        replies = [connection.recv() for connection in self.connections]
+        errors = [detail for status, detail in replies if status == 'error']
+        if errors or any(status != 'done' for status, _ in replies):
+            self.close()
+            raise RuntimeError("shard worker failed:\n" + (errors[0] if errors else "barrier broken"))
+        self.ticks += ticks
+
+    def update(self):
+        self.run(1)
+
+    def columns(self):
+        """Every NPC's columns as {name: array}, copied out of shared memory, shard by shard"""
+        counts = self.arrays['counts']
+        return {name: np.concatenate([self.arrays[name][s, :counts[s]] for s in range(self.workers)])
+                for name, _ in COLUMNS}
+
+    def store(self, simulator):
+        """Write positions, directions and the tick back into the simulator"""
+        columns = self.columns()
+        order = np.argsort(columns['ids'])
+        p = simulator.population
+        n = p.size
+        rows = order[np.searchsorted(columns['ids'], p.ids[:n], sorter=order)]
+        p.x[:n] = columns['x'][rows]
+        p.y[:n] = columns['y'][rows]
+        p.direction[:n] = columns['direction'][rows]
+        simulator.ticks = self.ticks
+
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for connection in self.connections:
+            connection.close()
+        self.processes = []
+        self.connections = []
+        if self.shared is not None:
+            self.arrays = None
+            self.shared.close(unlink=True)
+            self.shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,320 @@
+import heapq
+import math
+
+import numpy as np
+
+
+class SpatialGrid:
+    """Uniform grid (spatial hash) over objects with `x` and `y` attributes.
+
+    Objects are bucketed by the cell they fall in, so radius and k-nearest
+    queries only look at the cells around the query point instead of
+    scanning every object.
+    """
+    def __init__(self, cell_size=50):
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> list of objects
+        self.item_cells = {}  # object -> (cx, cy)
+
+    def __len__(self):
+        return len(self.item_cells)
+
+    def cell_of(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def clear(self):
+        self.cells = {}
+        self.item_cells = {}
+
+    def insert(self, item):
+        cell = self.cell_of(item.x, item.y)
+        self.cells.setdefault(cell, []).append(item)
+        self.item_cells[item] = cell
+
+    def remove(self, item):
+        cell = self.item_cells.pop(item, None)
+        if cell is None:
+            return
+        bucket = self.cells[cell]
+        bucket.remove(item)
+        if not bucket:
+            del self.cells[cell]
+
+    def rebuild(self, items):
+        """Re-bucket every object from scratch"""
+        self.clear()
+        for item in items:
+            self.insert(item)
+
+    def update(self, items):
+        """Incrementally move objects whose cell changed since the last call.
+
+        Objects not yet in the grid are inserted; removed objects must be
+        taken out with `remove`.
+        """
+        for item in items:
+            cell = self.cell_of(item.x, item.y)
+            old_cell = self.item_cells.get(item)
+            if old_cell == cell:
+                continue
+            if old_cell is not None:
+                bucket = self.cells[old_cell]
+                bucket.remove(item)
+                if not bucket:
+                    del self.cells[old_cell]
+            self.cells.setdefault(cell, []).append(item)
+            self.item_cells[item] = cell
+
+    def _ring(self, cx, cy, r):
+        """Cells at Chebyshev distance exactly r from (cx, cy)"""
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def query_radius(self, x, y, radius, exclude=None):
+        """Objects within `radius` of (x, y)"""
+        x1, y1 = self.cell_of(x - radius, y - radius)
+        x2, y2 = self.cell_of(x + radius, y + radius)
+        radius_sq = radius * radius
+        found = []
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                for item in self.cells.get((cx, cy), ()):
+                    if item is exclude:
+                        continue
+                    dx = item.x - x
+                    dy = item.y - y
+                    if dx*dx + dy*dy <= radius_sq:
+                        found.append(item)
+        return found
+
+    def k_nearest(self, x, y, k, exclude=None, max_radius=None):
+        """Up to `k` objects closest to (x, y), nearest first"""
+        if k <= 0 or not self.cells:
+            return []
+        cx, cy = self.cell_of(x, y)
+        max_ring = None
+        if max_radius is not None:
+            max_ring = int(max_radius // self.cell_size) + 1
+
+        candidates = []  # (dist_sq, tiebreak, item)
+        seen = 0
+        r = 0
+        while seen < len(self.item_cells) and (max_ring is None or r <= max_ring):
+            for cell in self._ring(cx, cy, r):
+                for item in self.cells.get(cell, ()):
+                    seen += 1
+                    if item is exclude:
+                        continue
+                    dx = item.x - x
+                    dy = item.y - y
+                    candidates.append((dx*dx + dy*dy, len(candidates), item))
+            # Anything in ring r+1 or beyond is at least r*cell_size away
+            if len(candidates) >= k:
+                kth = heapq.nsmallest(k, candidates)[-1][0]
+                if kth <= (r * self.cell_size) ** 2:
+                    break
+            r += 1
+
+        if max_radius is not None:
+            limit = max_radius * max_radius
+            candidates = [c for c in candidates if c[0] <= limit]
+        return [item for _, _, item in heapq.nsmallest(k, candidates)]
+
+
+def separation(item, neighbours, min_dist):
+    """Push vector (dx, dy) that moves `item` out of overlapping neighbours"""
+    push_x = push_y = 0.0
+    for other in neighbours:
+        dx = item.x - other.x
+        dy = item.y - other.y
+        dist = math.sqrt(dx*dx + dy*dy)
+        if dist >= min_dist:
+            continue
+        if dist == 0:
+            # Exactly on top of each other: split them along an arbitrary axis
+            dx, dy, dist = 1.0, 0.0, 1.0
+        overlap = (min_dist - dist) / 2
+        push_x += dx / dist * overlap
+        push_y += dy / dist * overlap
+    return push_x, push_y
+
+
+def pairs_within(x, y, radius, count=None):
+    """(i, j) index arrays of the distinct points closer than `radius`, for i < count.
+
+    Points are bucketed into radius-sized cells and each of the first
+    `count` points (default: all) is only tested against the 3x3 cells
+    around it, so the work grows with the number of close pairs, not n².
+    Pairs come out grouped by cell, not sorted.
+    """
+    count = len(x) if count is None else count
+    if count == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    cx = np.floor_divide(x, radius).astype(np.int64)
+    cy = np.floor_divide(y, radius).astype(np.int64)
+    # One spare column and row on every side so neighbour keys never wrap around
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    columns = int(cx.max()) + 2
+    keys = cy * columns + cx
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    cells = columns * (int(cy.max()) + 2)
+    if cells <= 4 * len(x):
+        # Dense table of where each cell's run starts: lookups instead of binary searches
+        run_starts = np.zeros(cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=cells), out=run_starts[1:])
+        find = lambda first, last: (run_starts[first], run_starts[last + 1])
+    else:
+        find = lambda first, last: (np.searchsorted(sorted_keys, first, side='left'),
+                                    np.searchsorted(sorted_keys, last, side='right'))
+
+    # Query in sorted order (cache friendly); the three cells of a
+    # neighbouring row are one contiguous run of keys
+    queries = np.flatnonzero(order < count) if count < len(x) else np.arange(len(x))
+    rows = order[queries]
+    query_keys = sorted_keys[queries]
+    i_parts, j_parts = [], []
+    for dy in (-1, 0, 1):
+        centre = query_keys + dy * columns
+        starts, ends = find(centre - 1, centre + 1)
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            continue
+        # Index of every candidate within its run
+        within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        i_parts.append(np.repeat(rows, lengths))
+        j_parts.append(order[np.repeat(starts, lengths) + within])
+    if not i_parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    i = np.concatenate(i_parts)
+    j = np.concatenate(j_parts)
+    dx = x[i] - x[j]
+    dy = y[i] - y[j]
+    close = (dx*dx + dy*dy < radius * radius) & (i != j)
+    return i[close], j[close]
+
+
+def nearest_within(x, y, radius, rows):
+    """Index of the nearest other point closer than `radius` to each of `rows`, -1 if none.
+
+    Only the rows are queried, so the work grows with len(rows) and their
+    neighbours. Ties go to the lower index.
+    """
+    count = len(rows)
+    nearest = np.full(count, -1, dtype=np.int64)
+    if count == 0:
+        return nearest
+    # The queried rows go first, then every point; pairs within the copies are dropped
+    i, j = pairs_within(np.concatenate((x[rows], x)), np.concatenate((y[rows], y)), radius, count)
+    j -= count
+    keep = (j >= 0) & (j != rows[i])
+    i = i[keep]
+    j = j[keep]
+    if len(i) == 0:
+        return nearest
+    dx = x[rows[i]] - x[j]
+    dy = y[rows[i]] - y[j]
+    dist_sq = dx*dx + dy*dy
+    # Smallest distance per row, then the lowest index at that distance (no sorting)
+    best = np.full(count, np.inf)
+    np.minimum.at(best, i, dist_sq)
+    at_best = dist_sq == best[i]
+    nearest[:] = len(x)
+    np.minimum.at(nearest, i[at_best], j[at_best])
+    nearest[nearest == len(x)] = -1
+    return nearest
+
+
+def separation_many(x, y, ids, min_dist, count=None):
+    """separation() for the first `count` points at once: (push_x, push_y) arrays.
+
+    Each push is summed in order of neighbour id, so a point gets exactly
+    the same push whatever other points share the arrays with it (a shard
+    plus its ghost zone, or the whole world).
+    """
+    count = len(x) if count is None else count
+    i, j = pairs_within(x, y, min_dist, count)
+    neighbour_ids = ids[j]
+    if len(i) and count * (int(neighbour_ids.max()) + 1) < 2 ** 62:
+        order = np.argsort(i * (int(neighbour_ids.max()) + 1) + neighbour_ids)  # one key, much faster
+    else:
+        order = np.lexsort((neighbour_ids, i))
+    i = i[order]
+    j = j[order]
+    dx = x[i] - x[j]
+    dy = y[i] - y[j]
+    dist = np.sqrt(dx*dx + dy*dy)
+    # Exactly on top of each other: split them along an arbitrary axis
+    on_top = dist == 0
+    dx[on_top], dy[on_top], dist[on_top] = 1.0, 0.0, 1.0
+    overlap = (min_dist - dist) / 2
+    push_x = np.bincount(i, weights=dx / dist * overlap, minlength=count)
+    push_y = np.bincount(i, weights=dy / dist * overlap, minlength=count)
+    return push_x, push_y
+
+
+class CellIndex:
+    """Uniform grid over NumPy point arrays, built in bulk.
+
+    Points are sorted by cell once per build; a rectangle query then only
+    touches the sorted runs of the cell rows it overlaps, so culling a view
+    costs roughly the number of points near it rather than the population.
+
+    `x` and `y` are kept by reference, so the index can be reused while the
+    points move: pass the furthest any point may have travelled since the
+    build as `slack` and the result is still exact.
+    """
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.x = self.y = None
+        self.order = None
+        self.sorted_keys = None
+
+    def build(self, x, y):
+        self.x = x
+        self.y = y
+        if len(x) == 0:
+            self.order = np.zeros(0, dtype=np.int64)
+            self.sorted_keys = np.zeros(0, dtype=np.int64)
+            return
+        cx = np.floor_divide(x, self.cell_size).astype(np.int64)
+        cy = np.floor_divide(y, self.cell_size).astype(np.int64)
+        self.origin = (int(cx.min()), int(cy.min()))
+        self.columns = int(cx.max()) - self.origin[0] + 1
+        self.rows = int(cy.max()) - self.origin[1] + 1
+        keys = (cy - self.origin[1]) * self.columns + (cx - self.origin[0])
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def query_rect(self, x1, y1, x2, y2, slack=0.0):
+        """Indices of the points with x1 <= x <= x2 and y1 <= y <= y2"""
+        if self.order is None or len(self.order) == 0:
+            return np.zeros(0, dtype=np.int64)
+        col1 = max(int((x1 - slack) // self.cell_size) - self.origin[0], 0)
+        col2 = min(int((x2 + slack) // self.cell_size) - self.origin[0], self.columns - 1)
+        row1 = max(int((y1 - slack) // self.cell_size) - self.origin[1], 0)
+        row2 = min(int((y2 + slack) // self.cell_size) - self.origin[1], self.rows - 1)
+        if col1 > col2 or row1 > row2:
+            return np.zeros(0, dtype=np.int64)
+        if col1 == 0 and row1 == 0 and col2 == self.columns - 1 and row2 == self.rows - 1:
+            candidates = self.order  # the query covers every cell
+        else:
+            rows = np.arange(row1, row2 + 1) * self.columns
+            starts = np.searchsorted(self.sorted_keys, rows + col1, side='left')
+            ends = np.searchsorted(self.sorted_keys, rows + col2, side='right')
+            candidates = np.concatenate([self.order[s:e] for s, e in zip(starts, ends)])
+        cx = self.x[candidates]
+        cy = self.y[candidates]
+        inside = (cx >= x1) & (cx <= x2) & (cy >= y1) & (cy <= y2)
+        return candidates[inside]
@@ -0,0 +1,93 @@
+"""Batched NPC state machine: every timer in one array op, transitions drawn in bulk.
+
+States are small integer codes (0..S-1) in a uint8 column. Each tick
+
+    changed = machine.step(state, timer, ids, streams, tick)
+
+decrements every timer, picks the rows whose timer ran out and gives
+them a next state, drawn from row `state` of the transition table, and a
+new duration. `groups` then splits the rows by state so per-state
+kernels only touch their own NPCs:
+
+    for code, rows in machine.groups(state):
+        kernels[code](rows)
+
+Draws come from each NPC's own stream keyed by tick (see rng.py), so the
+result does not depend on how the rows are ordered or split.
+
+The table is a matrix, P(next | current) = transitions[current][next], or
+a mapping {current: {next: weight}} over the states passed as `states`;
+weights are normalised per row.
+"""
+import numpy as np
+
+# Draw lanes of the NPC streams (rng.RandomStreams `draw`) the machine uses
+NEXT_STATE_LANE = 3
+DURATION_LANE = 4
+
+
+def transition_matrix(transitions, states):
+    """(S, S) row-stochastic matrix from a matrix or {current: {next: weight}} mapping"""
+    size = len(states)
+    if isinstance(transitions, dict):
+        index = {state: code for code, state in enumerate(states)}
+        matrix = np.zeros((size, size))
+        for current, row in transitions.items():
+            for following, weight in row.items():
+                matrix[index[current], index[following]] = weight
+        # States without a row of their own keep their state
+        for code in range(size):
+            if not matrix[code].any():
+                matrix[code, code] = 1.0
+    else:
+        matrix = np.array(transitions, dtype=np.float64)
+    if matrix.shape != (size, size):
+        raise ValueError(f"transition table must be {size}x{size}, got {matrix.shape}")
+    if (matrix < 0).any() or not (matrix.sum(axis=1) > 0).all():
+        raise ValueError("transition weights must be non-negative with a positive sum per state")
+    return matrix / matrix.sum(axis=1, keepdims=True)
+
+
+class StateMachine:
+    """Timers and transitions for a whole population; see the module docstring.
+
+    `durations` is the (low, high) range of a state's duration in ticks,
+    both ends included.
+    """
+    def __init__(self, states, transitions=None, durations=(60, 180)):
+        self.states = list(states)
+        if transitions is None:
+            transitions = np.ones((len(self.states), len(self.states)))  # any state, uniformly
+        self.transitions = transition_matrix(transitions, self.states)
+        self.cumulative = np.cumsum(self.transitions, axis=1)
+        self.cumulative[:, -1] = 1.0  # no rounding gap at the top
+        self.durations = durations
+
+    def code(self, state):
+        return self.states.index(state)
+
+    def next_states(self, current, ids, streams, tick):
+        """Next state codes for rows in states `current`"""
+        u = streams.random(ids, tick, draw=NEXT_STATE_LANE)
+        return (u[:, None] >= self.cumulative[current]).sum(axis=1).astype(current.dtype)
+
+    def draw_durations(self, ids, streams, tick):
+        low, high = self.durations
+        return streams.integers(low, high + 1, ids, tick, draw=DURATION_LANE)
+
+    def step(self, state, timer, ids, streams, tick):
+        """Count every timer down and move the expired rows on; returns those rows"""
+        timer -= 1
+        expired = np.flatnonzero(timer <= 0)
+        if len(expired):
+            expired_ids = ids[expired]
+            state[expired] = self.next_states(state[expired], expired_ids, streams, tick)
+            timer[expired] = self.draw_durations(expired_ids, streams, tick)
+        return expired
+
+    def groups(self, state):
+        """(code, rows) for every state that has rows, rows in ascending order"""
+        order = np.argsort(state, kind='stable')
+        counts = np.bincount(state, minlength=len(self.states))
+        ends = np.cumsum(counts)
+        return [(code, order[end - count:end]) for code, (count, end) in enumerate(zip(counts, ends)) if count]
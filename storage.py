@@ -0,0 +1,411 @@
+"""Storage backends for NPC persistence.
+
+Every backend stores rows of one table as plain tuples in column order, so
+the simulations only deal with `load`, `write` and `replace`:
+
+    MySQLStorage   the original MySQL server (needs mysql-connector-python)
+    SQLiteStorage  a local SQLite file in WAL mode, one transaction per call
+    MemoryStorage  a dict in this process, nothing survives a restart
+
+`open_storage` picks one from a spec string ('mysql', 'sqlite',
+'sqlite:path/to/file.db' or 'memory'); the default comes from the
+SANDYBROWN_STORAGE environment variable and falls back to 'mysql'.
+
+`PersistenceWorker` moves the writes to a background thread so the
+simulation never waits on the database.
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'sandybrown',
+    'user': 'sandybrown',
+    'password': 'sandybrown'
+}
+
+DEFAULT_SQLITE_PATH = 'sandybrown.db'
+
+
+class StorageError(Exception):
+    """A backend failed to connect, read or write"""
+
+
+@dataclass
+class Table:
+    """Schema of a stored table; the first column is the primary key.
+
+    Column types are given as SQL type names and passed to the database as
+    they are (SQLite maps e.g. FLOAT(255,10) to REAL by affinity).
+    """
+    name: str
+    columns: tuple  # ((name, sql_type), ...)
+    mysql_options: str = ''  # appended to CREATE TABLE on MySQL only
+
+    @property
+    def key(self):
+        return self.columns[0][0]
+
+    @property
+    def column_names(self):
+        return [name for name, _ in self.columns]
+
+
+class Storage(ABC):
+    """Interface shared by the backends"""
+    def __init__(self, table, batch_size=1000):
+        self.table = table
+        self.batch_size = batch_size  # rows per executemany call
+
+    def load(self):
+        """Every stored row, as tuples in column order"""
+        return [row for chunk in self.load_chunks() for row in chunk]
+
+    @abstractmethod
+    def load_chunks(self, chunk_size=None):
+        """Stored rows in lists of up to `chunk_size` (default batch_size) tuples.
+
+        Rows are streamed, so only one chunk is held at a time.
+        """
+
+    @abstractmethod
+    def write(self, rows=(), deleted=()):
+        """Upsert `rows` and delete the keys in `deleted` in one transaction.
+
+        Returns the number of rows written.
+        """
+
+    @abstractmethod
+    def replace(self, rows):
+        """Make `rows` the whole content of the table in one transaction"""
+
+    def clear(self):
+        self.replace(())
+
+    def close(self):
+        pass
+
+
+class SQLStorage(Storage):
+    """Shared code for DB-API backends; subclasses set the connection and SQL dialect"""
+    placeholder = '?'
+
+    def __init__(self, table, batch_size=1000):
+        super().__init__(table, batch_size)
+        self.connection = None
+        names = table.column_names
+        marks = ', '.join([self.placeholder] * len(names))
+        self.select_sql = f"SELECT {', '.join(names)} FROM {table.name}"
+        self.insert_sql = f"INSERT INTO {table.name} ({', '.join(names)}) VALUES ({marks})"
+        self.upsert_sql = self.insert_sql + ' ' + self.upsert_clause(names[1:])
+        self.delete_sql = f"DELETE FROM {table.name} WHERE {table.key} = {self.placeholder}"
+
+    @abstractmethod
+    def upsert_clause(self, columns):
+        """SQL appended to INSERT to update the non-key `columns` of an existing row"""
+
+    def create_table_sql(self):
+        columns = ', '.join(f"{name} {sql_type}" for name, sql_type in self.table.columns)
+        return f"CREATE TABLE IF NOT EXISTS {self.table.name} ({columns}, PRIMARY KEY ({self.table.key}))"
+
+    def executemany(self, cursor, sql, rows):
+        rows = list(rows)
+        for start in range(0, len(rows), self.batch_size):
+            cursor.executemany(sql, rows[start:start + self.batch_size])
+        return len(rows)
+
+    def transaction(self, work):
+        """Run work(cursor) and commit, or roll back and raise StorageError"""
+        try:
+            cursor = self.connection.cursor()
+            result = work(cursor)
+            self.connection.commit()
+            return result
+        except self.errors as e:
+            try:
+                self.connection.rollback()
+            except self.errors:
+                pass
+            raise StorageError(str(e)) from e
+
+    def load_chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.batch_size
+        try:
+            # Plain (tuple) cursor; fetchmany keeps one chunk in memory at a time
+            cursor = self.connection.cursor()
+            cursor.execute(self.select_sql)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        except self.errors as e:
+            raise StorageError(str(e)) from e
+
+    def write(self, rows=(), deleted=()):
+        def work(cursor):
+            written = self.executemany(cursor, self.upsert_sql, rows)
+            return written + self.executemany(cursor, self.delete_sql, [(key,) for key in deleted])
+        return self.transaction(work)
+
+    def replace(self, rows):
+        def work(cursor):
+            cursor.execute(f"DELETE FROM {self.table.name}")
+            return self.executemany(cursor, self.insert_sql, rows)
+        return self.transaction(work)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class SQLiteStorage(SQLStorage):
+    """Embedded SQLite database file, no server needed"""
+    placeholder = '?'
+    errors = (sqlite3.Error,)
+
+    def __init__(self, table, path=DEFAULT_SQLITE_PATH, batch_size=1000):
+        super().__init__(table, batch_size)
+        self.path = path
+        try:
+            # Transactions are opened implicitly before writes and ended by commit().
+            # The connection may be handed to a PersistenceWorker thread, but is
+            # only ever used by one thread at a time.
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            if path != ':memory:':
+                # WAL lets readers run during a write; NORMAL only syncs at checkpoints
+                self.connection.execute("PRAGMA journal_mode=WAL")
+                self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(self.create_table_sql())
+            self.connection.commit()
+        except sqlite3.Error as e:
+            raise StorageError(f"cannot open {path}: {e}") from e
+
+    def upsert_clause(self, columns):
+        updates = ', '.join(f"{name} = excluded.{name}" for name in columns)
+        return f"ON CONFLICT ({self.table.key}) DO UPDATE SET {updates}"
+
+
+class MySQLStorage(SQLStorage):
+    """MySQL server through mysql-connector-python"""
+    placeholder = '%s'
+
+    def __init__(self, table, config=None, batch_size=1000):
+        try:
+            import mysql.connector
+        except ImportError as e:
+            raise StorageError("mysql-connector-python is not installed") from e
+        self.errors = (mysql.connector.Error,)
+        super().__init__(table, batch_size)
+        try:
+            self.connection = mysql.connector.connect(**(config or DB_CONFIG))
+            cursor = self.connection.cursor()
+            cursor.execute(self.create_table_sql() + ' ' + self.table.mysql_options)
+            self.connection.commit()
+        except mysql.connector.Error as e:
+            raise StorageError(f"cannot connect to MySQL: {e}") from e
+
+    def upsert_clause(self, columns):
+        updates = ', '.join(f"{name} = VALUES({name})" for name in columns)
+        return f"ON DUPLICATE KEY UPDATE {updates}"
+
+    def close(self):
+        if self.connection is not None and self.connection.is_connected():
+            self.connection.close()
+        self.connection = None
+
+
+class MemoryStorage(Storage):
+    """Rows kept in a dict; for tests, benchmarks and machines without a database"""
+    def __init__(self, table, batch_size=1000):
+        super().__init__(table, batch_size)
+        self.rows = {}  # key -> row
+
+    def load_chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.batch_size
+        rows = list(self.rows.values())
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+    def write(self, rows=(), deleted=()):
+        written = 0
+        for row in rows:
+            self.rows[row[0]] = tuple(row)
+            written += 1
+        for key in deleted:
+            self.rows.pop(key, None)
+            written += 1
+        return written
+
+    def replace(self, rows):
+        self.rows = {}
+        return self.write(rows)
+
+
+def open_storage(table, spec=None, batch_size=1000, fallback=True):
+    """Open the backend described by `spec` (see the module docstring).
+
+    If MySQL was asked for and cannot be reached, print why and use
+    MemoryStorage instead so the simulation still runs, unless `fallback`
+    is False.
+    """
+    spec = spec or os.environ.get('SANDYBROWN_STORAGE', 'mysql')
+    kind, _, arg = spec.partition(':')
+    if kind == 'memory':
+        return MemoryStorage(table, batch_size)
+    if kind == 'sqlite':
+        return SQLiteStorage(table, arg or DEFAULT_SQLITE_PATH, batch_size)
+    if kind == 'mysql':
+        try:
+            return MySQLStorage(table, batch_size=batch_size)
+        except StorageError as e:
+            if not fallback:
+                raise
+            print(f"Database error: {e}; keeping NPCs in memory only")
+            return MemoryStorage(table, batch_size)
+    raise ValueError(f"unknown storage {spec!r}, expected mysql, sqlite[:path] or memory")
+
+
+class ChangeTracker:
+    """Remembers the last row saved for every key and reports what changed.
+
+    Rows are compared whole, like NPCSimulator.dirty_rows in 002, so NPCs
+    need no dirty flag of their own: a row that differs from the saved one
+    is dirty, a saved key that is no longer present was deleted.
+    """
+    def __init__(self):
+        self.saved = {}  # key -> row as last handed to storage
+
+    def mark_saved(self, rows):
+        """Record rows that are already in storage (e.g. just loaded)"""
+        for row in rows:
+            self.saved[row[0]] = row
+
+    def changes(self, rows):
+        """(changed_rows, deleted_keys) since the last call; `rows` is the full current table"""
+        saved = self.saved
+        changed = []
+        present = set()
+        for row in rows:
+            key = row[0]
+            present.add(key)
+            if saved.get(key) != row:
+                changed.append(row)
+                saved[key] = row
+        deleted = [key for key in saved if key not in present]
+        for key in deleted:
+            del saved[key]
+        return changed, deleted
+
+
+class PersistenceWorker:
+    """Write change sets to a Storage from a background thread.
+
+    `submit` never blocks: it merges the changes into a single pending set
+    and returns. A newer row for a key replaces the pending one and a delete
+    cancels a pending upsert, so however slow the database is the backlog
+    never grows past one row per NPC. Each set is written with storage.write
+    in one transaction; a set that fails is merged back under newer changes
+    and retried with the next one.
+
+    Rows must be immutable tuples because the worker reads them while the
+    simulation keeps running.
+    """
+    def __init__(self, storage):
+        self.storage = storage
+        self.pending_rows = {}  # key -> row
+        self.pending_deleted = set()
+        self.busy = False
+        self.stalled = False  # last write failed; waiting for new work to retry
+        self.closing = False
+        self.flushes = 0
+        self.rows_written = 0  # total rows upserted or deleted
+        self.last_rows_written = 0  # rows in the most recent flush
+        self.coalesced = 0  # changes made obsolete before they were written
+        self.last_error = None
+        self.last_write_seconds = 0.0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='persistence', daemon=True)
+        self.thread.start()
+
+    def _merge(self, rows, deleted):
+        for row in rows:
+            key = row[0]
+            if key in self.pending_rows or key in self.pending_deleted:
+                self.coalesced += 1
+            self.pending_deleted.discard(key)
+            self.pending_rows[key] = row
+        for key in deleted:
+            if self.pending_rows.pop(key, None) is not None:
+                self.coalesced += 1
+            self.pending_deleted.add(key)
+
+    def submit(self, rows=(), deleted=()):
+        """Queue upserts for `rows` and deletes for the keys in `deleted`"""
+        if not rows and not deleted:
+            return
+        with self.condition:
+            self._merge(rows, deleted)
+            self.stalled = False  # new work means the worker retries
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not (self.pending_rows or self.pending_deleted or self.closing):
+                    self.condition.wait()
+                if not (self.pending_rows or self.pending_deleted):
+                    return
+                rows = list(self.pending_rows.values())
+                deleted = list(self.pending_deleted)
+                self.pending_rows = {}
+                self.pending_deleted = set()
+                self.busy = True
+            start = time.perf_counter()
+            failed = False
+            try:
+                written = self.storage.write(rows, deleted)
+            except StorageError as e:
+                self.last_error = e
+                failed = True
+                print(f"Error saving NPCs: {e}")
+            self.last_write_seconds = time.perf_counter() - start
+            with self.condition:
+                if failed:
+                    # Put the set back underneath anything submitted meanwhile
+                    newer_rows, newer_deleted = self.pending_rows, self.pending_deleted
+                    self.pending_rows, self.pending_deleted = {}, set()
+                    self._merge(rows, deleted)
+                    self._merge(newer_rows.values(), newer_deleted)
+                else:
+                    self.flushes += 1
+                    self.rows_written += written
+                    self.last_rows_written = written
+                self.busy = False
+                self.stalled = failed
+                self.condition.notify_all()
+                if failed and not self.closing:
+                    # Retry when more work arrives instead of spinning on a dead database
+                    self.condition.wait()
+                elif failed:
+                    return
+
+    def flush(self, timeout=None):
+        """Wait until every submitted change is written; False on timeout or a failed write"""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.stalled or not (self.pending_rows or self.pending_deleted or self.busy), timeout)
+            return not (self.pending_rows or self.pending_deleted or self.busy)
+
+    def close(self):
+        """Write what is still pending, stop the thread and close the storage"""
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.storage.close()
@@ -0,0 +1,64 @@
+"""Put the repository root on sys.path, keep the scripts off MySQL, and build their worlds.
+
+Test modules import the helpers below with `from conftest import ...`.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault('SANDYBROWN_STORAGE', 'memory')
+
+from scripts import load_script  # noqa: E402  (needs ROOT on sys.path)
+
+# (script, class) of every simulated world
+WORLDS = [
+    ('sandybrown.py', 'NPCSimulator'),
+    ('sandybrown.py', 'VectorizedNPCSimulator'),
+    ('002-base de datos.py', 'NPCSimulator'),
+    ('003-personaje principal.py', 'GameWorld'),
+    ('003-personaje principal.py', 'VectorizedGameWorld'),
+    ('004-areas.py', 'GameWorld'),
+    ('004-areas.py', 'VectorizedGameWorld'),
+]
+
+
+def worlds_with(method):
+    """The WORLDS whose class has `method`"""
+    return [(script, name) for script, name in WORLDS if hasattr(getattr(load_script(script), name), method)]
+
+
+def add_npcs(world, count):
+    if hasattr(world, 'create_npc_set'):
+        world.create_npc_set(count)
+    else:
+        world.create_initial_npcs(count)
+
+
+def make_world(script, name, seed, npcs=100, width=800, height=600):
+    """A windowless world with `npcs` more NPCs, persisting (if it does) to memory"""
+    cls = getattr(load_script(script), name)
+    if script == 'sandybrown.py':
+        world = cls(width, height, seed=seed)
+    elif script == '002-base de datos.py':
+        world = cls(width, height, storage='memory', seed=seed)
+    else:
+        world = cls(width, height, headless=True, storage='memory', seed=seed)
+    add_npcs(world, npcs)
+    return world
+
+
+def close_world(world):
+    """Stop a world's persistence worker and thread pool, if it has them"""
+    if getattr(world, 'persistence', None) is not None:
+        world.close_database()
+    if hasattr(world, 'close'):
+        world.close()
+
+
+def snapshot(world):
+    """Every NPC's checkpoint record, as bytes, and name"""
+    records, names = world.checkpoint_records()
+    return records.tobytes(), list(names)
@@ -0,0 +1,83 @@
+"""004 GameMap area index and the NPCs' cached targets."""
+import random
+
+import pytest
+
+from rng import RandomStreams
+from scripts import load_script
+
+areas = load_script('004-areas.py')
+
+
+def brute_area_at(game_map, x, y):
+    """Last area whose rect (edges included) holds the point, as create_map_image paints them"""
+    found = None
+    for area in game_map.areas:
+        x1, y1, x2, y2 = area['rect']
+        if x1 <= x <= x2 and y1 <= y <= y2:
+            found = area
+    return found
+
+
+@pytest.fixture
+def game_map():
+    game_map = areas.GameMap(300, 200)
+    game_map.add_area(areas.AreaType.COMERCIAL, (50, 40, 120, 90), (1, 2, 3))  # on top of others
+    return game_map
+
+
+def test_area_at_matches_brute_force(game_map):
+    rng = random.Random(1)
+    points = [(rng.randrange(300), rng.randrange(200)) for _ in range(2000)] + [(0, 0), (299, 199), (100, 100)]
+    for x, y in points:
+        assert game_map.area_at(x, y) is brute_area_at(game_map, x, y)
+
+
+def test_areas_of_type(game_map):
+    for area_type in areas.AreaType:
+        assert game_map.areas_of_type(area_type) == [a for a in game_map.areas if a['type'] == area_type]
+
+
+def test_edits_refresh_the_index(game_map):
+    version = game_map.version
+    added = game_map.areas[-1]
+    game_map.update_area(added, type=areas.AreaType.RURAL, rect=(200, 150, 260, 190))
+    assert game_map.version == version + 1
+    assert game_map.area_at(60, 50) is brute_area_at(game_map, 60, 50)
+    assert game_map.area_at(210, 160) is added and added in game_map.areas_of_type(areas.AreaType.RURAL)
+    game_map.remove_area(added)
+    assert game_map.version == version + 2
+    assert added not in game_map.areas_of_type(areas.AreaType.RURAL)
+    assert game_map.area_at(210, 160) is brute_area_at(game_map, 210, 160)
+
+
+def make_npc(game_map, state=areas.NPCState.WORKING):
+    npc = areas.NPC(10, 10, 1, 'Alex_1', state=state, rng=RandomStreams(3).stream(1))
+    npc.state_timer = 1000
+    npc.think([npc], game_map)
+    return npc
+
+
+def test_target_is_kept_until_the_map_changes(game_map):
+    npc = make_npc(game_map)
+    target = (npc.target_area, npc.target_x, npc.target_y)
+    assert npc.target_area in game_map.areas_of_type(npc.work_area)
+    counter = npc.rng.counter
+    for _ in range(20):
+        npc.think([npc], game_map)
+    assert (npc.target_area, npc.target_x, npc.target_y) == target
+    assert npc.rng.counter == counter  # nothing was drawn again
+
+    game_map.add_area(areas.AreaType.RURAL, (0, 0, 20, 20), (9, 9, 9))
+    npc.think([npc], game_map)
+    assert npc.target_version == game_map.version
+    assert npc.rng.counter > counter
+
+
+def test_arriving_picks_a_new_point_in_the_same_area(game_map):
+    npc = make_npc(game_map)
+    area = npc.target_area
+    npc.x, npc.y = npc.target_x, npc.target_y
+    npc.move(game_map)
+    x1, y1, x2, y2 = area['rect']
+    assert npc.target_area is area and x1 <= npc.target_x <= x2 and y1 <= npc.target_y <= y2
@@ -0,0 +1,36 @@
+"""The cached static layer behind GameWorld.draw and NPCSimulator.draw."""
+import numpy as np
+import pytest
+
+from conftest import make_world, worlds_with
+
+WORLDS = worlds_with('background')
+
+
+def build(script, name):
+    world = make_world(script, name, seed=1, npcs=10, width=400, height=300)
+    return world, getattr(world, 'render', world.draw)  # 003 draws into a window
+
+
+@pytest.mark.parametrize('script, name', WORLDS)
+def test_background_is_reused_and_left_untouched(script, name):
+    world, draw = build(script, name)
+    background = world.background()
+    pristine = background.copy()
+    for _ in range(3):
+        world.update()
+        frame = draw()
+        assert frame is not background
+    assert world.background() is background
+    assert np.array_equal(background, pristine)
+
+
+@pytest.mark.parametrize('script, name', WORLDS)
+def test_background_is_rebuilt_when_invalidated_or_resized(script, name):
+    world, _ = build(script, name)
+    background = world.background()
+    world.invalidate_background()
+    rebuilt = world.background()
+    assert rebuilt is not background and np.array_equal(rebuilt, background)
+    world.world_img = np.zeros((world.height, world.width, 3), dtype=np.uint8)[:-1]
+    assert world.background().shape == world.world_img.shape
@@ -0,0 +1,89 @@
+"""Benchmark suite: JSON output and the comparison against a baseline."""
+import copy
+import json
+import os
+import sys
+
+import pytest
+
+from scripts import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import bench_suite  # noqa: E402  (needs benchmarks/ on sys.path)
+
+TINY = ['--sizes', '30', '--ticks', '2', '--frames', '1', '--budget', '0.2', '--repeat', '1']
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['bench_suite.py', *args])
+    bench_suite.main()
+
+
+@pytest.fixture(scope='module')
+def report(tmp_path_factory):
+    path = tmp_path_factory.mktemp('bench') / 'results.json'
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        run_main(monkeypatch, '--targets', 'sandybrown', 'vectorized', '003', *TINY, '--output', str(path))
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_output_schema(report):
+    assert set(report) == {'environment', 'settings', 'results'}
+    assert {'time', 'commit', 'python', 'numpy', 'platform', 'cpus'} <= set(report['environment'])
+    assert report['settings']['sizes'] == [30]
+    assert [(r['target'], r['npcs']) for r in report['results']] == [('sandybrown', 30), ('vectorized', 30),
+                                                                      ('003', 30)]
+    db_metrics = {'db_save_rows_per_sec', 'db_load_rows_per_sec'}
+    for result in report['results']:
+        expected = set(bench_suite.METRICS) - (db_metrics if result['target'] != '003' else set())
+        assert set(result) - {'target', 'npcs'} == expected
+        assert all(result[metric] > 0 for metric in expected)
+
+
+def shifted(report, changes):
+    """The report with metric values multiplied, as {(target, metric): factor}"""
+    baseline = copy.deepcopy(report)
+    for result in baseline['results']:
+        for metric in bench_suite.METRICS:
+            if metric in result:
+                result[metric] *= changes.get((result['target'], metric), 1.0)
+    return baseline
+
+
+def test_compare_flags_regressions_beyond_tolerance(report, capsys):
+    baseline = shifted(report, {
+        ('sandybrown', 'ticks_per_sec'): 2.0,  # was twice as fast: regression
+        ('sandybrown', 'render_ms'): 2.0,  # was twice as slow: improvement
+        ('vectorized', 'bytes_per_npc'): 0.5,  # used half the memory: regression
+        ('003', 'db_save_rows_per_sec'): 1.05,  # 5% slower: within tolerance
+    })
+    regressions = bench_suite.compare(report['results'], baseline, tolerance=0.1)
+    assert sorted((target, metric) for target, _, metric, _ in regressions) == [
+        ('sandybrown', 'ticks_per_sec'), ('vectorized', 'bytes_per_npc')]
+    change = {(target, metric): change for target, _, metric, change in regressions}
+    assert change['sandybrown', 'ticks_per_sec'] == pytest.approx(-0.5)
+    assert change['vectorized', 'bytes_per_npc'] == pytest.approx(-1.0)
+    assert capsys.readouterr().out.count('REGRESSION') == 2
+    assert bench_suite.compare(report['results'], report, tolerance=0.0) == []
+
+
+def test_compare_skips_results_without_a_baseline(report):
+    baseline = shifted(report, {('003', 'ticks_per_sec'): 10.0})
+    baseline['results'] = [r for r in baseline['results'] if r['target'] != '003']
+    assert bench_suite.compare(report['results'], baseline, tolerance=0.1) == []
+
+
+def test_main_exits_1_on_regression(report, tmp_path, monkeypatch):
+    path = tmp_path / 'baseline.json'
+    # A fresh run against the report: only flag what no timing noise explains
+    args = ['--targets', 'sandybrown', *TINY, '--baseline', str(path), '--tolerance', '0.99']
+    with open(path, 'w') as f:
+        json.dump(shifted(report, {('sandybrown', 'checkpoint_save_rows_per_sec'): 1e6}), f)
+    with pytest.raises(SystemExit) as exit:
+        run_main(monkeypatch, *args)
+    assert exit.value.code == 1
+    # Far in the other direction nothing is flagged
+    with open(path, 'w') as f:
+        json.dump(shifted(report, {('sandybrown', 'checkpoint_save_rows_per_sec'): 1e-6}), f)
+    run_main(monkeypatch, *args)
@@ -0,0 +1,74 @@
+"""Camera, CellIndex culling and the level-of-detail renderer."""
+import numpy as np
+import pytest
+
+from render import Camera, LODRenderer
+from spatial import CellIndex
+
+
+def brute_rect(x, y, x1, y1, x2, y2):
+    return set(np.flatnonzero((x >= x1) & (x <= x2) & (y >= y1) & (y <= y2)).tolist())
+
+
+@pytest.mark.parametrize('cell_size', [5, 64, 5000])
+def test_cell_index_matches_brute_force(cell_size):
+    rng = np.random.default_rng(1)
+    x = rng.uniform(-300, 900, 3000)
+    y = rng.uniform(0, 600, 3000)
+    index = CellIndex(cell_size)
+    index.build(x, y)
+    for x1, y1, w, h in rng.uniform(-400, 900, (40, 4)):
+        rect = (x1, y1, x1 + abs(w) / 2, y1 + abs(h) / 2)
+        assert set(index.query_rect(*rect).tolist()) == brute_rect(x, y, *rect)
+    assert set(index.query_rect(-1e9, -1e9, 1e9, 1e9).tolist()) == set(range(3000))
+    assert len(index.query_rect(2000, 2000, 3000, 3000)) == 0
+
+
+def test_cell_index_with_slack_after_moves():
+    rng = np.random.default_rng(2)
+    x = rng.uniform(0, 1000, 2000)
+    y = rng.uniform(0, 1000, 2000)
+    index = CellIndex(64)
+    index.build(x, y)
+    # The index keeps the arrays by reference: move the points in place, at most 30 units
+    x += rng.uniform(-30, 30, 2000)
+    y += rng.uniform(-30, 30, 2000)
+    for rect in ((100, 100, 300, 250), (0, 900, 60, 1000), (500, 500, 500.5, 500.5)):
+        assert set(index.query_rect(*rect, slack=30).tolist()) == brute_rect(x, y, *rect)
+    empty = CellIndex()
+    empty.build(np.zeros(0), np.zeros(0))
+    assert len(empty.query_rect(0, 0, 10, 10)) == 0
+
+
+def test_camera():
+    camera = Camera(400, 300)
+    camera.fit(4000, 1000)
+    assert camera.zoom == pytest.approx(0.1)
+    x1, y1, x2, y2 = camera.visible_rect()
+    assert x1 == pytest.approx(0) and x2 == pytest.approx(4000) and y1 <= 0 and y2 >= 1000
+    assert camera.to_screen(x1, y1) == pytest.approx((0, 0))
+    assert camera.to_screen(x2, y2) == pytest.approx((400, 300))
+    camera.pan(40, 0)  # screen pixels
+    assert camera.x == pytest.approx(2400)
+    camera.zoom_by(1e6)
+    assert camera.zoom == camera.max_zoom
+    camera.zoom_by(1e-9)
+    assert camera.zoom == camera.min_zoom
+
+
+@pytest.mark.parametrize('zoom, level', [(1.0, 'detail'), (0.5, 'dots'), (0.05, 'heatmap')])
+def test_lod_levels_and_culling(zoom, level):
+    rng = np.random.default_rng(3)
+    x = rng.uniform(0, 2000, 500)
+    y = rng.uniform(0, 2000, 500)
+    direction = np.zeros(500)
+    colors = rng.integers(0, 255, (500, 3))
+    camera = Camera(200, 100, x=1000, y=1000, zoom=zoom)
+    index = CellIndex(64)
+    index.build(x, y)
+    renderer = LODRenderer()
+    img = renderer.render(camera, 2000, 2000, x, y, direction, colors, index=index)
+    assert img.shape == (100, 200, 3)
+    assert renderer.last_level == level
+    margin = 100 if level == 'detail' else 2
+    assert renderer.last_visible == len(brute_rect(x, y, *camera.visible_rect(margin)))
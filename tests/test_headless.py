@@ -0,0 +1,67 @@
+"""Headless runner: builds every script's world without a window and ticks it."""
+import os
+import sys
+
+import pytest
+
+import headless
+from conftest import WORLDS
+from scripts import ROOT, load_script
+
+
+class Counter:
+    def __init__(self):
+        self.ticks = 0
+
+    def update(self):
+        self.ticks += 1
+
+
+def test_runner_counts_ticks():
+    world = Counter()
+    runner = headless.HeadlessRunner(world)
+    assert runner.run(ticks=25)['ticks'] == 25
+    assert runner.run(ticks=5)['ticks'] == 30
+    assert world.ticks == 30
+    with pytest.raises(ValueError):
+        runner.run()
+
+
+def test_runner_throttles_to_the_tick_rate():
+    stats = headless.HeadlessRunner(Counter(), tick_rate=200).run(ticks=1000, duration=0.1)
+    assert 10 <= stats['ticks'] <= 30
+
+
+@pytest.mark.parametrize('script, name', WORLDS)
+def test_build_world(script, name):
+    module = load_script(script)
+    storage = 'memory' if hasattr(module, 'NPC_TABLE') else None
+    world = headless.build_world(module, 400, 300, 30, name.startswith('Vectorized'), storage, seed=1)
+    assert len(world.npcs) >= 30
+    headless.HeadlessRunner(world).run(ticks=3)
+    if hasattr(world, 'close_database'):
+        world.close_database()
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['headless.py', *args])
+    headless.main()
+
+
+def test_main(monkeypatch, capsys):
+    run_main(monkeypatch, os.path.join(ROOT, '004-areas.py'), '--npcs', '20', '--ticks', '5', '--storage', 'memory',
+             '--ai-slices', '4')
+    assert '5 ticks' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('args', [
+    ['002-base de datos.py', '--vectorized', '--storage', 'memory'],
+    ['sandybrown.py', '--storage', 'memory'],
+    ['sandybrown.py', '--ai-slices', '4'],
+    ['004-areas.py', '--vectorized', '--ai-slices', '4', '--storage', 'memory'],
+])
+def test_main_rejects_unsupported_options(monkeypatch, capsys, args):
+    with pytest.raises(SystemExit) as exit:
+        run_main(monkeypatch, os.path.join(ROOT, args[0]), *args[1:], '--ticks', '1')
+    assert exit.value.code == 2
+    assert 'error: --' in capsys.readouterr().err
@@ -0,0 +1,31 @@
+"""NameTable: names survive encode/decode, bases are stored once."""
+import numpy as np
+
+from names import NO_NUMBER, NameTable
+
+
+def test_round_trip():
+    names = ['Mage_1', 'Mage_2', 'Bob', 'Mage_07', 'Guard_0', 'Ana_-3', 'x_99999999999', 'Zoë_5', '_4', 'trail_']
+    table = NameTable()
+    codes, numbers = table.encode(names)
+    assert [table.decode(code, number) for code, number in zip(codes, numbers)] == names
+    assert table.decode_many(codes, numbers) == names
+
+
+def test_bases_are_interned_once():
+    table = NameTable()
+    codes, numbers = table.encode([f'Warrior_{i}' for i in range(1, 1001)] + ['Mage_1', 'Warrior_5'])
+    assert len(table) == 2
+    assert set(codes.tolist()) == {0, 1}
+    assert numbers[:3].tolist() == [1, 2, 3]
+    assert table.intern('Warrior') == 0
+
+
+def test_only_canonical_numbers_are_split():
+    table = NameTable()
+    assert table.split('Mage_12') == ('Mage', 12)
+    assert table.split('Mage_0') == ('Mage', 0)
+    for name in ('Mage_012', 'Mage_+1', 'Mage_١', 'Mage_99999999999', 'Mage'):
+        assert table.split(name) == (name, NO_NUMBER)
+    codes, numbers = table.encode([])
+    assert codes.dtype == np.uint32 and len(codes) == len(numbers) == 0
@@ -0,0 +1,57 @@
+"""Batched, diff-only saves of the 002 simulator."""
+import pytest
+
+from scripts import load_script
+
+module = load_script('002-base de datos.py')
+
+
+@pytest.fixture
+def simulator():
+    simulator = module.NPCSimulator(800, 600, batch_size=7, storage='memory', seed=3)
+    yield simulator
+    simulator.storage.close()
+
+
+def stored(simulator):
+    return sorted(simulator.storage.load())
+
+
+def test_save_writes_only_changed_rows(simulator):
+    simulator.create_npc_set(20)
+    assert simulator.save_to_database(force=True) == 20
+    assert simulator.save_to_database(force=True) == 0
+    simulator.npcs[3].x += 1.0
+    assert simulator.save_to_database(force=True) == 1
+    assert stored(simulator) == sorted(map(simulator.npc_row, simulator.npcs))
+
+
+def test_deletes_go_out_with_the_next_flush(simulator):
+    simulator.create_npc_set(5)
+    simulator.save_to_database(force=True)
+    removed = simulator.npcs.pop()
+    simulator.deleted_ids.add(removed.id)
+    assert simulator.save_to_database(force=True) == 1
+    assert removed.id not in {row[0] for row in stored(simulator)}
+    assert not simulator.deleted_ids
+
+
+def test_flush_interval(simulator):
+    simulator.flush_interval = 3600
+    simulator.create_npc_set(5)
+    assert simulator.save_to_database(force=True) == 5
+    simulator.update()
+    assert simulator.save_to_database() == 0  # too soon
+    assert stored(simulator) != sorted(map(simulator.npc_row, simulator.npcs))
+    assert simulator.save_to_database(force=True) == 5
+
+
+def test_load_restores_saved_rows(simulator):
+    simulator.create_npc_set(30)
+    simulator.update()
+    simulator.save_to_database(force=True)
+    rows = stored(simulator)
+    simulator.load_from_database()
+    assert sorted(map(simulator.npc_row, simulator.npcs)) == rows
+    assert simulator.save_to_database(force=True) == 0
+    assert simulator.next_id == max(row[0] for row in rows) + 1
@@ -0,0 +1,69 @@
+"""Structure-of-arrays NPC storage and the vectorized move."""
+import math
+
+import numpy as np
+
+from rng import RandomStreams
+from sandybrown import NPCPopulation, VectorizedNPCSimulator, move_npcs
+
+
+def test_add_grows_and_views_follow_rows():
+    population = NPCPopulation(capacity=2)
+    for i in range(5):
+        population.add(i, i * 10.0, i * 20.0, f"Mage_{i}", 0.5, 1.0, (i, 2 * i, 3 * i))
+    assert population.size == 5 and len(population.ids) >= 5
+    view = population.views[3]
+    assert (view.id, view.x, view.y, view.name, view.color) == (3, 30.0, 60.0, "Mage_3", (3, 6, 9))
+    view.x = 99.0
+    assert population.x[3] == 99.0
+    assert list(population.names) == [f"Mage_{i}" for i in range(5)]
+
+
+def test_remove_moves_the_last_row_into_place():
+    population = NPCPopulation()
+    population.add_many([1, 2, 3], [1.0, 2.0, 3.0], [0.0] * 3, ["Guard_1", "King_2", "Bard_3"],
+                        [0.0] * 3, [1.0] * 3, [(0, 0, 0)] * 3)
+    removed = population.remove(0)
+    assert (removed.id, removed.x, removed.name) == (1, 1.0, "Guard_1")
+    assert population.size == 2
+    assert population.ids[:2].tolist() == [3, 2]
+    assert list(population.names) == ["Bard_3", "King_2"]
+
+
+def test_move_stays_inside_the_world():
+    streams = RandomStreams(4)
+    ids = np.arange(2000)
+    x = streams.uniform(0, 300, ids, 0)
+    y = streams.uniform(0, 200, ids, 1)
+    direction = streams.uniform(0, 2 * math.pi, ids, 2)
+    speed = np.full(2000, 25.0)
+    for tick in range(50):
+        move_npcs(ids, x, y, direction, speed, 300, 200, streams, tick)
+        assert (x >= 0).all() and (x <= 300).all() and (y >= 0).all() and (y <= 200).all()
+
+
+def test_rows_move_the_same_alone_or_together():
+    streams = RandomStreams(5)
+    ids = np.arange(100)
+    start = [streams.uniform(0, 800, ids, 0), streams.uniform(0, 600, ids, 1),
+             streams.uniform(0, 2 * math.pi, ids, 2), streams.uniform(0.5, 3.0, ids, 3)]
+    together = [column.copy() for column in start]
+    alone = [column.copy() for column in start]
+    for tick in range(20):
+        move_npcs(ids, *together, 800, 600, streams, tick)
+        for lo in range(0, 100, 7):
+            move_npcs(ids[lo:lo + 7], *(column[lo:lo + 7] for column in alone), 800, 600, streams, tick)
+    for a, b in zip(together, alone):
+        assert np.array_equal(a, b)
+
+
+def test_simulator_add_and_remove():
+    simulator = VectorizedNPCSimulator(800, 600, capacity=4, seed=2)
+    simulator.create_npc_set(10)
+    assert len(simulator.npcs) == 10
+    last_id = simulator.npcs[9].id
+    removed = simulator.remove_npc()
+    assert removed.id == last_id and len(simulator.npcs) == 9
+    for _ in range(5):
+        simulator.update()
+    assert len({npc.id for npc in simulator.npcs}) == 9
@@ -0,0 +1,93 @@
+"""Profiler: per-frame phase totals, percentiles and the Chrome trace."""
+import json
+
+import numpy as np
+import pytest
+
+from profiler import NULL_PROFILER, Profiler, from_environment
+from sandybrown import NPCSimulator
+
+
+def test_phases_are_summed_per_frame():
+    profiler = Profiler(window=3)
+    for frame in range(5):
+        profiler.add('update', 0.0, 0.001 * (frame + 1))
+        profiler.add('update', 1.0, 1.001)  # a second run in the same frame adds up
+        if frame % 2 == 0:
+            profiler.add('draw', 0.0, 0.002)
+        profiler.frame()
+    assert profiler.frames == 5
+    assert profiler.order == ['update', 'draw']
+    # Only the last `window` frames count; a frame without the phase counts as 0
+    assert np.allclose(list(profiler.samples['update']), [0.004, 0.005, 0.006])
+    assert np.allclose(list(profiler.samples['draw']), [0.002, 0.0, 0.002])
+    assert profiler.percentiles('update')[0] == pytest.approx(5.0)
+    assert profiler.percentiles('missing') == (0.0, 0.0, 0.0)
+    report = profiler.report()
+    assert report.startswith('5 frames') and 'update' in report and 'draw' in report
+
+
+def test_trace(tmp_path):
+    profiler = Profiler(trace=True)
+    with profiler.phase('update'):
+        with profiler.phase('state'):
+            pass
+    profiler.frame()
+    path = str(tmp_path / 'trace.json')
+    profiler.save_trace(path)
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    assert [event['name'] for event in events] == ['state', 'update']
+    state, update = events
+    assert update['ts'] <= state['ts'] and state['ts'] + state['dur'] <= update['ts'] + update['dur']
+    with pytest.raises(ValueError):
+        Profiler().save_trace(path)
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv('SANDYBROWN_PROFILE', raising=False)
+    monkeypatch.delenv('SANDYBROWN_TRACE', raising=False)
+    assert from_environment() is NULL_PROFILER
+    with NULL_PROFILER.phase('update'):
+        pass
+    monkeypatch.setenv('SANDYBROWN_TRACE', str(tmp_path / 'trace.json'))
+    profiler = from_environment()
+    assert profiler.enabled and profiler.trace_path == str(tmp_path / 'trace.json')
+
+
+def test_overlay_is_restored_by_the_dirty_rect_renderer():
+    profiler = Profiler()
+    simulator = NPCSimulator(400, 300, dirty_rects=True, seed=1, profiler=profiler)
+    simulator.create_npc_set(20)
+    for frame in range(30):
+        simulator.update()
+        # Fake timings, so the table's text changes every frame
+        profiler.add('update', 0.0, 0.001 * (frame % 7 + 1))
+        profiler.add('draw', 0.0, 0.01 * (frame % 3 + 1))
+        profiler.frame()
+        img = simulator.draw().copy()
+        renderer, simulator.renderer = simulator.renderer, None
+        full = simulator.draw()
+        simulator.renderer = renderer
+        assert np.array_equal(img, full)
+    # The table is part of the frame, and leaves nothing behind once it is gone
+    simulator.profiler = NULL_PROFILER
+    assert not np.array_equal(simulator.draw(), img)
+    renderer, simulator.renderer = simulator.renderer, None
+    full = simulator.draw()
+    simulator.renderer = renderer
+    assert np.array_equal(simulator.draw(), full)
+
+
+def test_overlay_boxes_cover_the_table():
+    profiler = Profiler()
+    profiler.add('update', 0.0, 0.001)
+    profiler.frame()
+    img = np.zeros((200, 300, 3), dtype=np.uint8)
+    boxes = profiler.draw_overlay(img, color=(255, 255, 255))
+    assert len(boxes) == 2
+    covered = np.zeros(img.shape[:2], dtype=bool)
+    for x1, y1, x2, y2 in boxes:
+        covered[max(y1, 0):y2, max(x1, 0):x2] = True
+    assert img.any(axis=2)[~covered].sum() == 0
+    assert NULL_PROFILER.draw_overlay(img) == []
@@ -0,0 +1,113 @@
+"""Renderers: batched and incremental frames against drawing everything from scratch."""
+import random
+
+import cv2
+import numpy as np
+
+from render import DirtyRectRenderer, SpriteBatch
+
+
+class Sprite:
+    def __init__(self, sprite_id, x, y, color):
+        self.id = sprite_id
+        self.x = x
+        self.y = y
+        self.color = color
+
+
+def draw_sprite(img, sprite):
+    cv2.circle(img, (int(sprite.x), int(sprite.y)), 8, sprite.color, -1, cv2.LINE_AA)
+    cv2.putText(img, str(sprite.id), (int(sprite.x) + 9, int(sprite.y)), cv2.FONT_HERSHEY_SIMPLEX, 0.3,
+                (255, 255, 255), 1)
+
+
+def sprite_bounds(sprite):
+    return (sprite.x - 10, sprite.y - 10, sprite.x + 30, sprite.y + 10)
+
+
+def sprite_key(sprite):
+    return (int(sprite.x), int(sprite.y), sprite.color)
+
+
+def full_redraw(background, sprites):
+    img = background.copy()
+    for sprite in sprites:
+        draw_sprite(img, sprite)
+    return img
+
+
+def test_dirty_rects_match_a_full_redraw():
+    rng = random.Random(2)
+    background = np.zeros((240, 320, 3), dtype=np.uint8)
+    background[:, ::16] = (60, 60, 60)
+    sprites = [Sprite(i, rng.uniform(0, 320), rng.uniform(0, 240), (rng.randrange(256), 80, 200))
+               for i in range(60)]
+    renderer = DirtyRectRenderer(draw_sprite, sprite_bounds, sprite_key, item_id=lambda sprite: sprite.id)
+    next_id = len(sprites)
+    for frame in range(40):
+        # A few sprites move, some go, some come; most stay put
+        for sprite in rng.sample(sprites, 8):
+            sprite.x = min(max(sprite.x + rng.uniform(-6, 6), 0), 320)
+            sprite.y = min(max(sprite.y + rng.uniform(-6, 6), 0), 240)
+        if frame % 5 == 1:
+            sprites.remove(rng.choice(sprites))
+        if frame % 7 == 3:
+            sprites.append(Sprite(next_id, rng.uniform(0, 320), rng.uniform(0, 240), (0, 255, 0)))
+            next_id += 1
+        img = renderer.render(background, sprites)
+        assert np.array_equal(img, full_redraw(background, sprites))
+        if frame > 0:
+            assert renderer.last_redrawn < len(sprites)
+
+
+def test_new_background_repaints_everything():
+    sprites = [Sprite(0, 50, 50, (0, 0, 255))]
+    renderer = DirtyRectRenderer(draw_sprite, sprite_bounds, sprite_key)
+    renderer.render(np.zeros((100, 100, 3), dtype=np.uint8), sprites)
+    background = np.full((100, 100, 3), 90, dtype=np.uint8)
+    assert np.array_equal(renderer.render(background, sprites), full_redraw(background, sprites))
+    assert renderer.last_redrawn == 1
+
+
+def draw_one_by_one(img, x, y, direction, colors, labels, label_color):
+    """What SpriteBatch does, one sprite at a time with plain OpenCV calls"""
+    for sx, sy, angle, color, text in zip(x, y, direction, colors, labels):
+        center = (int(sx), int(sy))
+        cv2.circle(img, center, 10, color, -1)
+        cv2.circle(img, center, 10, (0, 0, 0), 1)
+        end = (int(sx + 15 * np.cos(angle)), int(sy + 15 * np.sin(angle)))
+        cv2.line(img, center, end, (0, 0, 0), 2)
+        if text:
+            cv2.putText(img, text, (center[0] + 15, center[1] + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.4, label_color, 1)
+    return img
+
+
+def test_sprite_batch_matches_drawing_one_by_one():
+    # Far enough apart not to overlap, so layer order does not matter; some labels run off the edge
+    x = [30.5, 150.2, 270.9, 40.0, 160.0, 300.0]
+    y = [40.1, 45.7, 50.0, 170.3, 175.0, 230.0]
+    direction = [0.0, 1.2, -2.5, 3.1, 0.7, -1.0]
+    colors = [(0, 0, 255), (0, 255, 0), (255, 0, 0), (10, 200, 30), (90, 90, 90), (200, 200, 0)]
+    labels = ['Mage_1: IDLE', 'Mage_2: WORK', 'Guard_10: SLEEPING', 'Mage_1: IDLE', 'Bob', 'Edge_case']
+    background = np.full((240, 320, 3), 128, dtype=np.uint8)
+    img = SpriteBatch().draw(background.copy(), x, y, direction, colors)
+    assert np.array_equal(img, draw_one_by_one(background.copy(), x, y, direction, colors, [''] * 6, None))
+
+    for label_color in ((0, 0, 0), (255, 255, 255)):
+        batch = SpriteBatch(label_color=label_color)
+        img = batch.draw(background.copy(), x, y, direction, colors, labels)
+        expected = draw_one_by_one(background.copy(), x, y, direction, colors, labels, label_color)
+        assert len(batch.labels) == 5  # the repeated label is rendered once
+        # Where a font is anti-aliased (OpenCV 5), min/max stamping blends the fringe more
+        # faintly than putText: only the label boxes may differ, and there the stamped ink
+        # is a subset of putText's (exactly the same with aliased fonts)
+        outside = np.ones(img.shape[:2], dtype=bool)
+        for cx, cy, text in zip(x, y, labels):
+            bitmap, above = batch.label(text)
+            top, left = int(cy) + 5 - above, int(cx) + 15
+            outside[max(top, 0):top + bitmap.shape[0], left:left + bitmap.shape[1]] = False
+        assert np.array_equal(img[outside], expected[outside])
+        inked = np.abs(img.astype(int) - label_color).max(axis=2) < 40
+        expected_inked = np.abs(expected.astype(int) - label_color).max(axis=2) < 40
+        assert not (inked & ~expected_inked).any()
+        assert inked.sum() >= 0.6 * expected_inked.sum()
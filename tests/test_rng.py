@@ -0,0 +1,74 @@
+"""Seeded random streams: same seed, same draws, same world."""
+import numpy as np
+import pytest
+
+from conftest import WORLDS, close_world, make_world
+from rng import RandomStreams
+
+
+def test_stream_is_deterministic():
+    a = RandomStreams(42).stream(7)
+    b = RandomStreams(42).stream(7)
+    draws = [a.random() for _ in range(100)]
+    assert draws == [b.random() for _ in range(100)]
+    assert draws != [RandomStreams(43).stream(7).random() for _ in range(100)]
+    assert draws != [RandomStreams(42).stream(8).random() for _ in range(100)]
+    assert all(0 <= x < 1 for x in draws)
+
+
+def test_stream_matches_array_draws():
+    streams = RandomStreams(5)
+    stream = streams.stream(3, counter=10)
+    assert [stream.bits() for _ in range(5)] == streams.bits(3, np.arange(10, 15)).tolist()
+    # Scalar counter (one mix for all streams) and array counter give the same bits
+    ids = np.arange(20)
+    assert np.array_equal(streams.bits(ids, 9, draw=2), streams.bits(ids, np.full(20, 9), np.full(20, 2)))
+    stream.counter = 10
+    assert stream.random() == streams.random(3, 10)
+
+
+def test_stream_resumes_from_counter():
+    streams = RandomStreams(1)
+    stream = streams.stream(2)
+    [stream.random() for _ in range(17)]
+    saved = stream.counter
+    expected = [stream.randint(0, 9) for _ in range(20)]
+    resumed = streams.stream(2, saved)
+    assert [resumed.randint(0, 9) for _ in range(20)] == expected
+    assert streams.stream(2, saved).integers(0, 10, 20).tolist() == expected
+
+
+def test_ranges():
+    streams = RandomStreams(9)
+    stream = streams.stream(1)
+    values = [stream.randint(3, 5) for _ in range(2000)]
+    assert set(values) == {3, 4, 5}
+    assert stream.choice('ab') in 'ab'
+    assert all(-2 <= stream.uniform(-2, 2) < 2 for _ in range(100))
+    assert set(streams.integers(3, 6, np.arange(2000), 0).tolist()) == {3, 4, 5}
+
+
+def test_lanes_are_independent():
+    streams = RandomStreams(8)
+    ids = np.arange(1000)
+    lanes = [streams.random(ids, 4, draw) for draw in range(3)]
+    # Lane 1 of tick 4 is no other lane's tick, nor a neighbouring stream's draw
+    assert not np.isin(lanes[1], lanes[0]).any() and not np.isin(lanes[1], lanes[2]).any()
+    assert not np.isin(lanes[0], streams.random(ids, 5)).any()
+    assert abs(np.corrcoef(lanes[0][:-1], lanes[0][1:])[0, 1]) < 0.1
+
+
+def run_world(script, name, seed, ticks=30):
+    world = make_world(script, name, seed)
+    for _ in range(ticks):
+        world.update()
+    state = [(npc.id, npc.name, npc.x, npc.y, npc.direction, getattr(npc, 'state', None)) for npc in world.npcs]
+    close_world(world)
+    return state
+
+
+@pytest.mark.parametrize('script, name', WORLDS)
+def test_same_seed_same_world(script, name):
+    first = run_world(script, name, seed=12)
+    assert run_world(script, name, seed=12) == first
+    assert run_world(script, name, seed=13) != first
@@ -0,0 +1,104 @@
+"""AIScheduler: who thinks when, with which elapsed ticks, within the budget."""
+import itertools
+
+import pytest
+
+from scheduler import AIScheduler
+from spatial import SpatialGrid
+
+
+class Thing:
+    def __init__(self, npc_id, x=0.0, y=0.0):
+        self.id = npc_id
+        self.x = x
+        self.y = y
+
+
+FAR = Thing(-1, 1e9, 1e9)  # a player no NPC is near
+
+
+def run_ticks(scheduler, npcs, ticks, player=FAR, grid=None):
+    """{npc id: [(tick, elapsed), ...]} over `ticks` ticks"""
+    calls = {}
+    for tick in ticks:
+        scheduler.run(npcs, tick, player, lambda npc, elapsed: calls.setdefault(npc.id, []).append((tick, elapsed)),
+                      grid)
+    return calls
+
+
+class FakeClock:
+    """Every reading is `step` seconds after the previous one"""
+    def __init__(self, step=0.001):
+        self.now = itertools.count(step=step)
+
+    def __call__(self):
+        return next(self.now)
+
+
+def test_without_slicing_everyone_thinks_every_tick():
+    npcs = [Thing(i) for i in range(10)]
+    calls = run_ticks(AIScheduler(), npcs, range(5))
+    assert calls == {i: [(tick, 1) for tick in range(5)] for i in range(10)}
+
+
+def test_round_robin_elapsed():
+    npcs = [Thing(i) for i in range(12)]
+    calls = run_ticks(AIScheduler(4), npcs, range(10, 22))
+    for npc in npcs:
+        first = next(tick for tick in range(10, 14) if tick % 4 == npc.id % 4)
+        # The first decision counts from the tick before the scheduler first ran, later ones a whole round
+        assert calls[npc.id] == [(first, first - 9), (first + 4, 4), (first + 8, 4)]
+
+
+def test_npcs_near_the_player_think_every_tick():
+    npcs = [Thing(i, x=i * 10.0) for i in range(20)]
+    grid = SpatialGrid(25)
+    grid.rebuild(npcs)
+    player = Thing(-1, 0.0, 0.0)
+    for grid_or_none in (grid, None):
+        calls = run_ticks(AIScheduler(5, near_radius=35), npcs, range(10), player, grid_or_none)
+        for i in range(4):
+            assert [tick for tick, _ in calls[i]] == list(range(10))
+        assert len(calls[10]) == 2
+
+
+def test_budget_defers_to_the_backlog_without_starving():
+    npcs = [Thing(i) for i in range(40)]
+    scheduler = AIScheduler(2, budget_ms=5, clock=FakeClock())
+    calls = run_ticks(scheduler, npcs, range(40))
+    assert 1 <= scheduler.thought <= 5
+    # 20 due per tick, ~5 decisions per tick: every NPC still gets its turns, in order
+    assert set(calls) == set(range(40))
+    waits = [later - earlier for history in calls.values() for (earlier, _), (later, _) in zip(history, history[1:])]
+    assert max(waits) <= 2 * len(npcs) // 5
+    # elapsed counts the time spent in the backlog
+    for history in calls.values():
+        for (earlier, _), (later, elapsed) in zip(history, history[1:]):
+            assert elapsed == later - earlier
+
+
+@pytest.mark.parametrize('budget_ms', [0, 0.0001])
+def test_budget_below_one_decision_still_thinks_once(budget_ms):
+    npcs = [Thing(i) for i in range(6)]
+    scheduler = AIScheduler(1, budget_ms=budget_ms, clock=FakeClock())
+    calls = run_ticks(scheduler, npcs, range(12))
+    assert scheduler.thought == 1
+    assert [len(calls[i]) for i in range(6)] == [2] * 6
+
+
+def test_forget_and_reset():
+    npcs = [Thing(i) for i in range(10)]
+    scheduler = AIScheduler(1, budget_ms=2, clock=FakeClock())
+    scheduler.run(npcs, 0, FAR, lambda npc, elapsed: None)
+    assert scheduler.backlog
+    gone = scheduler.backlog[0]
+    scheduler.forget(gone)
+    assert gone not in scheduler.backlog and gone.id not in scheduler.last
+    scheduler.reset()
+    assert scheduler.backlog == [] and scheduler.last == {}
+    assert run_ticks(scheduler, npcs[:1], [7])[0] == [(7, 1)]
+
+
+def test_slices_must_be_positive():
+    with pytest.raises(ValueError):
+        AIScheduler(0)
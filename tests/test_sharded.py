@@ -0,0 +1,71 @@
+"""Sharded simulation: the neighbour kernels and the shards give exactly the single-process result."""
+import numpy as np
+import pytest
+
+from sandybrown import VectorizedNPCSimulator
+from sharded import ShardedSimulation
+from spatial import pairs_within, separation_many
+
+
+def scatter(count, seed, size=300.0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-size, size, count), rng.uniform(-size, size, count)
+
+
+def brute_pairs(x, y, radius, count):
+    dx = x[:count, None] - x[None, :]
+    dy = y[:count, None] - y[None, :]
+    close = dx*dx + dy*dy < radius * radius
+    close[np.arange(count), np.arange(count)] = False
+    return set(zip(*np.nonzero(close)))
+
+
+@pytest.mark.parametrize('radius', [1.0, 15.0, 120.0])
+def test_pairs_within_matches_brute_force(radius):
+    x, y = scatter(600, seed=1)
+    x[:5] = x[5]  # points on top of each other
+    y[:5] = y[5]
+    for count in (None, 250, 0):
+        i, j = pairs_within(x, y, radius, count)
+        expected = brute_pairs(x, y, radius, len(x) if count is None else count)
+        assert len(i) == len(expected)
+        assert set(zip(i.tolist(), j.tolist())) == expected
+
+
+def test_separation_many_matches_brute_force():
+    x, y = scatter(400, seed=2, size=150.0)
+    ids = np.random.default_rng(3).permutation(400)
+    push_x, push_y = separation_many(x, y, ids, 20.0)
+    expected_x = np.zeros(400)
+    expected_y = np.zeros(400)
+    for i, j in brute_pairs(x, y, 20.0, 400):
+        dx, dy = x[i] - x[j], y[i] - y[j]
+        dist = np.hypot(dx, dy)
+        expected_x[i] += dx / dist * (20.0 - dist) / 2
+        expected_y[i] += dy / dist * (20.0 - dist) / 2
+    assert np.allclose(push_x, expected_x) and np.allclose(push_y, expected_y)
+    # A point's push does not depend on which other points share the arrays
+    part_x, part_y = separation_many(x[::-1].copy(), y[::-1].copy(), ids[::-1].copy(), 20.0)
+    assert np.array_equal(part_x[::-1], push_x) and np.array_equal(part_y[::-1], push_y)
+
+
+def make_simulator(min_dist):
+    simulator = VectorizedNPCSimulator(1200, 900, seed=4, min_dist=min_dist)
+    simulator.create_npc_set(3000)
+    return simulator
+
+
+@pytest.mark.parametrize('min_dist', [None, 12])
+def test_sharded_run_is_bit_identical(min_dist):
+    reference = make_simulator(min_dist)
+    for _ in range(15):
+        reference.update()
+    for workers in (1, 3):
+        simulator = make_simulator(min_dist)
+        with ShardedSimulation.from_simulator(simulator, workers=workers) as sharded:
+            sharded.run(5)
+            sharded.run(10)
+            sharded.store(simulator)
+        assert simulator.ticks == reference.ticks
+        for column in ('ids', 'x', 'y', 'direction', 'speed'):
+            assert np.array_equal(getattr(simulator.population, column), getattr(reference.population, column))
@@ -0,0 +1,82 @@
+"""SpatialGrid queries against a brute-force scan."""
+import random
+
+import pytest
+
+from spatial import SpatialGrid, separation
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def scatter(count, seed, size=500):
+    rng = random.Random(seed)
+    return [Point(rng.uniform(-size, size), rng.uniform(-size, size)) for _ in range(count)]
+
+
+def dist_sq(a, x, y):
+    return (a.x - x) ** 2 + (a.y - y) ** 2
+
+
+@pytest.mark.parametrize('cell_size', [7, 40, 1000])
+def test_query_radius_matches_brute_force(cell_size):
+    points = scatter(400, seed=1)
+    grid = SpatialGrid(cell_size)
+    grid.rebuild(points)
+    for query in scatter(30, seed=2):
+        for radius in (0, 25, 120):
+            expected = {id(p) for p in points if dist_sq(p, query.x, query.y) <= radius * radius}
+            assert {id(p) for p in grid.query_radius(query.x, query.y, radius)} == expected
+
+
+@pytest.mark.parametrize('cell_size', [7, 40, 1000])
+def test_k_nearest_matches_brute_force(cell_size):
+    points = scatter(400, seed=3)
+    grid = SpatialGrid(cell_size)
+    grid.rebuild(points)
+    for query in points[:30]:
+        for k in (1, 5, 50):
+            expected = sorted(dist_sq(p, query.x, query.y) for p in points if p is not query)[:k]
+            found = grid.k_nearest(query.x, query.y, k, exclude=query)
+            assert query not in found
+            assert [dist_sq(p, query.x, query.y) for p in found] == expected
+
+
+def test_k_nearest_max_radius():
+    points = scatter(300, seed=4)
+    grid = SpatialGrid(40)
+    grid.rebuild(points)
+    for query in scatter(30, seed=5):
+        expected = sorted(d for d in (dist_sq(p, query.x, query.y) for p in points) if d <= 60 * 60)[:3]
+        found = grid.k_nearest(query.x, query.y, 3, max_radius=60)
+        assert [dist_sq(p, query.x, query.y) for p in found] == expected
+
+
+def test_update_after_moves_matches_rebuild():
+    points = scatter(200, seed=6)
+    grid = SpatialGrid(40)
+    grid.update(points)
+    rng = random.Random(7)
+    for point in points:
+        point.x += rng.uniform(-100, 100)
+        point.y += rng.uniform(-100, 100)
+    grid.remove(points.pop())
+    grid.update(points)
+    fresh = SpatialGrid(40)
+    fresh.rebuild(points)
+    assert len(grid) == len(points)
+    assert {cell: {id(p) for p in bucket} for cell, bucket in grid.cells.items()} == \
+           {cell: {id(p) for p in bucket} for cell, bucket in fresh.cells.items()}
+
+
+def test_separation_pushes_overlapping_points_apart():
+    item = Point(0.0, 0.0)
+    assert separation(item, [Point(50.0, 0.0)], 40) == (0.0, 0.0)
+    push_x, push_y = separation(item, [Point(10.0, 0.0)], 40)
+    assert (push_x, push_y) == (-15.0, 0.0)
+    # On top of each other: pushed along an arbitrary axis, not by NaN
+    push_x, push_y = separation(item, [Point(0.0, 0.0)], 40)
+    assert push_x != 0 and push_y == 0
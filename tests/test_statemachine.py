@@ -0,0 +1,89 @@
+"""Batched state machine, nearest_within and the vectorized GameWorlds built on them."""
+import numpy as np
+import pytest
+
+from conftest import close_world, make_world
+from rng import RandomStreams
+from spatial import nearest_within
+from statemachine import StateMachine, transition_matrix
+
+STATES = ['idle', 'walk', 'work']
+
+
+def test_transition_matrix():
+    matrix = transition_matrix({'idle': {'walk': 1, 'work': 3}, 'walk': {'idle': 2}}, STATES)
+    assert np.allclose(matrix, [[0, 0.25, 0.75], [1, 0, 0], [0, 0, 1]])  # 'work' has no row: it stays
+    assert np.allclose(transition_matrix(np.ones((3, 3)), STATES), 1 / 3)
+    with pytest.raises(ValueError):
+        transition_matrix(np.ones((2, 2)), STATES)
+    with pytest.raises(ValueError):
+        transition_matrix([[1, -1, 1], [1, 1, 1], [1, 1, 1]], STATES)
+
+
+def test_step_follows_the_table_and_durations():
+    machine = StateMachine(STATES, {'idle': {'walk': 1}, 'walk': {'work': 1, 'idle': 1}}, durations=(5, 9))
+    streams = RandomStreams(2)
+    ids = np.arange(1000)
+    state = np.zeros(1000, dtype=np.uint8)
+    timer = np.tile(np.arange(1, 5), 250)
+    expired = machine.step(state, timer, ids, streams, tick=0)
+    assert expired.tolist() == list(range(0, 1000, 4))
+    assert (state[expired] == 1).all() and (np.delete(state, expired) == 0).all()
+    assert ((timer[expired] >= 5) & (timer[expired] <= 9)).all()
+    assert set(timer[expired].tolist()) == set(range(5, 10))
+    timer[:] = 0
+    machine.step(state, timer, ids, streams, tick=1)
+    assert set(state[expired].tolist()) == {0, 2}  # walking NPCs go idle or to work
+
+
+def test_step_does_not_depend_on_row_order():
+    machine = StateMachine(STATES)
+    streams = RandomStreams(8)
+    ids = np.arange(500)
+    state = (ids % 3).astype(np.uint8)
+    timer = np.ones(500, dtype=np.int64)
+    order = np.random.default_rng(1).permutation(500)
+    shuffled_state, shuffled_timer = state[order].copy(), timer[order].copy()
+    machine.step(state, timer, ids, streams, tick=4)
+    machine.step(shuffled_state, shuffled_timer, ids[order], streams, tick=4)
+    assert np.array_equal(shuffled_state, state[order]) and np.array_equal(shuffled_timer, timer[order])
+
+
+def test_groups_partition_rows_by_state():
+    machine = StateMachine(STATES)
+    state = np.array([2, 0, 2, 2, 0], dtype=np.uint8)
+    assert [(code, rows.tolist()) for code, rows in machine.groups(state)] == [(0, [1, 4]), (2, [0, 2, 3])]
+
+
+def test_nearest_within_matches_brute_force():
+    rng = np.random.default_rng(5)
+    x = rng.integers(0, 200, 500).astype(np.float64)  # integer grid: plenty of ties
+    y = rng.integers(0, 200, 500).astype(np.float64)
+    rows = rng.choice(500, 120, replace=False)
+    nearest = nearest_within(x, y, 15.0, rows)
+    for row, found in zip(rows, nearest):
+        dist_sq = (x - x[row]) ** 2 + (y - y[row]) ** 2
+        dist_sq[row] = np.inf
+        close = np.flatnonzero(dist_sq < 15.0 ** 2)
+        if len(close) == 0:
+            assert found == -1
+        else:
+            assert found == close[dist_sq[close] == dist_sq[close].min()].min()
+    assert len(nearest_within(x, y, 15.0, rows[:0])) == 0
+
+
+@pytest.mark.parametrize('script', ['003-personaje principal.py', '004-areas.py'])
+def test_vectorized_world_spawns_like_the_object_world(script):
+    worlds = [make_world(script, name, seed=7, npcs=200) for name in ('GameWorld', 'VectorizedGameWorld')]
+    (objects, object_names), (vectorized, vectorized_names) = (world.checkpoint_records() for world in worlds)
+    assert vectorized_names == object_names
+    # Everything NPC.__init__ draws; only the vectorized world's stream counters stay at 0
+    for field in objects.dtype.names:
+        if field != 'rng_counter':
+            assert np.array_equal(vectorized[field], objects[field], equal_nan=field.startswith('target_')), field
+    for _ in range(50):
+        worlds[1].update()
+    assert all(0 <= npc.x <= 800 and 0 <= npc.y <= 600 for npc in worlds[1].npcs)
+    assert len({npc.state for npc in worlds[1].npcs}) > 1
+    for world in worlds:
+        close_world(world)
@@ -0,0 +1,171 @@
+"""Storage backends, the background PersistenceWorker and ChangeTracker."""
+import threading
+import time
+
+import pytest
+
+from scripts import load_script
+from storage import (ChangeTracker, MemoryStorage, PersistenceWorker, SQLiteStorage, SQLStorage, Storage, Table,
+                     open_storage)
+
+TABLE = Table('npc', (
+    ('id', 'INT'),
+    ('x', 'FLOAT NOT NULL'),
+    ('name', 'VARCHAR(255) NOT NULL'),
+))
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 'memory':
+        backend = MemoryStorage(TABLE, batch_size=3)
+    else:
+        backend = SQLiteStorage(TABLE, str(tmp_path / 'npcs.db'), batch_size=3)
+    yield backend
+    backend.close()
+
+
+def test_write_upserts_and_deletes(storage):
+    assert storage.write([(1, 1.5, 'a'), (2, 2.5, 'b'), (3, 3.5, 'c')]) == 3
+    storage.write([(2, 20.5, 'B')], deleted=[3])
+    assert sorted(storage.load()) == [(1, 1.5, 'a'), (2, 20.5, 'B')]
+
+
+def test_replace_and_clear(storage):
+    storage.write([(1, 1.0, 'a'), (2, 2.0, 'b')])
+    storage.replace([(5, 5.0, 'e')])
+    assert storage.load() == [(5, 5.0, 'e')]
+    storage.clear()
+    assert storage.load() == []
+
+
+def test_load_chunks(storage):
+    rows = [(i, float(i), f'npc{i}') for i in range(10)]
+    storage.write(rows)
+    chunks = list(storage.load_chunks())
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    assert sorted(row for chunk in chunks for row in chunk) == rows
+    assert [len(chunk) for chunk in storage.load_chunks(4)] == [4, 4, 2]
+
+
+def test_sqlite_rows_survive_reopening(tmp_path):
+    path = str(tmp_path / 'npcs.db')
+    first = SQLiteStorage(TABLE, path)
+    first.write([(1, 1.5, 'a')])
+    first.close()
+    second = SQLiteStorage(TABLE, path)
+    assert second.load() == [(1, 1.5, 'a')]
+    second.close()
+
+
+def test_incomplete_backends_fail_when_created():
+    class NoReplace(Storage):
+        def load_chunks(self, chunk_size=None):
+            yield []
+
+        def write(self, rows=(), deleted=()):
+            return 0
+
+    class NoUpsert(SQLStorage):
+        pass
+
+    with pytest.raises(TypeError, match='replace'):
+        NoReplace(TABLE)
+    with pytest.raises(TypeError, match='upsert_clause'):
+        NoUpsert(TABLE)
+
+
+def test_open_storage_specs(tmp_path):
+    assert isinstance(open_storage(TABLE, 'memory'), MemoryStorage)
+    sqlite = open_storage(TABLE, f"sqlite:{tmp_path / 'npcs.db'}")
+    assert isinstance(sqlite, SQLiteStorage) and sqlite.path == str(tmp_path / 'npcs.db')
+    sqlite.close()
+    with pytest.raises(ValueError):
+        open_storage(TABLE, 'postgres')
+
+
+class SlowStorage(MemoryStorage):
+    """Holds every write until `release` is set, and records the change sets"""
+    def __init__(self, table):
+        super().__init__(table)
+        self.release = threading.Event()
+        self.writes = []
+
+    def write(self, rows=(), deleted=()):
+        self.release.wait()
+        self.writes.append((list(rows), list(deleted)))
+        return super().write(rows, deleted)
+
+
+def test_persistence_worker_coalesces_while_busy():
+    storage = SlowStorage(TABLE)
+    worker = PersistenceWorker(storage)
+    worker.submit([(1, 1.0, 'a')])
+    while not worker.busy:
+        time.sleep(0.001)
+    # Written while the first set is in flight: only the newest row per key survives
+    worker.submit([(2, 2.0, 'b'), (3, 3.0, 'c')])
+    worker.submit([(2, 20.0, 'B')], deleted=[3])
+    storage.release.set()
+    assert worker.flush(timeout=5)
+    assert storage.writes[1] == ([(2, 20.0, 'B')], [3])
+    assert worker.coalesced == 2
+    worker.close()
+    assert sorted(storage.rows.values()) == [(1, 1.0, 'a'), (2, 20.0, 'B')]
+
+
+def test_change_tracker_reports_only_changes():
+    tracker = ChangeTracker()
+    rows = [(1, 1.0, 'a'), (2, 2.0, 'b')]
+    assert tracker.changes(rows) == (rows, [])
+    assert tracker.changes(rows) == ([], [])
+    assert tracker.changes([(2, 2.5, 'b'), (3, 3.0, 'c')]) == ([(2, 2.5, 'b'), (3, 3.0, 'c')], [1])
+    tracker.mark_saved([(4, 4.0, 'd')])
+    assert tracker.changes([(2, 2.5, 'b'), (3, 3.0, 'c'), (4, 4.0, 'd')]) == ([], [])
+
+
+def test_second_save_writes_nothing(tmp_path):
+    path = tmp_path / 'npcs.db'
+    module = load_script('003-personaje principal.py')
+    world = module.GameWorld(headless=True, storage=f'sqlite:{path}', seed=1)
+    world.create_initial_npcs(20)  # saves them
+    assert world.save_npcs_to_db() == 0
+    world.update()
+    assert world.save_npcs_to_db() > 0
+    assert world.save_npcs_to_db() == 0
+    world.persistence.flush()
+    written = world.persistence.rows_written
+    assert world.save_npcs_to_db() == 0
+    world.persistence.flush()
+    assert world.persistence.rows_written == written
+
+    rows = sorted(world.npc_rows())
+    world.close_database()
+    stored = SQLiteStorage(module.NPC_TABLE, str(path))
+    assert sorted(stored.load()) == rows
+    stored.close()
+
+
+@pytest.mark.parametrize('script, vectorized', [
+    ('003-personaje principal.py', False),
+    ('003-personaje principal.py', True),
+    ('004-areas.py', False),
+    ('004-areas.py', True),
+])
+def test_chunked_load_restores_saved_rows(tmp_path, script, vectorized):
+    path = tmp_path / 'npcs.db'
+    module = load_script(script)
+    cls = module.VectorizedGameWorld if vectorized else module.GameWorld
+    world = cls(headless=True, storage=f'sqlite:{path}', seed=1)
+    world.create_initial_npcs(2500)  # more than one load chunk (batch_size rows)
+    world.update()
+    world.save_npcs_to_db()
+    rows = sorted(world.npc_rows())
+    world.close_database()
+
+    reloaded = cls(headless=True, storage=f'sqlite:{path}', seed=1)
+    assert reloaded.storage.batch_size < len(rows)
+    assert sorted(reloaded.npc_rows()) == rows
+    assert reloaded.save_npcs_to_db() == 0  # loaded rows count as saved
+    assert reloaded.next_npc_id > max(row[0] for row in rows)
+    reloaded.close_database()
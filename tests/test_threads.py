@@ -0,0 +1,43 @@
+"""Thread-pool movement gives exactly the single-threaded result."""
+import numpy as np
+import pytest
+
+from sandybrown import VectorizedNPCSimulator
+
+
+def run(ticks=10, **options):
+    simulator = VectorizedNPCSimulator(2000, 1500, seed=6, **options)
+    simulator.create_npc_set(5000)
+    for _ in range(ticks):
+        simulator.update()
+    simulator.close()
+    return simulator
+
+
+@pytest.mark.parametrize('threads, chunk_size', [(1, 1000), (3, 1000), (4, 777)])
+def test_threaded_update_is_bit_identical(threads, chunk_size):
+    reference = run()
+    threaded = run(threads=threads, chunk_size=chunk_size)
+    for column in ('x', 'y', 'direction', 'speed'):
+        assert np.array_equal(getattr(threaded.population, column), getattr(reference.population, column))
+
+
+def test_close_stops_the_pool_and_falls_back_to_one_thread():
+    simulator = VectorizedNPCSimulator(800, 600, seed=1, threads=2, chunk_size=100)
+    simulator.create_npc_set(500)
+    simulator.update()
+    executor = simulator.executor
+    simulator.close()
+    assert simulator.executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(int)
+    simulator.update()
+    simulator.close()  # twice is fine
+
+
+def test_spare_capacity_is_left_alone():
+    # 5000 rows in 8192 of capacity; the last chunk must stop at row 5000
+    simulator = run(ticks=20, threads=4, chunk_size=777)
+    p = simulator.population
+    for column in (p.x, p.y, p.direction, p.speed):
+        assert not column[p.size:].any()
@@ -0,0 +1,58 @@
+"""Fixed-timestep accumulator and interpolated drawing of the 003 world."""
+import pytest
+
+from scripts import load_script
+
+module = load_script('003-personaje principal.py')
+DT = module.SIM_DT
+
+
+@pytest.fixture(params=['GameWorld', 'VectorizedGameWorld'])
+def world(request):
+    world = getattr(module, request.param)(headless=True, storage='memory', seed=4)
+    world.create_initial_npcs(20)
+    yield world
+    world.close_database()
+
+
+def test_ticks_follow_elapsed_time(world):
+    start = world.ticks
+    alpha = world.advance(3.5 * DT)
+    assert world.ticks - start == 3
+    assert alpha == pytest.approx(0.5)
+    # Short frames add up until a whole tick is due
+    assert world.advance(0.3 * DT) == pytest.approx(0.8)
+    assert world.ticks - start == 3
+    assert world.advance(0.3 * DT) == pytest.approx(0.1)
+    assert world.ticks - start == 4
+
+
+def test_catch_up_is_clamped(world):
+    start = world.ticks
+    assert world.advance(100 * DT) == pytest.approx(1.0)
+    assert world.ticks - start == module.MAX_TICKS_PER_FRAME
+    # The backlog is gone: one tick is left, not 95
+    assert world.accumulator == pytest.approx(DT)
+    world.advance(0.0)
+    assert world.ticks - start == module.MAX_TICKS_PER_FRAME + 1
+    assert world.accumulator == pytest.approx(0.0)
+
+
+def test_without_interpolation_alpha_is_one(world):
+    world.interpolate = False
+    assert world.advance(1.5 * DT) == 1.0
+    assert world.accumulator == pytest.approx(0.5 * DT)
+
+
+def test_interpolated_positions_lie_between_ticks(world):
+    world.player_input = (1, 0)
+    alpha = world.advance(2.25 * DT)
+    assert alpha == pytest.approx(0.25)
+    player = world.player
+    assert player.x > player.prev_x
+    assert player.interpolated(alpha) == pytest.approx((player.prev_x + 0.25 * (player.x - player.prev_x), player.y))
+    for npc in world.npcs:
+        x, y = npc.interpolated(alpha)
+        assert min(npc.prev_x, npc.x) <= x <= max(npc.prev_x, npc.x)
+        assert min(npc.prev_y, npc.y) <= y <= max(npc.prev_y, npc.y)
+    assert world.render(alpha).shape == (world.height, world.width, 3)